@@ -0,0 +1,278 @@
+"""
+Asynchronous model activation.
+
+POST /activate/<model_name> submits an activation job to a bounded pool of loader
+threads and returns its id right away. Concurrent requests for a model that is
+already being activated join the pending job instead of loading the model again.
+Hot reloads of modified models run on the same pool as "reload" jobs.
+Jobs record the duration of each activation phase; in multi-worker mode their
+status is published in the shared state so any worker can report it.
+"""
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+
+from api.model_lifecycle import get_lifecycle_manager
+from api.shared_state import ACTIVATION_JOB_HISTORY, get_shared_state
+
+logger = logging.getLogger(__name__)
+
+ACTIVATION_WORKERS = int(os.getenv("ACTIVATION_WORKERS", "2"))
+ACTIVATION_WAIT_TIMEOUT = float(os.getenv("ACTIVATION_WAIT_TIMEOUT", "600"))
+
+PENDING_STATUSES = ("queued", "running")
+
+
+class ActivationJob:
+    """One activation of one model, shared by every request that asked for it while pending."""
+
+    def __init__(self, model_name: str, options: dict, kind: str = "activate", local_only: bool = False):
+        self.job_id = uuid.uuid4().hex
+        self.model_name = model_name
+        self.options = options
+        self.kind = kind
+        self.local_only = local_only  # activate in this worker only (already in the shared state)
+        self.status = "queued"
+        self.message = None
+        self.requests = 1
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.phases = {}  # phase -> seconds (the running phase is updated when it ends)
+        self._phase = None
+        self._phase_started = None
+        self._done = threading.Event()
+
+    @property
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    def start(self) -> None:
+        self.status = "running"
+        self.started_at = time.time()
+
+    def begin_phase(self, phase: str) -> None:
+        self._end_phase()
+        self._phase = phase
+        self._phase_started = time.perf_counter()
+
+    def _end_phase(self) -> None:
+        if self._phase is not None:
+            self.phases[self._phase] = round(time.perf_counter() - self._phase_started, 3)
+            self._phase = None
+
+    def finish(self, success: bool, message: str) -> None:
+        self._end_phase()
+        self.status = "succeeded" if success else "failed"
+        self.message = message
+        self.finished_at = time.time()
+        self._done.set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until the job finishes. Returns False on timeout."""
+        return self._done.wait(timeout)
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.job_id,
+            "model_name": self.model_name,
+            "kind": self.kind,
+            "local_only": self.local_only,
+            "status": self.status,
+            "phase": self._phase,
+            "message": self.message,
+            "options": self.options,
+            "requests": self.requests,
+            "phases": dict(self.phases),
+            "queued_s": round(self.started_at - self.created_at, 3) if self.started_at else None,
+            "total_s": round(self.finished_at - self.created_at, 3) if self.finished_at else None,
+            "created_at": self.created_at,
+            "worker_pid": os.getpid(),
+        }
+
+
+class ActivationJobManager:
+    """Runs activation jobs on a bounded thread pool, one pending job per model."""
+
+    def __init__(self, lifecycle, shared_state, max_workers: int = ACTIVATION_WORKERS):
+        self.lifecycle = lifecycle
+        self.shared_state = shared_state
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="activation")
+        self._jobs = OrderedDict()  # job_id -> job (recent history)
+        self._pending = {}          # model_name -> pending job
+        self._futures = {}          # job_id -> (job, future) of a job not finished yet
+        self._shutdown = False
+        self._lock = threading.Lock()
+
+    def submit(self, model_name: str, options: Optional[dict] = None,
+               reload: bool = False, local_only: bool = False) -> Tuple[ActivationJob, bool]:
+        """
+        Start activating a model in the background, or join the job already activating it.
+        With reload, hot-reload the active model instead: a reload that has not started
+        yet is joined, one already running is followed by another (the files changed again).
+        With local_only, the model is activated in this worker only (see activate_model).
+        A joined job keeps its own options: see options_ignored().
+        After shutdown(), the job is failed right away.
+        Returns (job, created).
+        """
+        kind = "reload" if reload else "activate"
+        with self._lock:
+            job = self._pending.get(model_name)
+            if job is not None and job.kind == kind and (kind == "activate" or job.status == "queued"):
+                job.requests += 1
+                if options_ignored(job, options):
+                    logger.warning(f"[JOBS] Options for '{model_name}' ignored: joined job {job.job_id}, "
+                                   f"which uses {job.options}")
+                return job, False
+
+            job = ActivationJob(model_name, options or {}, kind, local_only)
+            self._jobs[job.job_id] = job
+            while len(self._jobs) > ACTIVATION_JOB_HISTORY:
+                oldest_id = next(iter(self._jobs))
+                if not self._jobs[oldest_id].done:
+                    break
+                del self._jobs[oldest_id]
+
+            if self._shutdown:
+                job.finish(False, "Server shutting down")
+            else:
+                # Published before it can start, so a stale "queued" never overwrites its progress
+                self._pending[model_name] = job
+                self._publish(job)
+                self._futures[job.job_id] = (job, self._executor.submit(self._run, job))
+
+        if job.done:
+            self._publish(job)
+            logger.info(f"[JOBS] {kind.capitalize()} of '{model_name}' rejected: server shutting down")
+        else:
+            logger.info(f"[JOBS] {kind.capitalize()} of '{model_name}' queued as job {job.job_id}")
+        return job, True
+
+    def _run(self, job: ActivationJob) -> None:
+        job.start()
+        self._publish(job)
+
+        def on_phase(phase):
+            job.begin_phase(phase)
+            self._publish(job)
+
+        try:
+            if job.kind == "reload":
+                success, message, _ = self.lifecycle.reload_model(job.model_name, on_phase=on_phase)
+            else:
+                success, message, _ = self.lifecycle.activate_model(
+                    job.model_name, job.options, local_only=job.local_only, on_phase=on_phase
+                )
+        except Exception as e:
+            success, message = False, f"{job.kind.capitalize()} failed: {e}"
+
+        with self._lock:
+            job.finish(success, message)
+            if self._pending.get(job.model_name) is job:
+                del self._pending[job.model_name]
+            self._futures.pop(job.job_id, None)
+        self._publish(job)
+
+        log = logger.info if success else logger.error
+        log(f"[JOBS] Job {job.job_id} for '{job.model_name}' {job.status}: {message} (phases: {job.phases})")
+
+    def _publish(self, job: ActivationJob) -> None:
+        try:
+            self.shared_state.record_job(job.to_dict())
+        except Exception as e:
+            logger.warning(f"[JOBS] Could not publish job {job.job_id}: {e}")
+
+    def get_job(self, job_id: str) -> Optional[dict]:
+        """Status of a job started by this worker or (in multi-worker mode) by another one."""
+        job = self._jobs.get(job_id)
+        if job is not None:
+            return job.to_dict()
+        return self.shared_state.get_job(job_id)
+
+    def list_jobs(self) -> list:
+        """Recent jobs, newest first."""
+        jobs = {job_id: job.to_dict() for job_id, job in list(self._jobs.items())}
+        for job in self.shared_state.list_jobs():
+            jobs.setdefault(job["job_id"], job)
+        return sorted(jobs.values(), key=lambda job: job["created_at"], reverse=True)
+
+    def _loading_elsewhere(self, model_name: str) -> bool:
+        for job in self.shared_state.list_jobs():
+            # A local activation only makes the model available in its own worker
+            if job.get("local_only"):
+                continue
+            if (job["model_name"] == model_name and job["status"] in PENDING_STATUSES
+                    and job["worker_pid"] != os.getpid() and _pid_alive(job["worker_pid"])):
+                return True
+        return False
+
+    def is_loading(self, model_name: str) -> bool:
+        return model_name in self._pending or self._loading_elsewhere(model_name)
+
+    def wait_for_model(self, model_name: str, timeout: float) -> bool:
+        """
+        Wait up to timeout seconds for a pending activation of the model to finish.
+        Returns False if no activation is pending.
+        """
+        job = self._pending.get(model_name)
+        if job is not None:
+            job.wait(timeout)
+            return True
+
+        # Multi-worker: the activation may be running in another worker
+        deadline = time.monotonic() + timeout
+        if not self._loading_elsewhere(model_name):
+            return False
+        while time.monotonic() < deadline and self._loading_elsewhere(model_name):
+            time.sleep(0.1)
+        return True
+
+    def shutdown(self) -> None:
+        """Stop the pool: running jobs finish, queued and later ones fail (waiters are released)."""
+        with self._lock:
+            self._shutdown = True
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+        with self._lock:
+            cancelled = [job for job, future in self._futures.values() if future.cancelled()]
+            for job in cancelled:
+                job.finish(False, "Server shutting down")
+                del self._futures[job.job_id]
+            for model_name, job in list(self._pending.items()):
+                if job.done:
+                    del self._pending[model_name]
+        for job in cancelled:
+            self._publish(job)
+            logger.info(f"[JOBS] Job {job.job_id} for '{job.model_name}' cancelled: server shutting down")
+
+
+def options_ignored(job: ActivationJob, options: Optional[dict]) -> bool:
+    """Whether a request joining job asked for other options than the job uses."""
+    return (options or {}) != job.options
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+# Global singleton instance
+_job_manager = None
+
+
+def get_activation_job_manager() -> ActivationJobManager:
+    """Get the global activation job manager."""
+    global _job_manager
+    if _job_manager is None:
+        _job_manager = ActivationJobManager(get_lifecycle_manager(), get_shared_state())
+    return _job_manager
@@ -12,6 +12,21 @@ from api.sync_handlers import get_sync_handler
 logger = logging.getLogger(__name__)
 
 
+def _signature(path: str) -> tuple:
+    """Sizes and modification times of a model file, or of every file in a model folder."""
+    paths = [path]
+    if os.path.isdir(path):
+        paths = [os.path.join(root, name) for root, _, files in os.walk(path) for name in files]
+    signature = []
+    for file_path in paths:
+        try:
+            stat = os.stat(file_path)
+        except OSError:  # removed while scanning
+            continue
+        signature.append((os.path.relpath(file_path, path), stat.st_size, stat.st_mtime_ns))
+    return tuple(sorted(signature))
+
+
 class LocalModelWatcher(FileSystemEventHandler):
     """
     Watches a local directory for model changes and syncs with the registry.
@@ -22,6 +37,9 @@ class LocalModelWatcher(FileSystemEventHandler):
         self.models_path = models_path
         self.sync_handler = get_sync_handler()
         self.registered_models = set(os.listdir(models_path)) if os.path.exists(models_path) else set()
+        self.signatures = {
+            filename: _signature(os.path.join(models_path, filename)) for filename in self.registered_models
+        }
     
     def on_any_event(self, event):
         """Handle any filesystem event by resyncing."""
@@ -31,26 +49,29 @@ class LocalModelWatcher(FileSystemEventHandler):
         
         self._resync_models()
     
+    def _metadata(self, model_filename: str) -> dict:
+        return {
+            "source": "local_filesystem",
+            "model_name": os.path.splitext(model_filename)[0],
+            "model_path": os.path.join(self.models_path, model_filename)
+        }
+    
     def _resync_models(self):
         """Compare current filesystem state with registered models and sync."""
         current_models = set(os.listdir(self.models_path))
         previous_models = self.registered_models
+        previous_signatures = self.signatures
+        self.signatures = {
+            filename: _signature(os.path.join(self.models_path, filename)) for filename in current_models
+        }
         
         # Detect added models
         added = current_models - previous_models
         for model_filename in added:
-            model_path = os.path.join(self.models_path, model_filename)
-            model_name = os.path.splitext(model_filename)[0]
+            metadata = self._metadata(model_filename)
             
-            logger.info(f"[WATCHER] Detected new model: {model_name}")
-            
-            metadata = {
-                "source": "local_filesystem",
-                "model_name": model_name,
-                "model_path": model_path
-            }
-            
-            self.sync_handler.handle_model_added(model_name, metadata)
+            logger.info(f"[WATCHER] Detected new model: {metadata['model_name']}")
+            self.sync_handler.handle_model_added(metadata["model_name"], metadata)
         
         # Detect removed models
         removed = previous_models - current_models
@@ -60,6 +81,15 @@ class LocalModelWatcher(FileSystemEventHandler):
             logger.info(f"[WATCHER] Detected removed model: {model_name}")
             self.sync_handler.handle_model_removed(model_name)
         
+        # Detect modified models (files rewritten or added/removed inside a model folder)
+        for model_filename in current_models & previous_models:
+            if self.signatures[model_filename] == previous_signatures.get(model_filename):
+                continue
+            metadata = self._metadata(model_filename)
+            
+            logger.info(f"[WATCHER] Detected modified model: {metadata['model_name']}")
+            self.sync_handler.handle_model_modified(metadata["model_name"], metadata)
+        
         # Update the registered models set
         self.registered_models = current_models
 
@@ -0,0 +1,188 @@
+"""
+Dynamic micro-batching for prediction requests.
+Coalesces concurrent requests for one model into a single batched inference call.
+"""
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_BATCH_SIZE = int(os.getenv("BATCH_MAX_SIZE", "32"))
+DEFAULT_MAX_WAIT_MS = float(os.getenv("BATCH_MAX_WAIT_MS", "5"))
+
+
+class MicroBatcher:
+    """
+    Per-model batching queue.
+    Requests wait until either max_batch_size requests are queued or the oldest
+    request has waited max_wait_ms, then run as one batch on a dedicated thread.
+    """
+
+    def __init__(self, model_name: str,
+                 batch_fn: Callable[[List[Any]], List[Any]],
+                 single_fn: Callable[[Any], Any],
+                 max_batch_size: int = DEFAULT_MAX_BATCH_SIZE,
+                 max_wait_ms: float = DEFAULT_MAX_WAIT_MS):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+        if max_wait_ms < 0:
+            raise ValueError("max_wait_ms must not be negative")
+
+        self.model_name = model_name
+        self.max_batch_size = int(max_batch_size)
+        self.max_wait_ms = float(max_wait_ms)
+        self._batch_fn = batch_fn
+        self._single_fn = single_fn
+
+        self._queue = deque()  # (data, future, enqueued_at)
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._thread = threading.Thread(
+            target=self._run,
+            name=f"batcher-{model_name}",
+            daemon=True
+        )
+
+        # Stats
+        self._requests = 0
+        self._batches = 0
+        self._fallbacks = 0
+        self._largest_batch = 0
+        self._total_queue_wait = 0.0
+        self._total_inference_time = 0.0
+
+    def start(self) -> None:
+        """Start the batching thread."""
+        self._thread.start()
+        logger.info(f"[BATCHER] Started for '{self.model_name}' "
+                    f"(max_batch_size={self.max_batch_size}, max_wait_ms={self.max_wait_ms})")
+
+    def stop(self, timeout: float = 5) -> None:
+        """Stop accepting requests, drain the queue and stop the batching thread."""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+
+        self._thread.join(timeout=timeout)
+
+        # Fail anything the thread did not get to before the timeout
+        with self._cond:
+            while self._queue:
+                _, future, _ = self._queue.popleft()
+                future.set_exception(RuntimeError(f"Model '{self.model_name}' is no longer active"))
+
+        logger.info(f"[BATCHER] Stopped for '{self.model_name}'")
+
+    def submit(self, data: Any) -> Any:
+        """Queue one prediction input and block until its result is available."""
+        future = Future()
+        with self._cond:
+            if self._stopped:
+                raise RuntimeError(f"Model '{self.model_name}' is no longer active")
+            self._queue.append((data, future, time.monotonic()))
+            self._cond.notify()
+
+        return future.result()
+
+    def stats(self) -> dict:
+        """Return batching configuration and counters."""
+        with self._cond:
+            batches = self._batches
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait_ms,
+                "queue_depth": len(self._queue),
+                "requests": self._requests,
+                "batches": batches,
+                "fallbacks": self._fallbacks,
+                "largest_batch": self._largest_batch,
+                "avg_batch_size": round(self._requests / batches, 2) if batches else 0.0,
+                "avg_queue_wait_ms": round(1000 * self._total_queue_wait / self._requests, 3)
+                if self._requests else 0.0,
+                "avg_inference_ms": round(1000 * self._total_inference_time / batches, 3)
+                if batches else 0.0,
+            }
+
+    def _collect(self) -> list:
+        """Wait for the next batch. Returns an empty list once stopped and drained."""
+        with self._cond:
+            while not self._queue and not self._stopped:
+                self._cond.wait()
+
+            if not self._queue:
+                return []
+
+            deadline = self._queue[0][2] + self.max_wait_ms / 1000
+            while len(self._queue) < self.max_batch_size and not self._stopped:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+            size = min(len(self._queue), self.max_batch_size)
+            return [self._queue.popleft() for _ in range(size)]
+
+    def _run(self) -> None:
+        while True:
+            batch = self._collect()
+            if not batch:
+                return
+            self._execute(batch)
+
+    def _execute(self, batch: list) -> None:
+        started = time.monotonic()
+        fallback = False
+
+        try:
+            results = self._batch_fn([data for data, _, _ in batch])
+            if len(results) != len(batch):
+                raise ValueError(f"Expected {len(batch)} results, got {len(results)}")
+        except Exception as e:
+            # Isolate the failing input(s): run each request on its own
+            logger.warning(f"[BATCHER] Batch of {len(batch)} failed for '{self.model_name}', "
+                           f"falling back to single predictions: {e}")
+            fallback = True
+            for data, future, _ in batch:
+                try:
+                    future.set_result(self._single_fn(data))
+                except Exception as err:
+                    future.set_exception(err)
+        else:
+            for (_, future, _), result in zip(batch, results):
+                future.set_result(result)
+
+        finished = time.monotonic()
+        with self._cond:
+            self._requests += len(batch)
+            self._batches += 1
+            self._fallbacks += int(fallback)
+            self._largest_batch = max(self._largest_batch, len(batch))
+            self._total_queue_wait += sum(started - enqueued_at for _, _, enqueued_at in batch)
+            self._total_inference_time += finished - started
+
+
+def create_batcher(model_name: str, config: Any,
+                   batch_fn: Callable[[List[Any]], List[Any]],
+                   single_fn: Callable[[Any], Any]) -> Optional[MicroBatcher]:
+    """
+    Build and start a batcher from a model's 'batching' option.
+    Accepts True (defaults), a dict with max_batch_size/max_wait_ms, or a falsy value (disabled).
+    """
+    if not config:
+        return None
+
+    settings = config if isinstance(config, dict) else {}
+    batcher = MicroBatcher(
+        model_name,
+        batch_fn,
+        single_fn,
+        max_batch_size=int(settings.get("max_batch_size", DEFAULT_MAX_BATCH_SIZE)),
+        max_wait_ms=float(settings.get("max_wait_ms", DEFAULT_MAX_WAIT_MS)),
+    )
+    batcher.start()
+    return batcher
@@ -0,0 +1,192 @@
+"""
+Memory-budgeted cache of active models.
+
+With MODEL_MEMORY_BUDGET_MB set, the footprint of every model is measured when it is
+loaded (growth of this process's resident memory, one load at a time; the RSS growth of
+its worker processes; the size of its memory-mapped file; or the model's memory_mb option).
+TF Serving containers are not counted: eviction does not stop them.
+When the active models exceed the budget, the least recently used ones are
+evicted from this process, except pinned models (PINNED_MODELS or the pinned
+option). Eviction is local: the model stays active in the shared state and in
+the other workers, and this worker does not load it again from the shared state
+until it is explicitly or lazily activated here. With
+LAZY_ACTIVATION, a prediction for an available model that is not active activates
+it, with the options it was last activated with, instead of failing.
+"""
+import logging
+import os
+import threading
+import time
+from typing import List, Optional
+
+from api.model_registry import get_registry
+
+logger = logging.getLogger(__name__)
+
+# Memory budget of the active models of this process (0 = unlimited)
+MODEL_MEMORY_BUDGET_MB = float(os.getenv("MODEL_MEMORY_BUDGET_MB", "0"))
+LAZY_ACTIVATION = os.getenv("LAZY_ACTIVATION", "false").lower() == "true"
+PINNED_MODELS = {name.strip() for name in os.getenv("PINNED_MODELS", "").split(",") if name.strip()}
+
+
+def model_footprint(model_data: dict) -> float:
+    """
+    Memory attributed to an active model in MB: its memory_mb option, else the size
+    reported by its backend (worker processes, mapped file), else the RSS growth during its load.
+    """
+    options = model_data.get("options") or {}
+    if options.get("memory_mb") is not None:
+        return float(options["memory_mb"])
+    load_memory = model_data.get("load_memory") or {}
+    if load_memory.get("backend_mb") is not None:
+        return float(load_memory["backend_mb"])
+    return max(float(load_memory.get("rss_delta_mb", 0.0)), 0.0)
+
+
+class ModelCache:
+    """Tracks the footprint and last use of the active models and picks the ones to evict."""
+
+    def __init__(self, registry, budget_mb: float = MODEL_MEMORY_BUDGET_MB,
+                 lazy_activation: bool = LAZY_ACTIVATION, pinned: Optional[set] = None):
+        self.registry = registry
+        self.budget_mb = budget_mb
+        self.lazy_activation = lazy_activation
+        self.pinned = set(PINNED_MODELS if pinned is None else pinned)
+
+        self._footprints = {}  # model_name -> MB measured at its last load (kept after eviction)
+        self._last_used = {}   # model_name -> monotonic time of its last load or prediction
+        self._options = {}     # model_name -> options of its last activation (for lazy activation)
+        self._counts = {}      # model_name -> {"loads", "evictions", "lazy_activations"}
+        self._evicted = set()  # models evicted from this process since their last load
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.budget_mb > 0
+
+    def is_pinned(self, model_name: str, options: Optional[dict] = None) -> bool:
+        return model_name in self.pinned or bool((options or {}).get("pinned", False))
+
+    def _count(self, model_name: str, event: str) -> None:
+        """Call with the lock held."""
+        counts = self._counts.setdefault(model_name, {"loads": 0, "evictions": 0, "lazy_activations": 0})
+        counts[event] += 1
+
+    # === Events ===
+
+    def touch(self, model_name: str) -> None:
+        """Record a prediction for the model."""
+        self._last_used[model_name] = time.monotonic()
+
+    def record_load(self, model_name: str, model_data: dict) -> float:
+        """Record an activation. Returns the model's footprint in MB."""
+        footprint = model_footprint(model_data)
+        with self._lock:
+            self._footprints[model_name] = footprint
+            self._options[model_name] = model_data.get("options") or {}
+            self._last_used[model_name] = time.monotonic()
+            self._count(model_name, "loads")
+            self._evicted.discard(model_name)
+        return footprint
+
+    def record_eviction(self, model_name: str) -> None:
+        with self._lock:
+            self._count(model_name, "evictions")
+            self._evicted.add(model_name)
+
+    def is_evicted(self, model_name: str) -> bool:
+        """Whether the model was evicted from this process and not loaded again since."""
+        return model_name in self._evicted
+
+    def forget_eviction(self, model_name: str) -> None:
+        """Stop skipping the model in the shared state sync (it was deactivated everywhere)."""
+        with self._lock:
+            self._evicted.discard(model_name)
+
+    def record_lazy_activation(self, model_name: str) -> None:
+        with self._lock:
+            self._count(model_name, "lazy_activations")
+
+    def last_options(self, model_name: str) -> dict:
+        """Options of the model's last activation in this process ({} if never activated)."""
+        return dict(self._options.get(model_name) or {})
+
+    def expected_footprint(self, model_name: str, options: dict) -> float:
+        """Footprint expected for a model about to load: its memory_mb option or the last measurement."""
+        if options.get("memory_mb") is not None:
+            return float(options["memory_mb"])
+        return self._footprints.get(model_name, 0.0)
+
+    # === Budget ===
+
+    def used_mb(self) -> float:
+        return sum(model_footprint(model_data) for model_data in self.registry.list_active_models().values())
+
+    def select_evictions(self, needed_mb: float = 0.0, keep: Optional[str] = None) -> List[str]:
+        """
+        Least recently used models to deactivate so that the active models plus needed_mb
+        fit in the budget. Pinned models and keep are never selected.
+        """
+        if not self.enabled:
+            return []
+
+        active = self.registry.list_active_models()
+        excess = sum(model_footprint(data) for data in active.values()) + needed_mb - self.budget_mb
+        if excess <= 0:
+            return []
+
+        candidates = sorted(
+            (name for name, data in active.items()
+             if name != keep and not self.is_pinned(name, data.get("options"))),
+            key=lambda name: self._last_used.get(name, 0.0)
+        )
+        victims = []
+        for name in candidates:
+            if excess <= 0:
+                break
+            victims.append(name)
+            excess -= model_footprint(active[name])
+
+        if excess > 0:
+            logger.warning(f"[MODEL_CACHE] Memory budget of {self.budget_mb} MB exceeded by {round(excess, 1)} MB "
+                           f"after evicting every unpinned model")
+        return victims
+
+    def stats(self) -> dict:
+        """Budget, usage, load/eviction counts and per-model memory."""
+        active = self.registry.list_active_models()
+        now = time.monotonic()
+        with self._lock:
+            counts = {name: dict(c) for name, c in self._counts.items()}
+        models = {}
+        for name in sorted(set(active) | set(counts)):
+            last_used = self._last_used.get(name)
+            models[name] = dict(
+                counts.get(name, {"loads": 0, "evictions": 0, "lazy_activations": 0}),
+                active=name in active,
+                evicted=name in self._evicted,
+                memory_mb=model_footprint(active[name]) if name in active else self._footprints.get(name),
+                pinned=self.is_pinned(name, active[name].get("options") if name in active else None),
+                idle_s=round(now - last_used, 1) if last_used is not None and name in active else None,
+            )
+        return {
+            "budget_mb": self.budget_mb if self.enabled else None,
+            "used_mb": round(sum(model_footprint(data) for data in active.values()), 1),
+            "lazy_activation": self.lazy_activation,
+            "loads": sum(c["loads"] for c in counts.values()),
+            "evictions": sum(c["evictions"] for c in counts.values()),
+            "lazy_activations": sum(c["lazy_activations"] for c in counts.values()),
+            "models": models,
+        }
+
+
+# Global singleton instance
+_model_cache = None
+
+
+def get_model_cache() -> ModelCache:
+    """Get the global model cache."""
+    global _model_cache
+    if _model_cache is None:
+        _model_cache = ModelCache(get_registry())
+    return _model_cache
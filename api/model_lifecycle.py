@@ -1,18 +1,65 @@
 """
-Handles the lifecycle operations for models: activation, deactivation, and cleanup.
+Handles the lifecycle operations for models: activation, hot reload, deactivation, and cleanup.
 """
 import logging
 import os
 import shutil
-from typing import Optional, Tuple
+import threading
+import time
+import uuid
+from contextlib import nullcontext
+from typing import Callable, Optional, Tuple
 
 import model_handlers.model_detector as model_detector
 import tf_serving_manager
 from api.github_client import download_github_model
+from api.micro_batcher import create_batcher
+from api.result_cache import create_result_cache, model_fingerprint
+from api.model_warmup import warm_up_model
+from api.model_workers import process_workers_option, start_model_process, stop_model_process
 from api.model_registry import get_registry
+from api.model_cache import get_model_cache
+from api.shared_state import get_shared_state, get_active_model_store, get_state_synchronizer
+from utils import process_memory
 
 logger = logging.getLogger(__name__)
 
+# How long a replaced model version may finish its in-flight requests before it is released
+HOT_RELOAD_DRAIN_TIMEOUT_S = float(os.getenv("HOT_RELOAD_DRAIN_TIMEOUT_S", "30"))
+
+
+class InflightRequests:
+    """
+    Counts the requests using one loaded model instance, so that a replaced
+    instance is released only once they finished.
+    """
+    
+    def __init__(self):
+        self._count = 0
+        self._closed = False
+        self._condition = threading.Condition()
+    
+    def enter(self) -> bool:
+        """Register a request. Returns False if the instance was released (look the model up again)."""
+        with self._condition:
+            if self._closed:
+                return False
+            self._count += 1
+            return True
+    
+    def exit(self) -> None:
+        with self._condition:
+            self._count -= 1
+            if self._count == 0:
+                self._condition.notify_all()
+    
+    def close(self, timeout: float) -> bool:
+        """Refuse new requests once the current ones finished (or timeout). Returns False on timeout."""
+        with self._condition:
+            drained = self._condition.wait_for(lambda: self._count == 0, timeout)
+            self._closed = True
+            return drained
+
 
 class ModelLifecycleManager:
     """Manages model lifecycle operations (load, unload, cleanup)."""
@@ -20,14 +67,45 @@ class ModelLifecycleManager:
     def __init__(self, models_path: str = "/models"):
         self.models_path = models_path
         self.registry = get_registry()
+        self.shared_state = get_shared_state()
+        self.active_store = get_active_model_store()
+        self.model_cache = get_model_cache()
+        self._activation_locks = {}
+        self._locks_lock = threading.Lock()
+        self._eviction_lock = threading.Lock()
+        # Serializes in-process loads while footprints are measured, so concurrent
+        # loads do not count each other's memory growth
+        self._measure_lock = threading.Lock()
     
-    def activate_model(self, model_name: str) -> Tuple[bool, str, Optional[dict]]:
+    def _activation_lock(self, model_name: str) -> threading.Lock:
+        with self._locks_lock:
+            return self._activation_locks.setdefault(model_name, threading.Lock())
+    
+    def activate_model(self, model_name: str, options: Optional[dict] = None,
+                       local_only: bool = False,
+                       on_phase: Optional[Callable[[str], None]] = None) -> Tuple[bool, str, Optional[dict]]:
         """
         Activate a model: download (if needed), load, and register as active.
+        Concurrent activations of the same model are serialized: the later ones
+        find the model active instead of loading it again.
+        
+        Args:
+            model_name: name of an available model
+            options: per-model serving options, e.g.
+                     {"batching": {"max_batch_size": 32, "max_wait_ms": 5}}
+            local_only: activate in this worker only, without recording it in the
+                        shared state (used when syncing from another worker)
+            on_phase: called with the name of each phase as it starts
+                      ("fetch", "load", "warmup", "register")
         
         Returns:
             (success, message, model_data)
         """
+        with self._activation_lock(model_name):
+            return self._activate(model_name, options, local_only, on_phase or (lambda phase: None))
+    
+    def _activate(self, model_name: str, options: Optional[dict], local_only: bool,
+                  on_phase: Callable[[str], None]) -> Tuple[bool, str, Optional[dict]]:
         # Check if model is available
         metadata = self.registry.get_model_metadata(model_name)
         if not metadata:
@@ -37,52 +115,271 @@ class ModelLifecycleManager:
         if self.registry.is_active(model_name):
             return True, "Model already active", None
         
+        options = options or {}
+        
+        # Within a memory budget, unload least recently used models to make room first
+        self._make_room(model_name, self.model_cache.expected_footprint(model_name, options))
+        
+        success, message, model_data = self._load(model_name, metadata, options, on_phase)
+        if not success:
+            return False, message, None
+        
+        # Register as active
+        if not self.registry.activate_model(model_name, model_data):
+            self._release(model_data)
+            return False, "Model not found in registry", None
+        
+        if not local_only:
+            self.shared_state.mark_active(model_name, options)
+            self._persist(self.active_store.mark_active, model_name, options)
+        
+        # The measured footprint may still exceed the budget
+        footprint = self.model_cache.record_load(model_name, model_data)
+        self._make_room(model_name)
+        
+        logger.info(f"[LIFECYCLE] Model '{model_name}' activated successfully ({footprint} MB)")
+        
+        return True, f"Model {model_name} activated", model_data
+    
+    def _load(self, model_name: str, metadata: dict, options: dict, on_phase: Callable[[str], None],
+              instance_name: Optional[str] = None) -> Tuple[bool, str, Optional[dict]]:
+        """
+        Fetch, load and warm up a model and start its batching queue and result cache,
+        without registering it. Returns (success, message, model_data).
+        instance_name: name of the instance in worker processes (default: model_name).
+        """
+        instance_name = instance_name or model_name
+        
         # Get the model path (download if from GitHub)
+        on_phase("fetch")
         try:
             model_path = self._get_model_path(metadata)
         except Exception as e:
             return False, f"Failed to obtain model: {str(e)}", None
         
-        # Detect and load the model
+        # Detect the backend and load the model, binding its predictor once
+        # (in dedicated worker processes if requested)
+        on_phase("load")
+        process_pool = None
         try:
-            model_info, model = model_detector.detect(model_path)
+            if process_workers_option(options) > 0:
+                # Measured by the pool, in its own workers
+                memory_before = memory_after = None
+                model_info, process_pool, predictor = start_model_process(
+                    model_name, model_path, options, instance_name=instance_name
+                )
+                model = process_pool
+            else:
+                with self._measure_lock if self.model_cache.enabled else nullcontext():
+                    memory_before = process_memory()
+                    model_info, model, predictor = model_detector.load(model_path, options)
+                    memory_after = process_memory()
             if model is None:
                 return False, "Unsupported or invalid model", None
         except Exception as e:
             return False, f"Failed to load model: {str(e)}", None
         
-        # Register as active
+        # How the backend ended up executing the model (e.g. PyTorch optimization mode)
+        runtime = predictor.backend.runtime(predictor.model)
+        if runtime:
+            logger.info(f"[LIFECYCLE] Model '{model_name}' runtime: {runtime}")
+        load_memory = {}
+        if memory_before and memory_after:
+            load_memory["rss_delta_mb"] = round(memory_after["rss_mb"] - memory_before["rss_mb"], 1)
+            load_memory["shared_delta_mb"] = round(memory_after["shared_mb"] - memory_before["shared_mb"], 1)
+        # Memory held outside this process's heap (worker processes, mapped files)
+        backend_footprint = (predictor.backend.memory(predictor.model) or {}).get("footprint_mb")
+        if backend_footprint is not None:
+            load_memory["backend_mb"] = backend_footprint
+        load_memory = load_memory or None
+        
+        # Pay first-request costs (graph building, tracing, allocations) before taking traffic
+        on_phase("warmup")
+        try:
+            warmup = warm_up_model(model_name, predictor, model_info, model_path, options)
+        except (TypeError, ValueError) as e:
+            if process_pool:
+                stop_model_process(instance_name, process_pool)
+            return False, f"Invalid warmup options: {str(e)}", None
+        
+        # Start the micro-batching queue if requested
+        on_phase("register")
+        try:
+            batcher = create_batcher(
+                model_name,
+                options.get("batching"),
+                batch_fn=predictor.predict_batch,
+                single_fn=predictor.predict
+            )
+        except (TypeError, ValueError) as e:
+            if process_pool:
+                stop_model_process(instance_name, process_pool)
+            return False, f"Invalid batching options: {str(e)}", None
+        
+        # Cache results of repeated identical inputs if requested
+        fingerprint = model_fingerprint(model_path, options)
+        try:
+            result_cache = create_result_cache(model_name, options.get("result_cache"), fingerprint=fingerprint)
+        except (TypeError, ValueError) as e:
+            if batcher:
+                batcher.stop()
+            if process_pool:
+                stop_model_process(instance_name, process_pool)
+            return False, f"Invalid result_cache options: {str(e)}", None
+        
         model_data = {
             "model_name": model_name,
             "model": model,
             "model_info": model_info,
-            "model_path": model_path
+            "model_path": model_path,
+            "backend": predictor.backend.name,
+            "predictor": predictor,
+            "options": options,
+            "batcher": batcher,
+            "result_cache": result_cache,
+            "process_pool": process_pool,
+            "process_instance": instance_name,
+            "load_memory": load_memory,
+            "runtime": runtime,
+            "warmup": warmup,
+            "fingerprint": fingerprint,
+            "inflight": InflightRequests(),
+            "reload": None
         }
+        return True, f"Model {model_name} loaded", model_data
+    
+    def reload_model(self, model_name: str, local_only: bool = False,
+                     on_phase: Optional[Callable[[str], None]] = None) -> Tuple[bool, str, Optional[dict]]:
+        """
+        Replace an active model by its current version without downtime: the new
+        version is loaded and warmed up next to the serving one, swapped in atomically,
+        and the old one is released once its in-flight requests finished. If the new
+        version fails to load, the old one keeps serving.
         
-        self.registry.activate_model(model_name, model_data)
-        logger.info(f"[LIFECYCLE] Model '{model_name}' activated successfully")
+        Args:
+            local_only: reload in this worker only (used when syncing from another worker)
+            on_phase: called with the name of each phase as it starts
         
-        return True, f"Model {model_name} activated", model_data
+        Returns:
+            (success, message, model_data of the new version)
+        """
+        with self._activation_lock(model_name):
+            return self._reload(model_name, local_only, on_phase or (lambda phase: None))
+    
+    def _reload(self, model_name: str, local_only: bool,
+                on_phase: Callable[[str], None]) -> Tuple[bool, str, Optional[dict]]:
+        current = self.registry.get_active_model(model_name)
+        if not current:
+            return True, "Model not active, nothing to reload", None
+        
+        metadata = self.registry.get_model_metadata(model_name)
+        if not metadata:
+            return False, "Model not found in registry", None
+        
+        options = current["options"]
+        if (metadata.get("source", "local_filesystem") == "local_filesystem"
+                and model_fingerprint(metadata["model_path"], options) == current.get("fingerprint")):
+            return True, "Model files unchanged", None
+        
+        self._make_room(model_name, self.model_cache.expected_footprint(model_name, options))
+        
+        instance_name = f"{model_name}@{uuid.uuid4().hex[:8]}"
+        success, message, model_data = self._load(model_name, metadata, options, on_phase, instance_name)
+        if not success:
+            current["reload"] = {"status": "failed", "message": message, "at": time.time()}
+            logger.error(f"[LIFECYCLE] Reload of '{model_name}' failed, the previous version keeps serving: {message}")
+            return False, f"Reload failed, the previous version keeps serving: {message}", None
+        
+        model_data["reload"] = {"status": "succeeded", "message": None, "at": time.time()}
+        
+        # Deactivated or replaced while the new version loaded: do not bring it back
+        if self.registry.get_active_model(model_name) is not current:
+            self._release(model_data)
+            return True, "Model no longer active, reload discarded", None
+        
+        # Atomic swap: new requests get the new version from here on
+        if not self.registry.activate_model(model_name, model_data):
+            self._release(model_data)
+            return False, "Model not found in registry", None
+        
+        if not local_only:
+            revision = self.shared_state.bump_reload(model_name)
+            synchronizer = get_state_synchronizer()
+            if synchronizer:
+                synchronizer.mark_reloaded(model_name, revision)
+        
+        footprint = self.model_cache.record_load(model_name, model_data)
+        
+        # Let the old version finish its in-flight requests before releasing it
+        threading.Thread(
+            target=self._retire, args=(current,), name=f"retire-{model_name}", daemon=True
+        ).start()
+        
+        self._make_room(model_name)
+        
+        logger.info(f"[LIFECYCLE] Model '{model_name}' reloaded ({footprint} MB)")
+        return True, f"Model {model_name} reloaded", model_data
     
-    def deactivate_model(self, model_name: str) -> Tuple[bool, str]:
+    def _retire(self, model_data: dict) -> None:
+        model_name = model_data["model_name"]
+        if not model_data["inflight"].close(HOT_RELOAD_DRAIN_TIMEOUT_S):
+            logger.warning(f"[LIFECYCLE] Previous version of '{model_name}' still had requests in flight "
+                           f"after {HOT_RELOAD_DRAIN_TIMEOUT_S}s; releasing it anyway")
+        self._release(model_data)
+        logger.info(f"[LIFECYCLE] Released previous version of '{model_name}'")
+    
+    def _release(self, model_data: dict) -> None:
+        """Free what a loaded model instance holds besides the model itself."""
+        # Cached results belong to this model version
+        if model_data.get("result_cache"):
+            model_data["result_cache"].invalidate()
+        
+        # Drain the batching queue (new requests can no longer reach it)
+        if model_data.get("batcher"):
+            model_data["batcher"].stop()
+        
+        # Unload from the worker processes (stopped once their group hosts no model)
+        if model_data.get("process_pool"):
+            stop_model_process(model_data["process_instance"], model_data["process_pool"])
+    
+    def deactivate_model(self, model_name: str, local_only: bool = False) -> Tuple[bool, str]:
         """
         Deactivate a model: stop containers and remove from active registry.
+        With local_only, only this worker's copy is unloaded: the TF Serving
+        container and the shared state are left to the worker that owns them.
         
         Returns:
             (success, message)
         """
-        if not self.registry.is_active(model_name):
+        # Not while the model is being activated or reloaded
+        with self._activation_lock(model_name):
+            return self._deactivate(model_name, local_only)
+    
+    def _deactivate(self, model_name: str, local_only: bool) -> Tuple[bool, str]:
+        model_data = self.registry.get_active_model(model_name)
+        # An evicted model is still active in the shared state and the other workers
+        if not model_data and (local_only or not self.model_cache.is_evicted(model_name)):
             return True, "Model already inactive"
         
         # Stop TF Serving container if running
-        try:
-            tf_serving_manager.stop_container(model_name)
-            logger.info(f"[LIFECYCLE] Stopped TF Serving container for '{model_name}'")
-        except Exception as e:
-            logger.warning(f"[LIFECYCLE] Error stopping container for '{model_name}': {e}")
+        if not local_only:
+            try:
+                tf_serving_manager.stop_container(model_name)
+                logger.info(f"[LIFECYCLE] Stopped TF Serving container for '{model_name}'")
+            except Exception as e:
+                logger.warning(f"[LIFECYCLE] Error stopping container for '{model_name}': {e}")
         
         # Remove from active models
         self.registry.deactivate_model(model_name)
+        
+        if not local_only:
+            self.shared_state.mark_inactive(model_name)
+            self._persist(self.active_store.mark_inactive, model_name)
+            self.model_cache.forget_eviction(model_name)
+        
+        if model_data:
+            self._release(model_data)
+        
         logger.info(f"[LIFECYCLE] Model '{model_name}' deactivated")
         
         return True, f"Model {model_name} deactivated"
@@ -107,6 +404,42 @@ class ModelLifecycleManager:
         logger.info(f"[LIFECYCLE] Model '{model_name}' completely removed")
         return True, f"Model {model_name} removed completely"
     
+    def _make_room(self, model_name: str, needed_mb: float = 0.0) -> None:
+        """Evict least recently used unpinned models until the active models (plus needed_mb) fit the budget."""
+        with self._eviction_lock:
+            for victim in self.model_cache.select_evictions(needed_mb, keep=model_name):
+                logger.info(f"[LIFECYCLE] Evicting '{victim}' to fit the memory budget for '{model_name}'")
+                self._evict(victim)
+    
+    def _evict(self, model_name: str) -> None:
+        """
+        Unload a model from this process only: its TF Serving container, the shared
+        state and the record of active models are left untouched, so the other
+        workers keep serving it and it is restored at the next startup.
+        """
+        lock = self._activation_lock(model_name)
+        # Skip a model being activated, reloaded or deactivated (and never wait on another
+        # model's lock while holding the lock of the one being activated)
+        if not lock.acquire(blocking=False):
+            logger.info(f"[LIFECYCLE] Not evicting '{model_name}': it is being changed")
+            return
+        try:
+            model_data = self.registry.get_active_model(model_name)
+            if not model_data:
+                return
+            self.registry.deactivate_model(model_name)
+            self.model_cache.record_eviction(model_name)
+            self._release(model_data)
+        finally:
+            lock.release()
+    
+    def _persist(self, update, *args) -> None:
+        """Update the record of active models restored at startup (never fails the operation)."""
+        try:
+            update(*args)
+        except OSError as e:
+            logger.warning(f"[LIFECYCLE] Could not record active models in '{self.active_store.path}': {e}")
+    
     def _get_model_path(self, metadata: dict) -> str:
         """
         Get the model path, downloading from GitHub if necessary.
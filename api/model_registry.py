@@ -16,7 +16,7 @@ class ModelRegistry:
     
     def __init__(self):
         self._available_models: Dict[str, dict] = {}  # model_name -> metadata
-        self._active_models: Dict[str, dict] = {}     # model_name -> {model, model_info, model_path}
+        self._active_models: Dict[str, dict] = {}     # model_name -> {model, model_info, model_path, predictor, ...}
         self._lock = Lock()
     
     # === Available Models ===
@@ -56,7 +56,7 @@ class ModelRegistry:
     def activate_model(self, model_name: str, model_data: dict) -> bool:
         """
         Mark a model as active and store its runtime data.
-        model_data should contain: {model, model_info, model_path}
+        model_data should contain: {model, model_info, model_path, predictor}
         Returns False if model is not available.
         """
         with self._lock:
@@ -0,0 +1,186 @@
+"""
+Warm-up of a loaded model before it receives traffic.
+
+Runs a few single and batched predictions on synthetic inputs built from the
+model_info shapes (or on user-supplied samples), so lazy graph building, function
+tracing, allocator growth and TF Serving's first-request cost are paid before the
+model is registered as active. Cold (first call) and warm latencies are recorded.
+"""
+import json
+import logging
+import os
+import re
+import statistics
+import time
+from typing import Any, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+MODEL_WARMUP = os.getenv("MODEL_WARMUP", "true").lower() == "true"
+DEFAULT_WARMUP_RUNS = int(os.getenv("WARMUP_RUNS", "5"))
+DEFAULT_WARMUP_BATCH_SIZE = int(os.getenv("WARMUP_BATCH_SIZE", "8"))
+
+# e.g. "TensorSpec(shape=(None, 3), dtype=tf.float32, name='x')"
+_TENSOR_SPEC = re.compile(r"shape=\(([^)]*)\), dtype=tf\.(\w+)")
+
+
+def _random_array(shape, dtype, rng) -> np.ndarray:
+    dtype = np.dtype(dtype)  # TypeError for types without a NumPy equivalent
+    if dtype.kind == "f":
+        return rng.standard_normal(shape).astype(dtype)
+    if dtype.kind in "biu":
+        return np.zeros(shape, dtype=dtype)
+    raise ValueError(f"cannot generate {dtype} inputs")
+
+
+def _fixed_dims(dims) -> List[int]:
+    dims = list(dims)
+    if not all(isinstance(dim, int) and dim > 0 for dim in dims):
+        raise ValueError(f"input shape {dims} has dynamic dimensions")
+    return dims
+
+
+def _input_factory(model_info: dict):
+    """
+    Return a function rng -> one synthetic prediction input, shaped like the
+    input of /predict/<model_name> for the model's backend.
+    """
+    model_type = model_info.get("type")
+    input_shape = model_info.get("input_shape")
+
+    if model_type == "Scikit-learn" and isinstance(input_shape, list):
+        dims = _fixed_dims(input_shape)
+        return lambda rng: _random_array(dims, np.float64, rng)
+
+    if model_type == "PyTorch" and isinstance(input_shape, (list, tuple)):
+        # Shape of one example batch: requests omit the batch axis
+        dims = _fixed_dims(input_shape[1:])
+        return lambda rng: _random_array(dims, np.float32, rng)
+
+    if model_type == "Keras/TensorFlow" and isinstance(input_shape, tuple):
+        dims = _fixed_dims(input_shape[1:])
+        return lambda rng: _random_array(dims, np.float32, rng)
+
+    if model_type == "ONNX" and model_info.get("inputs"):
+        specs = []
+        for node in model_info["inputs"]:
+            if not node.get("shape"):
+                raise ValueError(f"input '{node['name']}' has no shape")
+            element_type = node["dtype"][len("tensor("):-1]  # e.g. "tensor(float)"
+            dtype = {"float": "float32", "double": "float64"}.get(element_type, element_type)
+            specs.append((node["name"], _fixed_dims(node["shape"][1:]), dtype))
+        if len(specs) == 1:
+            _, dims, dtype = specs[0]
+            return lambda rng: _random_array(dims, dtype, rng)
+        return lambda rng: {name: _random_array(dims, dtype, rng) for name, dims, dtype in specs}
+
+    if model_type == "TensorFlow SavedModel" and isinstance(model_info.get("inputs"), dict):
+        specs = []
+        for name, spec in model_info["inputs"].items():
+            match = _TENSOR_SPEC.search(str(spec))
+            if not match:
+                raise ValueError(f"cannot parse the spec of input '{name}'")
+            dims = [int(dim) if dim.strip().isdigit() else None
+                    for dim in match.group(1).split(",") if dim.strip()]
+            specs.append((name, _fixed_dims(dims[1:]), match.group(2)))
+        # SavedModel requests carry instances: keep a batch axis of 1
+        if len(specs) == 1:
+            _, dims, dtype = specs[0]
+            return lambda rng: _random_array([1] + dims, dtype, rng)
+        return lambda rng: {name: _random_array([1] + dims, dtype, rng) for name, dims, dtype in specs}
+
+    raise ValueError(f"input shape unknown for model type '{model_type}': pass a sample_file")
+
+
+def _read_sample_file(model_path: str, sample_file: str) -> List[Any]:
+    """
+    Read user-supplied warm-up inputs from a file in the model's directory:
+    .npy (one input per row) or .json (one input, {"input": ...} or {"instances": [...]}).
+    """
+    base_dir = model_path if os.path.isdir(model_path) else os.path.dirname(model_path)
+    path = os.path.realpath(os.path.join(base_dir, sample_file))
+    if os.path.commonpath([path, os.path.realpath(base_dir)]) != os.path.realpath(base_dir):
+        raise ValueError("sample_file must be inside the model's directory")
+
+    if path.endswith(".npy"):
+        return list(np.load(path, allow_pickle=False))
+
+    with open(path) as f:
+        content = json.load(f)
+    if isinstance(content, dict) and "instances" in content:
+        return list(content["instances"])
+    if isinstance(content, dict) and "input" in content:
+        return [content["input"]]
+    return [content]
+
+
+def _timed(fn, *args) -> float:
+    started = time.perf_counter()
+    fn(*args)
+    return (time.perf_counter() - started) * 1000
+
+
+def _latencies(fn, inputs: List[Any]) -> dict:
+    """Cold latency of the first call and median latency of the following ones (ms)."""
+    timings = [_timed(fn, data) for data in inputs]
+    return {
+        "cold_ms": round(timings[0], 3),
+        "warm_ms": round(statistics.median(timings[1:]), 3) if len(timings) > 1 else None,
+    }
+
+
+def warm_up_model(model_name: str, predictor, model_info: dict, model_path: str,
+                  options: dict) -> Optional[dict]:
+    """
+    Warm up a loaded model from its 'warmup' option: True (defaults), a dict with
+    runs/batch_size/sample_file, or False (disabled). Defaults to MODEL_WARMUP.
+    Returns the warm-up report, or None if disabled. Never raises for inference
+    errors: synthetic inputs may not be valid for every model.
+    """
+    config = options.get("warmup", MODEL_WARMUP)
+    if not config:
+        return None
+
+    settings = config if isinstance(config, dict) else {}
+    runs = int(settings.get("runs", DEFAULT_WARMUP_RUNS))
+    batch_size = int(settings.get("batch_size", DEFAULT_WARMUP_BATCH_SIZE))
+    if runs < 1 or batch_size < 1:
+        raise ValueError("runs and batch_size must be at least 1")
+
+    report = {"runs": runs, "batch_size": batch_size}
+    rng = np.random.default_rng(0)
+    try:
+        if settings.get("sample_file"):
+            samples = _read_sample_file(model_path, settings["sample_file"])
+            if not samples:
+                raise ValueError("sample_file has no inputs")
+            make_input = lambda rng: samples[int(rng.integers(len(samples)))]
+            report["inputs"] = "sample_file"
+        elif options.get("sample_input") is not None:
+            make_input = lambda rng: options["sample_input"]
+            report["inputs"] = "sample_input"
+        else:
+            make_input = _input_factory(model_info or {})
+            make_input(rng)  # fails here for input types that cannot be generated
+            report["inputs"] = "model_info"
+    except (ValueError, TypeError, OSError) as e:
+        report["skipped"] = str(e)
+        logger.warning(f"[WARMUP] Skipped warm-up of '{model_name}': {e}")
+        return report
+
+    started = time.perf_counter()
+    try:
+        report["single"] = _latencies(predictor.predict, [make_input(rng) for _ in range(runs)])
+        report["batch"] = _latencies(
+            predictor.predict_batch,
+            [[make_input(rng) for _ in range(batch_size)] for _ in range(runs)]
+        )
+    except Exception as e:
+        report["error"] = f"{type(e).__name__}: {e}"
+        logger.warning(f"[WARMUP] Warm-up inference failed for '{model_name}': {e}")
+    report["total_ms"] = round((time.perf_counter() - started) * 1000, 3)
+
+    logger.info(f"[WARMUP] Model '{model_name}' warmed up: {report}")
+    return report
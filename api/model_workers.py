@@ -0,0 +1,541 @@
+"""
+Isolated inference worker processes.
+
+A model activated with "process_workers": N is loaded in N dedicated worker
+processes instead of the API process, so its inference does not compete for the
+API's GIL and a crashing model only takes down its own workers (which are
+restarted). Models activated with the same "process_group" share the workers.
+
+Numeric arrays in requests and responses are written into a pair of shared
+memory buffers per worker instead of being pickled through the pipe; the worker
+reads its inputs directly from shared memory without copying them.
+"""
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from multiprocessing import shared_memory
+from typing import Any, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+import torch
+
+from model_handlers.backends import ModelBackend, Predictor
+from utils import process_memory
+
+logger = logging.getLogger(__name__)
+
+MODEL_PROCESS_WORKERS = int(os.getenv("MODEL_PROCESS_WORKERS", "0"))  # 0: run models in the API process
+MODEL_WORKER_SHM_MB = float(os.getenv("MODEL_WORKER_SHM_MB", "64"))
+MODEL_WORKER_TIMEOUT = float(os.getenv("MODEL_WORKER_TIMEOUT", "60"))
+MODEL_WORKER_START_TIMEOUT = float(os.getenv("MODEL_WORKER_START_TIMEOUT", "300"))
+
+# Workers import the ML frameworks themselves: never fork a threaded API process
+_mp_context = multiprocessing.get_context("spawn")
+
+
+class ModelWorkerError(RuntimeError):
+    """Raised when a worker process crashed or did not answer in time."""
+
+
+# === Shared memory transfer ===
+
+class _SharedArray(NamedTuple):
+    """Placeholder for an array stored in a shared memory buffer."""
+    offset: int
+    shape: Tuple[int, ...]
+    dtype: str
+
+
+def _as_numeric_array(obj) -> Optional[np.ndarray]:
+    if isinstance(obj, torch.Tensor):
+        obj = obj.detach().cpu().numpy()
+    elif isinstance(obj, list):
+        try:
+            obj = np.asarray(obj)
+        except ValueError:  # ragged
+            return None
+    if isinstance(obj, np.ndarray) and obj.dtype.kind in "biuf":
+        return obj
+    return None
+
+
+def _pack(obj, buf, convert_lists=False):
+    """
+    Replace the numeric arrays (and tensors) in obj with _SharedArray placeholders,
+    writing their data into buf. Arrays that do not fit are left in place (pickled).
+    With convert_lists, nested lists of numbers are sent as arrays too.
+    """
+    cursor = [0]
+
+    def walk(item):
+        if isinstance(item, (np.ndarray, torch.Tensor)) or (convert_lists and isinstance(item, list)):
+            array = _as_numeric_array(item)
+            if array is not None:
+                start = (cursor[0] + 63) & ~63  # 64-byte aligned
+                end = start + array.nbytes
+                if end <= len(buf):
+                    np.ndarray(array.shape, array.dtype, buffer=buf, offset=start)[...] = array
+                    cursor[0] = end
+                    return _SharedArray(start, array.shape, array.dtype.str)
+                return array
+        if isinstance(item, dict):
+            return {key: walk(value) for key, value in item.items()}
+        if isinstance(item, list):
+            return [walk(value) for value in item]
+        if isinstance(item, tuple):
+            return tuple(walk(value) for value in item)
+        return item
+
+    return walk(obj)
+
+
+def _unpack(obj, buf, copy=True):
+    """Inverse of _pack. Without copy, arrays are views on buf (valid until buf is reused)."""
+    if isinstance(obj, _SharedArray):
+        array = np.ndarray(obj.shape, np.dtype(obj.dtype), buffer=buf, offset=obj.offset)
+        return array.copy() if copy else array
+    if isinstance(obj, dict):
+        return {key: _unpack(value, buf, copy) for key, value in obj.items()}
+    if isinstance(obj, list):
+        return [_unpack(value, buf, copy) for value in obj]
+    if isinstance(obj, tuple):
+        return tuple(_unpack(value, buf, copy) for value in obj)
+    return obj
+
+
+# === Worker process ===
+
+def _worker_main(conn, request_shm_name, response_shm_name):
+    """Entry point of a worker process: load models and serve requests from the pipe."""
+    import model_handlers.model_detector as model_detector
+
+    request_shm = shared_memory.SharedMemory(name=request_shm_name)
+    response_shm = shared_memory.SharedMemory(name=response_shm_name)
+    predictors = {}
+
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            break
+
+        op = message[0]
+        if op == "stop":
+            break
+
+        try:
+            if op == "load":
+                _, model_name, model_path, options = message
+                model_info, model, predictor = model_detector.load(model_path, options)
+                if model is None:
+                    raise ValueError("Unsupported or invalid model")
+                predictors[model_name] = predictor
+                reply = (model_info, predictor.backend.name, predictor.backend.runtime(predictor.model))
+
+            elif op == "unload":
+                predictors.pop(message[1], None)
+                reply = None
+
+            elif op == "ping":
+                reply = None
+
+            else:
+                _, model_name, payload = message
+                predictor = predictors[model_name]
+                data = _unpack(payload, request_shm.buf, copy=False)
+                result = predictor.predict(data) if op == "predict" else predictor.predict_batch(data)
+                reply = _pack(result, response_shm.buf)
+
+            conn.send(("ok", reply))
+        except Exception as e:
+            conn.send(("error", f"{type(e).__name__}: {e}"))
+
+    conn.close()
+
+
+class _Worker:
+    """API-side handle of one worker process: its pipe and shared memory buffers."""
+
+    def __init__(self, group: str, index: int, shm_bytes: int):
+        self.name = f"model-worker-{group}-{index}"
+        self.request_shm = shared_memory.SharedMemory(create=True, size=shm_bytes)
+        try:
+            self.response_shm = shared_memory.SharedMemory(create=True, size=shm_bytes)
+        except Exception:
+            self._unlink(self.request_shm)
+            raise
+        try:
+            self.conn, child_conn = _mp_context.Pipe()
+            self.process = _mp_context.Process(
+                target=_worker_main,
+                args=(child_conn, self.request_shm.name, self.response_shm.name),
+                name=self.name,
+                daemon=True
+            )
+            self.process.start()
+            child_conn.close()
+        except Exception:
+            self._unlink(self.request_shm)
+            self._unlink(self.response_shm)
+            raise
+
+    @staticmethod
+    def _unlink(shm) -> None:
+        shm.close()
+        shm.unlink()
+
+    def call(self, message, timeout: float):
+        """Send a request and wait for its reply. Raises ModelWorkerError if the worker died or hung."""
+        try:
+            self.conn.send(message)
+            if not self.conn.poll(timeout):
+                raise ModelWorkerError(f"Worker {self.name} did not answer within {timeout:.0f}s")
+            status, reply = self.conn.recv()
+        except (EOFError, OSError) as e:
+            raise ModelWorkerError(f"Worker {self.name} exited (exit code {self.process.exitcode})") from e
+
+        if status == "error":
+            raise RuntimeError(reply)
+        return reply
+
+    def close(self, timeout: float = 5) -> None:
+        try:
+            self.conn.send(("stop",))
+        except (OSError, ValueError):
+            pass
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+        for shm in (self.request_shm, self.response_shm):
+            self._unlink(shm)
+
+
+class ModelProcessPool:
+    """
+    A group of worker processes hosting one or more models.
+    Each request is served by one idle worker; a worker that crashes or hangs
+    fails its request and is replaced in the background (reloading the group's models).
+    A worker that cannot be replaced is dropped from the pool; waiting for an idle
+    worker is bounded, so requests fail instead of blocking on a pool with none left.
+    """
+
+    def __init__(self, group: str, workers: int, shm_mb: float = MODEL_WORKER_SHM_MB,
+                 timeout: float = MODEL_WORKER_TIMEOUT):
+        if workers < 1:
+            raise ValueError("process_workers must be at least 1")
+
+        self.group = group
+        self.size = int(workers)
+        self.shm_bytes = int(shm_mb * 1024 * 1024)
+        self.timeout = float(timeout)
+
+        self._models = {}               # model_name -> (model_path, options)
+        self._memory = {}               # model_name -> workers' RSS growth while loading it (MB)
+        self._workers = []
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()        # guards _models/_workers/stats (never held while waiting for a worker)
+        self._load_lock = threading.Lock()   # serializes loads and unloads
+        self._stopped = False
+        self._pending_loads = 0              # loads about to start (see start_model_process)
+
+        # Stats
+        self._requests = 0
+        self._failures = 0
+        self._restarts = 0
+
+    def start(self) -> None:
+        for index in range(self.size):
+            worker = _Worker(self.group, index, self.shm_bytes)
+            self._workers.append(worker)
+            self._idle.put(worker)
+        logger.info(f"[WORKERS] Started {self.size} worker process(es) for group '{self.group}'")
+
+    def stop(self) -> None:
+        with self._lock:
+            self._stopped = True
+            workers, self._workers = self._workers, []
+        for worker in workers:
+            worker.close()
+        logger.info(f"[WORKERS] Stopped worker processes of group '{self.group}'")
+
+    # === Models ===
+
+    def _acquire(self, timeout: float) -> _Worker:
+        """Take an idle worker. Raises ModelWorkerError if none is available within timeout."""
+        with self._lock:
+            if not self._workers:
+                raise ModelWorkerError(f"No worker process left in group '{self.group}'")
+        try:
+            return self._idle.get(timeout=timeout)
+        except queue.Empty:
+            raise ModelWorkerError(f"No idle worker in group '{self.group}' within {timeout:.0f}s") from None
+
+    def _acquire_all(self) -> List[_Worker]:
+        # A worker being replaced is returned to _idle by _replace, which only needs _lock
+        with self._lock:
+            count = len(self._workers)
+        workers = []
+        deadline = time.monotonic() + MODEL_WORKER_START_TIMEOUT
+        try:
+            for _ in range(count):
+                workers.append(self._acquire(max(deadline - time.monotonic(), 0.0)))
+        except ModelWorkerError:
+            for worker in workers:
+                self._idle.put(worker)
+            raise
+        return workers
+
+    def hosts_models(self) -> bool:
+        """Whether the pool hosts a model or is about to load one."""
+        with self._lock:
+            return bool(self._models) or self._pending_loads > 0
+
+    def reserve_load(self) -> None:
+        """Keep the pool alive until the matching load_model() returns."""
+        with self._lock:
+            self._pending_loads += 1
+
+    def load_model(self, model_name: str, model_path: str, options: dict) -> Tuple[dict, str]:
+        """Load a model in every worker. Returns (model_info, backend_name, runtime)."""
+        try:
+            with self._load_lock:
+                workers = self._acquire_all()
+                try:
+                    # Every worker is idle (and done importing): the growth of their RSS is the model's alone
+                    for worker in workers:
+                        worker.call(("ping",), MODEL_WORKER_START_TIMEOUT)
+                    rss_before = self._workers_rss_mb(workers)
+                    replies = [worker.call(("load", model_name, model_path, options), MODEL_WORKER_START_TIMEOUT)
+                               for worker in workers]
+                    if not replies:
+                        raise ModelWorkerError(f"No worker process left in group '{self.group}'")
+                    rss_after = self._workers_rss_mb(workers)
+                    with self._lock:
+                        self._models[model_name] = (model_path, options)
+                        if rss_before is not None and rss_after is not None:
+                            self._memory[model_name] = round(max(rss_after - rss_before, 0.0), 1)
+                except Exception:
+                    for worker in workers:
+                        self._call_quietly(worker, ("unload", model_name))
+                    raise
+                finally:
+                    for worker in workers:
+                        self._idle.put(worker)
+        finally:
+            with self._lock:
+                self._pending_loads = max(self._pending_loads - 1, 0)
+        return replies[0]
+
+    def unload_model(self, model_name: str) -> int:
+        """Unload a model from every worker. Returns the number of models still hosted."""
+        with self._load_lock:
+            with self._lock:
+                self._models.pop(model_name, None)
+                self._memory.pop(model_name, None)
+            try:
+                workers = self._acquire_all()
+            except ModelWorkerError as e:
+                # Workers that are never handed back cannot serve the model anymore either
+                logger.warning(f"[WORKERS] Unloading '{model_name}' from group '{self.group}': {e}")
+                workers = []
+            for worker in workers:
+                self._call_quietly(worker, ("unload", model_name))
+                self._idle.put(worker)
+            with self._lock:
+                return len(self._models)
+
+    @staticmethod
+    def _workers_rss_mb(workers) -> Optional[float]:
+        memories = [process_memory(worker.process.pid) for worker in workers]
+        if not all(memories):
+            return None
+        return sum(memory["rss_mb"] for memory in memories)
+
+    def memory(self, model_name: str) -> dict:
+        """RSS of the workers, and how much it grew while loading model_name."""
+        with self._lock:
+            workers = list(self._workers)
+            footprint = self._memory.get(model_name)
+        return {
+            "workers_rss_mb": self._workers_rss_mb(workers),
+            "footprint_mb": footprint
+        }
+
+    def _call_quietly(self, worker, message):
+        try:
+            worker.call(message, self.timeout)
+        except Exception as e:
+            logger.warning(f"[WORKERS] {worker.name}: {message[0]} failed: {e}")
+
+    # === Inference ===
+
+    def _request(self, op: str, model_name: str, data: Any) -> Any:
+        worker = self._acquire(self.timeout)
+        try:
+            payload = _pack(data, worker.request_shm.buf, convert_lists=True)
+            reply = worker.call((op, model_name, payload), self.timeout)
+            result = _unpack(reply, worker.response_shm.buf)
+        except ModelWorkerError as e:
+            with self._lock:
+                self._failures += 1
+            logger.error(f"[WORKERS] {e}; restarting it")
+            threading.Thread(target=self._replace, args=(worker,), daemon=True).start()
+            raise
+        except Exception:
+            self._idle.put(worker)
+            raise
+
+        self._idle.put(worker)
+        with self._lock:
+            self._requests += 1
+        return result
+
+    def predict(self, model_name: str, data: Any) -> Any:
+        return self._request("predict", model_name, data)
+
+    def predict_batch(self, model_name: str, instances: List[Any]) -> List[Any]:
+        return self._request("predict_batch", model_name, instances)
+
+    # === Supervision ===
+
+    def _replace(self, worker: _Worker) -> None:
+        worker.close(timeout=1)
+        with self._lock:
+            if self._stopped:
+                return
+            index = self._workers.index(worker)
+            try:
+                replacement = _Worker(self.group, index, self.shm_bytes)
+            except Exception as e:
+                # Shrink the pool rather than leave a slot no worker will ever fill
+                del self._workers[index]
+                logger.error(f"[WORKERS] Could not replace {worker.name}: {e}; "
+                             f"{len(self._workers)} worker(s) left in group '{self.group}'")
+                return
+            self._workers[index] = replacement
+            models = dict(self._models)
+            self._restarts += 1
+
+        for model_name, (model_path, options) in models.items():
+            try:
+                replacement.call(("load", model_name, model_path, options), MODEL_WORKER_START_TIMEOUT)
+            except Exception as e:
+                logger.error(f"[WORKERS] {replacement.name} could not reload '{model_name}': {e}")
+
+        self._idle.put(replacement)
+        logger.info(f"[WORKERS] Replaced {worker.name} (pid {replacement.process.pid})")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "group": self.group,
+                "workers": self.size,
+                "live_workers": len(self._workers),
+                "pids": [worker.process.pid for worker in self._workers],
+                "models": sorted(self._models),
+                "requests": self._requests,
+                "failures": self._failures,
+                "restarts": self._restarts,
+                "shm_mb_per_buffer": round(self.shm_bytes / (1024 * 1024), 1)
+            }
+
+
+class ModelProcessBackend(ModelBackend):
+    """
+    Predicts through the worker processes of a ModelProcessPool.
+    Not registered: bound by start_model_process() for models activated with process_workers.
+    """
+
+    def __init__(self, pool: ModelProcessPool, model_name: str, backend_name: str,
+                 model_info: dict, runtime: Optional[dict]):
+        self.pool = pool
+        self.model_name = model_name
+        self.model_info = model_info
+        self.runtime_info = runtime
+        self.name = f"{backend_name}-process"
+
+    def info(self, model):
+        return self.model_info
+
+    def runtime(self, model):
+        return self.runtime_info
+
+    def memory(self, model):
+        return self.pool.memory(self.model_name)
+
+    def predict(self, model, data):
+        return self.pool.predict(self.model_name, data)
+
+    def predict_batch(self, model, instances):
+        return self.pool.predict_batch(self.model_name, instances)
+
+
+# Process pools by group name
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def process_workers_option(options: dict) -> int:
+    """Number of worker processes requested for a model (0 runs it in the API process)."""
+    return int(options.get("process_workers", MODEL_PROCESS_WORKERS))
+
+
+def start_model_process(model_name: str, model_path: str, options: dict,
+                        instance_name: Optional[str] = None) -> Tuple[dict, ModelProcessPool, Predictor]:
+    """
+    Load a model in the worker processes of its group (started on first use).
+    instance_name is the name the workers host it under (default: model_name), so a
+    reloaded version can be loaded next to the one still serving.
+    Returns (model_info, pool, predictor) like model_detector.load().
+    """
+    instance_name = instance_name or model_name
+    group = options.get("process_group", model_name)
+    worker_options = {k: v for k, v in options.items()
+                      if k not in ("process_workers", "process_group", "shm_mb", "batching")}
+
+    with _pools_lock:
+        pool = _pools.get(group)
+        if pool is None:
+            pool = ModelProcessPool(group, process_workers_option(options),
+                                    shm_mb=float(options.get("shm_mb", MODEL_WORKER_SHM_MB)))
+            pool.start()
+            _pools[group] = pool
+        # Not stopped by a concurrent stop_model_process() while the model loads
+        pool.reserve_load()
+
+    try:
+        started = time.time()
+        model_info, backend_name, runtime = pool.load_model(instance_name, model_path, worker_options)
+        logger.info(f"[WORKERS] Loaded '{instance_name}' in group '{group}' ({time.time() - started:.1f}s)")
+    except Exception:
+        stop_model_process(instance_name, pool)
+        raise
+
+    backend = ModelProcessBackend(pool, instance_name, backend_name, model_info, runtime)
+    return model_info, pool, Predictor(backend, pool)
+
+
+def stop_model_process(model_name: str, pool: ModelProcessPool) -> None:
+    """Unload a model from its group, stopping the group's workers once they host no model."""
+    # Worker calls happen outside _pools_lock, which every other group needs
+    pool.unload_model(model_name)
+    with _pools_lock:
+        if pool.hosts_models():
+            return
+        if _pools.get(pool.group) is pool:
+            del _pools[pool.group]
+    pool.stop()
+
+
+def stop_all_model_processes() -> None:
+    """Stop every worker process group (on shutdown)."""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.stop()
@@ -0,0 +1,254 @@
+"""
+In-process prediction service shared by the REST API and the messaging consumers.
+Looks up the active model, runs inference and publishes results to the prediction destination.
+"""
+import logging
+import os
+import time
+from contextlib import contextmanager
+from typing import Any, List, Optional
+
+from api.activation_jobs import get_activation_job_manager
+from api.model_cache import get_model_cache
+from api.model_registry import get_registry
+from api.shared_state import get_state_synchronizer
+from serialization import dumps, encode_envelope
+from utils import send_message_to_prediction_destination
+
+logger = logging.getLogger(__name__)
+
+PREDICT_BATCH_CHUNK_SIZE = int(os.getenv("PREDICT_BATCH_CHUNK_SIZE", "1024"))
+
+# How long a prediction for a model that is still being activated waits for it (0 = fail right away)
+PREDICT_WAIT_FOR_ACTIVATION_S = float(os.getenv("PREDICT_WAIT_FOR_ACTIVATION_S", "0"))
+
+
+class ModelNotActiveError(LookupError):
+    """Raised when a prediction is requested for a model that is not active."""
+
+    def __init__(self, model_name: str, loading: bool = False):
+        suffix = " (activation in progress)" if loading else ""
+        super().__init__(f"Model '{model_name}' not active{suffix}")
+        self.model_name = model_name
+        self.loading = loading
+
+
+def _unwrap(result: Any) -> Any:
+    """Unwrap handler results of the form {"predictions": ...}."""
+    if isinstance(result, dict) and "predictions" in result:
+        return result["predictions"]
+    return result
+
+
+class PredictionService:
+    """Runs predictions against active models without going through HTTP."""
+
+    def __init__(self):
+        self.registry = get_registry()
+        self.model_cache = get_model_cache()
+
+    def _get_active_model(self, model_name: str, wait_s: Optional[float] = None) -> dict:
+        active_model = self.registry.get_active_model(model_name)
+        if not active_model:
+            active_model = self._find_or_activate(model_name, wait_s)
+        self.model_cache.touch(model_name)
+        return active_model
+
+    def _find_or_activate(self, model_name: str, wait_s: Optional[float]) -> dict:
+        """Find a model that is not active in this worker yet, or activate it on demand (LAZY_ACTIVATION)."""
+        active_model = None
+
+        # Optionally wait for an activation in progress
+        if wait_s is None:
+            wait_s = PREDICT_WAIT_FOR_ACTIVATION_S
+        deadline = time.monotonic() + wait_s
+        jobs = get_activation_job_manager()
+        if wait_s > 0:
+            jobs.wait_for_model(model_name, wait_s)
+            active_model = self.registry.get_active_model(model_name)
+
+        if not active_model:
+            # Multi-worker mode: the model may have just been activated by another worker.
+            # Only this model is activated, in the background; the sync applies the rest
+            synchronizer = get_state_synchronizer()
+            options = synchronizer.shared_options(model_name) if synchronizer else None
+            if options is not None:
+                job, _ = jobs.submit(model_name, options, local_only=True)
+                if job.wait(max(deadline - time.monotonic(), 0.0)):
+                    active_model = self.registry.get_active_model(model_name)
+        if not active_model and self.model_cache.lazy_activation and self.registry.is_available(model_name):
+            active_model = self._activate_lazily(model_name, max(deadline - time.monotonic(), 0.0))
+        if not active_model:
+            raise ModelNotActiveError(model_name, loading=jobs.is_loading(model_name))
+        return active_model
+
+    def _activate_lazily(self, model_name: str, wait_s: float) -> Optional[dict]:
+        """
+        Activate a model on its first request (joining an activation already in progress),
+        waiting up to wait_s for it. Raises ModelNotActiveError(loading=True) if it is still loading.
+        """
+        job, created = get_activation_job_manager().submit(model_name, self.model_cache.last_options(model_name))
+        if created:
+            self.model_cache.record_lazy_activation(model_name)
+            logger.info(f"[PREDICT] Activating '{model_name}' on demand (job {job.job_id})")
+        if not job.wait(wait_s):
+            raise ModelNotActiveError(model_name, loading=True)
+        return self.registry.get_active_model(model_name)
+
+    @contextmanager
+    def _use_model(self, model_name: str, wait_s: Optional[float]):
+        """The active model, counted as in flight on its instance until the request is done."""
+        while True:
+            active_model = self._get_active_model(model_name, wait_s)
+            # Refused by an instance a hot reload has just released: the registry has the new one
+            if active_model["inflight"].enter():
+                break
+        try:
+            yield active_model
+        finally:
+            active_model["inflight"].exit()
+
+    # === Inference ===
+
+    def predict(self, model_name: str, features: Any, wait_s: Optional[float] = None) -> Any:
+        """
+        Run inference for one input on an active model.
+        wait_s: how long to wait for a model that is being activated
+        (default: PREDICT_WAIT_FOR_ACTIVATION_S).
+        Raises ModelNotActiveError if the model is not active.
+        """
+        with self._use_model(model_name, wait_s) as active_model:
+            result_cache = active_model.get("result_cache")
+            if result_cache:
+                return result_cache.get_or_compute(features, lambda data: self._infer(active_model, data))
+            return self._infer(active_model, features)
+
+    def _infer(self, active_model: dict, features: Any) -> Any:
+        batcher = active_model.get("batcher")
+        if batcher:
+            # Coalesced with concurrent requests into one batched inference call
+            result = batcher.submit(features)
+        else:
+            result = active_model["predictor"](features)
+
+        return _unwrap(result)
+
+    def predict_batch(self, model_name: str, instances: List[Any], wait_s: Optional[float] = None) -> List[Any]:
+        """
+        Run batched inference for a list of inputs on an active model.
+        Returns one prediction per input, in order.
+        """
+        with self._use_model(model_name, wait_s) as active_model:
+            result_cache = active_model.get("result_cache")
+            if result_cache:
+                # Only the distinct inputs without a cached result are predicted
+                return result_cache.get_or_compute_batch(
+                    instances, lambda missing: self._infer_batch(active_model, missing)
+                )
+            return self._infer_batch(active_model, instances)
+
+    def _infer_batch(self, active_model: dict, instances: List[Any]) -> List[Any]:
+        predictor = active_model["predictor"]
+
+        results = []
+        # Bound the size of a single inference call for very large requests
+        for start in range(0, len(instances), PREDICT_BATCH_CHUNK_SIZE):
+            results.extend(predictor.predict_batch(instances[start:start + PREDICT_BATCH_CHUNK_SIZE]))
+
+        return [_unwrap(result) for result in results]
+
+    # === Publishing ===
+
+    def publish_prediction(self, model_name: str, encoded_prediction: bytes, key: str = "prediction") -> bool:
+        """
+        Publish a successful prediction to the prediction destination.
+        The prediction is passed already encoded (see serialization.dumps) so the
+        same bytes can also be used for the HTTP response.
+        """
+        message = encode_envelope(
+            {"model": model_name, "status": "success"},
+            {key: encoded_prediction}
+        )
+        return send_message_to_prediction_destination(message, model_name)
+
+    def _error_message(self, model_name: str, error: Exception) -> dict:
+        active_model = self.registry.get_active_model(model_name)
+        return {
+            "model": model_name,
+            "status": "error",
+            "error": str(error),
+            "expected_input": active_model["model_info"] if active_model else None
+        }
+
+    def publish_error(self, model_name: str, error: Exception) -> dict:
+        """Publish a prediction error to the prediction destination and return the error message."""
+        message = self._error_message(model_name, error)
+        send_message_to_prediction_destination(message, model_name)
+        return message
+
+    def process(self, model_name: str, features: Any) -> bool:
+        """
+        Predict and publish the result (or the error) for one consumed message.
+        Returns True if the message was handled: its prediction or its error was published.
+        False means it should be consumed again (publishing failed, or the model is still
+        being activated).
+        """
+        try:
+            prediction = self.predict(model_name, features)
+        except ModelNotActiveError as e:
+            logger.error(f"[PREDICT] {e}")
+            if e.loading:
+                return False
+            return send_message_to_prediction_destination(self._error_message(model_name, e), model_name)
+        except Exception as e:
+            logger.error(f"[PREDICT] Prediction failed for model '{model_name}': {e}")
+            return send_message_to_prediction_destination(self._error_message(model_name, e), model_name)
+
+        if not self.publish_prediction(model_name, dumps(prediction)):
+            logger.error(f"[PREDICT] Failed to forward prediction for model '{model_name}'")
+            return False
+
+        logger.info(f"[PREDICT] Prediction sent successfully for model '{model_name}'")
+        return True
+
+    def process_batch(self, model_name: str, inputs: List[Any]) -> int:
+        """
+        Predict and publish results for several consumed messages of one model
+        with a single batched inference call. Returns the number of messages handled
+        (see process): fewer than len(inputs) means the batch should be consumed again.
+        """
+        try:
+            predictions = self.predict_batch(model_name, inputs)
+        except ModelNotActiveError as e:
+            if e.loading:
+                logger.error(f"[PREDICT] {e} ({len(inputs)} message(s) to be consumed again)")
+                return 0
+            # Not being activated: answer every message with the error
+            logger.error(f"[PREDICT] {e} ({len(inputs)} message(s) answered with an error)")
+            message = self._error_message(model_name, e)
+            return sum(send_message_to_prediction_destination(message, model_name) for _ in inputs)
+        except Exception as e:
+            # Isolate the failing input(s): process each message on its own
+            logger.warning(f"[PREDICT] Batch of {len(inputs)} failed for model '{model_name}', "
+                           f"falling back to single predictions: {e}")
+            return sum(self.process(model_name, features) for features in inputs)
+
+        published = sum(self.publish_prediction(model_name, dumps(prediction)) for prediction in predictions)
+        if published < len(predictions):
+            logger.error(f"[PREDICT] Failed to forward {len(predictions) - published} "
+                         f"prediction(s) for model '{model_name}'")
+
+        logger.info(f"[PREDICT] {published} prediction(s) sent for model '{model_name}'")
+        return published
+
+
+# Global singleton instance
+_prediction_service = None
+
+
+def get_prediction_service() -> PredictionService:
+    """Get the global prediction service instance."""
+    global _prediction_service
+    if _prediction_service is None:
+        _prediction_service = PredictionService()
+    return _prediction_service
@@ -0,0 +1,165 @@
+"""
+Startup preload of the models that should be serving.
+
+The preload set is the models that were active when the server last stopped
+(recorded in ACTIVE_MODELS_FILE with their activation options) plus the models
+listed in PRELOAD_MODELS. They are activated in parallel by the activation job
+pool (ACTIVATION_WORKERS threads), highest priority first. The server reports
+ready (GET /ready) once every critical model is active and warmed up.
+"""
+import logging
+import os
+import threading
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Restore the models that were active when the server last stopped
+RESTORE_ACTIVE_MODELS = os.getenv("RESTORE_ACTIVE_MODELS", "true").lower() == "true"
+
+# Models to activate at startup: "name" or "name:priority", comma separated.
+# Listed models are critical: the server is not ready until they are active.
+PRELOAD_MODELS = os.getenv("PRELOAD_MODELS", "")
+
+
+def parse_preload_list(value: str) -> List[dict]:
+    """Parse PRELOAD_MODELS into [{"model_name", "priority"}] (raises ValueError)."""
+    entries = []
+    for item in value.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        model_name, _, priority = item.partition(":")
+        try:
+            entries.append({"model_name": model_name.strip(), "priority": int(priority or 0)})
+        except ValueError:
+            raise ValueError(f"Invalid priority in PRELOAD_MODELS entry '{item}'")
+    return entries
+
+
+def build_preload_plan(restored: dict, preload_list: List[dict]) -> List[dict]:
+    """
+    Merge the restored active models (model_name -> options) with the preload list.
+    Returns entries with model_name, options, priority, critical and source, highest
+    priority first (ties keep the order of the preload list, then the restored one).
+    """
+    plan = {}
+    for entry in preload_list:
+        plan[entry["model_name"]] = {
+            "model_name": entry["model_name"],
+            "options": dict(restored.get(entry["model_name"]) or {}),
+            "priority": entry["priority"],
+            "critical": True,
+            "source": "preload_list",
+        }
+
+    for model_name, options in restored.items():
+        if model_name in plan:
+            continue
+        options = options or {}
+        plan[model_name] = {
+            "model_name": model_name,
+            "options": dict(options),
+            "priority": int(options.get("priority", 0)),
+            "critical": bool(options.get("critical", False)),
+            "source": "restored",
+        }
+
+    return sorted(plan.values(), key=lambda entry: -entry["priority"])
+
+
+class ModelPreloader:
+    """Activates the preload set at startup and tracks readiness."""
+
+    def __init__(self, registry, job_manager, active_store):
+        self.registry = registry
+        self.job_manager = job_manager
+        self.active_store = active_store
+        self._entries = []  # plan entries, with the activation job of each model
+        self._started = False
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        """Submit the activation of every model of the preload set (once per process)."""
+        with self._lock:
+            if not self._started:
+                self._submit_all()
+                self._started = True
+
+    def _submit_all(self) -> None:
+        restored = {}
+        if RESTORE_ACTIVE_MODELS and self.active_store.enabled:
+            try:
+                restored = self.active_store.read()["active"]
+            except OSError as e:
+                logger.warning(f"[PRELOAD] Could not read active models from '{self.active_store.path}': {e}")
+
+        try:
+            preload_list = parse_preload_list(PRELOAD_MODELS)
+        except ValueError as e:
+            logger.error(f"[PRELOAD] {e}; ignoring PRELOAD_MODELS")
+            preload_list = []
+
+        entries = build_preload_plan(restored, preload_list)
+        if not entries:
+            logger.info("[PRELOAD] No models to preload")
+
+        for entry in entries:
+            model_name = entry["model_name"]
+            if not self.registry.is_available(model_name):
+                entry["job"] = None
+                entry["error"] = "Model not found in registry"
+                logger.warning(f"[PRELOAD] Skipping '{model_name}': not found in registry")
+            else:
+                entry["job"], _ = self.job_manager.submit(model_name, entry["options"])
+                logger.info(f"[PRELOAD] Queued '{model_name}' (priority {entry['priority']}, "
+                            f"{'critical' if entry['critical'] else 'optional'}, {entry['source']})")
+            self._entries.append(entry)
+
+    def _entry_status(self, entry: dict) -> dict:
+        job = entry["job"]
+        if job is None:
+            status, message = "failed", entry["error"]
+        else:
+            status, message = job.status, job.message
+            # Activated from the shared state by another worker's request in the meantime
+            if status != "succeeded" and self.registry.is_active(entry["model_name"]):
+                status = "succeeded"
+        return {
+            "model_name": entry["model_name"],
+            "priority": entry["priority"],
+            "critical": entry["critical"],
+            "source": entry["source"],
+            "status": status,
+            "message": message,
+            "job_id": job.job_id if job is not None else None,
+        }
+
+    def status(self) -> dict:
+        """Readiness: ready once preload started and every critical model is active."""
+        with self._lock:
+            entries = list(self._entries)
+            started = self._started
+        models = [self._entry_status(entry) for entry in entries]
+        pending = [m["model_name"] for m in models if m["critical"] and m["status"] != "succeeded"]
+        return {
+            "ready": started and not pending,
+            "critical_not_ready": pending,
+            "models": models,
+        }
+
+
+# Global singleton instance
+_preloader = None
+
+
+def get_preloader() -> Optional[ModelPreloader]:
+    """Get the global preloader (None until create_preloader() is called)."""
+    return _preloader
+
+
+def create_preloader(registry, job_manager, active_store) -> ModelPreloader:
+    """Create the global preloader."""
+    global _preloader
+    _preloader = ModelPreloader(registry, job_manager, active_store)
+    return _preloader
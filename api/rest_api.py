@@ -8,18 +8,28 @@ import signal
 import sys
 import json
 import logging
+import numpy as np
 
 # Local imports - new modular structure
 from api.model_registry import get_registry
 from api.model_lifecycle import get_lifecycle_manager
+from api.activation_jobs import get_activation_job_manager, options_ignored, ACTIVATION_WAIT_TIMEOUT
+from api.prediction_service import get_prediction_service, ModelNotActiveError
 from api.webhook_handler import get_webhook_handler
 from api.filesystem_watcher import get_filesystem_monitor
 from api.github_client import list_github_models
-import model_handlers.model_detector as model_detector
-from utils import send_message_to_prediction_destination
+from api.model_workers import stop_all_model_processes
+from api.shared_state import (get_shared_state, get_active_model_store, create_state_synchronizer,
+                              get_state_synchronizer)
+from api.preload import create_preloader, get_preloader
+from api.model_cache import get_model_cache, model_footprint
 from messaging.kafka_consumer import start_kafka_consumer, stop_kafka_consumer
-from messaging.mqtt_consumer import start_mqtt_consumer, stop_mqtt_consumer
+from messaging.mqtt_consumer import start_mqtt_consumer, stop_mqtt_consumer, get_mqtt_consumer_stats
+from messaging.kafka_producer import close_kafka_producer, get_kafka_producer_stats
 import tf_serving_manager
+from utils import process_memory
+from serialization import (dumps, encode_envelope, decode_body, encode_body, available_mimetypes,
+                           UnsupportedFormatError, JSON_MIMETYPE)
 
 # Configuration
 API_HOST = os.getenv("API_HOST", "localhost")
@@ -50,51 +60,143 @@ api_url = f"http://{API_HOST}:{PORT}"
 registry = get_registry()
 lifecycle_manager = get_lifecycle_manager(MODELS_PATH)
 webhook_handler = get_webhook_handler()
+prediction_service = get_prediction_service()
+activation_jobs = get_activation_job_manager()
 
 
 # ============================================================================
 # INITIALIZATION
 # ============================================================================
 
+_services_started = False
+
+
 def initialize_models():
     """Initialize the model registry from the configured source."""
     registry.clear_all()
     
+    for model_name, metadata in _discover_models().items():
+        registry.register_model(model_name, metadata)
+
+
+def refresh_models():
+    """
+    Re-discover available models without touching active ones.
+    Used by worker processes when another worker reports a catalog change.
+    """
+    discovered = _discover_models()
+    
+    for model_name, metadata in discovered.items():
+        if registry.get_model_metadata(model_name) != metadata:
+            registry.register_model(model_name, metadata)
+    
+    for model_name in registry.get_all_model_names() - discovered.keys():
+        if not registry.is_active(model_name):
+            registry.unregister_model(model_name)
+
+
+def _discover_models():
+    """List available models (model_name -> metadata) from the configured source."""
     if MODEL_SOURCE == "github":
-        _initialize_from_github()
-    else:
-        _initialize_from_filesystem()
+        return _discover_from_github()
+    return _discover_from_filesystem()
 
 
-def _initialize_from_github():
-    """Load models from GitHub repository."""
+def _discover_from_github():
+    """List models from GitHub repository."""
     try:
         github_entries = list_github_models()
-        for model_name, entry in github_entries.items():
-            registry.register_model(model_name, entry)
         logger.info(f"[INIT] Loaded {len(github_entries)} models from GitHub")
+        return github_entries
     except Exception as e:
         logger.error(f"[INIT] Failed to list GitHub models: {e}")
+        return {}
 
 
-def _initialize_from_filesystem():
-    """Load models from local filesystem."""
+def _discover_from_filesystem():
+    """List models from local filesystem."""
     if not os.path.exists(MODELS_PATH):
         logger.warning(f"[INIT] Models path does not exist: {MODELS_PATH}")
-        return
+        return {}
     
+    models = {}
     for filename in os.listdir(MODELS_PATH):
         file_path = os.path.join(MODELS_PATH, filename)
         if os.path.isdir(file_path) or os.path.isfile(file_path):
             model_name = os.path.splitext(filename)[0]
-            metadata = {
+            models[model_name] = {
                 "source": "local_filesystem",
                 "model_name": model_name,
                 "model_path": file_path
             }
-            registry.register_model(model_name, metadata)
     
-    logger.info(f"[INIT] Loaded {len(registry.list_available_models())} models from filesystem")
+    logger.info(f"[INIT] Loaded {len(models)} models from filesystem")
+    return models
+
+
+def start_consumers():
+    """Start the messaging consumer for the configured input source."""
+    if INPUT_DATA_SOURCE == "kafka":
+        start_kafka_consumer()
+        logger.info("[STARTUP] Kafka consumer started")
+    elif INPUT_DATA_SOURCE == "mqtt":
+        start_mqtt_consumer()
+        logger.info("[STARTUP] MQTT consumer started")
+
+
+def start_watcher_and_consumers():
+    """
+    Start the filesystem monitor (if using local models) and the messaging consumers.
+    Run by one process only: the watcher records catalog changes and reloads in the
+    shared state, from which the other workers apply them.
+    """
+    if MODEL_SOURCE == "local_filesystem":
+        fs_monitor = get_filesystem_monitor(MODELS_PATH)
+        fs_monitor.start()
+    
+    start_consumers()
+
+
+def start_services():
+    """
+    Initialize this process: discover models, start the filesystem monitor and the consumers,
+    and preload the models that were active before the restart or are listed in PRELOAD_MODELS.
+    
+    Every worker of a multi-worker deployment (SHARED_STATE_FILE set) calls this after
+    forking. Workers then keep their registries in sync through the shared state file,
+    and only the elected worker runs the filesystem monitor and the messaging consumers.
+    """
+    global _services_started
+    if _services_started:
+        return
+    _services_started = True
+    
+    logger.info(f"[STARTUP] Starting ML Model Serving Tool (pid {os.getpid()})")
+    logger.info(f"[STARTUP] Model source: {MODEL_SOURCE}")
+    logger.info(f"[STARTUP] Models path: {MODELS_PATH}")
+    
+    # Initialize model registry
+    initialize_models()
+    
+    # Start filesystem monitoring and messaging consumers (in one worker only when sharing state)
+    if get_shared_state().enabled:
+        synchronizer = create_state_synchronizer(
+            registry, lifecycle_manager,
+            refresh_catalog=refresh_models,
+            on_elected=start_watcher_and_consumers
+        )
+        synchronizer.start()
+    else:
+        start_watcher_and_consumers()
+    
+    # Activate the preload set in the background (every worker loads its own copy)
+    create_preloader(registry, activation_jobs, get_active_model_store()).start()
+
+
+def create_app():
+    """Application factory for WSGI servers: initializes this worker and returns the Flask app."""
+    start_services()
+    return app
 
 
 # ============================================================================
@@ -134,16 +236,68 @@ def model_status(model_name):
 
 @app.route('/activate/<model_name>', methods=['POST'])
 def activate_model(model_name):
-    """Activate a model to make it available for predictions."""
-    success, message, model_data = lifecycle_manager.activate_model(model_name)
+    """
+    Activate a model to make it available for predictions.
+    An optional JSON body carries per-model options, e.g.
+    {"batching": {"max_batch_size": 32, "max_wait_ms": 5}}
     
-    if not success:
-        return jsonify({"error": message}), 400
+    The model is loaded by a background job: the response (202) carries the job id,
+    whose progress is reported by /jobs/<job_id>. A request for a model that is
+    already being activated joins that job. With ?wait=true the response is sent
+    once the activation has finished.
+    """
+    options = request.get_json(silent=True) or {}
+    
+    if not registry.is_available(model_name):
+        return jsonify({"error": "Model not found in registry"}), 400
+    if registry.is_active(model_name):
+        return jsonify({
+            "message": "Model already active",
+            "predict_endpoint": f"/predict/{model_name}"
+        })
+    
+    job, created = activation_jobs.submit(model_name, options)
+    # A joined job keeps the options it was submitted with
+    ignored = not created and options_ignored(job, options)
+    
+    if request.args.get("wait", "false").lower() == "true":
+        job.wait(ACTIVATION_WAIT_TIMEOUT)
+        if job.status == "failed":
+            return jsonify({"error": job.message, "job_id": job.job_id, "options_ignored": ignored}), 400
+        if job.status == "succeeded":
+            return jsonify({
+                "message": job.message,
+                "job_id": job.job_id,
+                "options_ignored": ignored,
+                "predict_endpoint": f"/predict/{model_name}"
+            })
     
     return jsonify({
-        "message": message,
+        "job_id": job.job_id,
+        "model_name": model_name,
+        "status": job.status,
+        "deduplicated": not created,
+        "options_ignored": ignored,
+        "status_endpoint": f"/jobs/{job.job_id}",
         "predict_endpoint": f"/predict/{model_name}"
-    })
+    }), 202
+
+
+@app.route('/jobs')
+def list_jobs():
+    """List recent activation jobs, newest first."""
+    return jsonify(activation_jobs.list_jobs())
+
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    """Get the status and phase timings of an activation job."""
+    job = activation_jobs.get_job(job_id)
+    
+    if not job:
+        return jsonify({"error": f"Job '{job_id}' not found"}), 404
+    
+    return jsonify(job)
 
 
 @app.route('/deactivate/<model_name>', methods=['POST'])
@@ -154,57 +308,165 @@ def deactivate_model(model_name):
     return jsonify({"message": message})
 
 
+@app.route('/stats')
+def service_stats():
+    """Get service-wide statistics (messaging pipelines)."""
+    return jsonify({
+        "kafka_producer": get_kafka_producer_stats(),
+        "mqtt_consumer": get_mqtt_consumer_stats() if INPUT_DATA_SOURCE == "mqtt" else None,
+        "tf_serving_sessions": tf_serving_manager.get_session_stats(),
+        "model_cache": get_model_cache().stats()
+    })
+
+
+@app.route('/stats/<model_name>')
+def model_stats(model_name):
+    """Get serving statistics (e.g. micro-batching) for an active model."""
+    active_model = registry.get_active_model(model_name)
+    
+    if not active_model:
+        return jsonify({"error": f"Model '{model_name}' not active"}), 404
+    
+    batcher = active_model.get("batcher")
+    result_cache = active_model.get("result_cache")
+    process_pool = active_model.get("process_pool")
+    predictor = active_model["predictor"]
+    
+    return jsonify({
+        "model_name": model_name,
+        "backend": active_model.get("backend"),
+        "options": active_model.get("options", {}),
+        "batching": batcher.stats() if batcher else None,
+        "result_cache": result_cache.stats() if result_cache else None,
+        "runtime": active_model.get("runtime"),
+        "warmup": active_model.get("warmup"),
+        "reload": active_model.get("reload"),
+        "process_workers": process_pool.stats() if process_pool else None,
+        "memory": {
+            "process": process_memory(),
+            "at_load": active_model.get("load_memory"),
+            "model": predictor.backend.memory(predictor.model),
+            "footprint_mb": model_footprint(active_model),
+            "pinned": get_model_cache().is_pinned(model_name, active_model.get("options"))
+        }
+    })
+
+
 # ============================================================================
 # API ENDPOINTS - Predictions
 # ============================================================================
 
+def _read_payload(field):
+    """
+    Decode the request body according to its Content-Type.
+    JSON by default; binary tensor bodies (.npy, msgpack, Arrow) are placed under 'field'.
+    """
+    if not request.mimetype or request.is_json:
+        return request.get_json(silent=True) or {}
+    
+    # bytearray keeps decoded arrays writable (shared with torch.from_numpy)
+    return decode_body(request.mimetype, bytearray(request.get_data(cache=False)), field)
+
+
+def _prediction_response(field, prediction, encoded):
+    """
+    Build the success response in the format negotiated through the Accept header.
+    Called before the prediction is published: a result the format cannot carry
+    (e.g. a multi-output dict as .npy) gets a 406 instead of a 500 after publishing.
+    """
+    mimetype = request.accept_mimetypes.best_match(available_mimetypes(), default=JSON_MIMETYPE)
+    fields = {"status": "sent", "destination": PREDICTION_DESTINATION}
+    
+    if mimetype == JSON_MIMETYPE:
+        return Response(encode_envelope(fields, {field: encoded}), mimetype=JSON_MIMETYPE)
+    
+    try:
+        body = encode_body(mimetype, {**fields, field: prediction}, field)
+    except (TypeError, ValueError) as e:
+        response = jsonify({"error": f"The {field} cannot be encoded as {mimetype}: {e}"})
+        response.status_code = 406
+        return response
+    return Response(body, mimetype=mimetype)
+
+
+def _not_active_response(error):
+    """404 for an inactive model, 503 while it is being activated (retry later)."""
+    if error.loading:
+        return jsonify({"error": str(error)}), 503, {"Retry-After": "1"}
+    return jsonify({"error": str(error)}), 404
+
+
 @app.route("/predict/<model_name>", methods=["POST"])
 def predict(model_name):
     """Make a prediction using the specified active model."""
-    active_model = registry.get_active_model(model_name)
-    
-    if not active_model:
-        return jsonify({"error": f"Model '{model_name}' not active"}), 404
+    try:
+        payload = _read_payload("input")
+    except UnsupportedFormatError as e:
+        return jsonify({"error": str(e)}), 415
+    except Exception as e:
+        return jsonify({"error": f"Invalid request body: {e}"}), 400
     
-    payload = request.get_json(silent=True) or {}
     features = payload.get("input")
     
     try:
-        result = model_detector.predict(
-            active_model["model_path"],
-            active_model["model"],
-            features
-        )
-        
-        # Unwrap TF Serving result if needed
-        if isinstance(result, dict) and "predictions" in result:
-            result = result["predictions"]
-        
-        response_payload = {
-            "model": model_name,
-            "status": "success",
-            "prediction": result
-        }
-        
-        if not send_message_to_prediction_destination(response_payload, model_name):
-            return jsonify({"error": "Failed to forward prediction"}), 500
-        
-        return jsonify({
-            "status": "sent",
-            "destination": PREDICTION_DESTINATION,
-            "prediction": result
-        })
+        result = prediction_service.predict(model_name, features, request.args.get("wait_s", type=float))
+    except ModelNotActiveError as e:
+        return _not_active_response(e)
+    except Exception as e:
+        error_message = prediction_service.publish_error(model_name, e)
+        return Response(dumps(error_message), status=400, mimetype=JSON_MIMETYPE)
+    
+    # Encode once, reuse the bytes for the outbound message and the response
+    encoded = dumps(result)
+    response = _prediction_response("prediction", result, encoded)
+    if response.status_code != 200:
+        return response
     
+    if not prediction_service.publish_prediction(model_name, encoded):
+        return jsonify({"error": "Failed to forward prediction"}), 500
+    
+    return response
+
+
+@app.route("/predict/<model_name>/batch", methods=["POST"])
+def predict_batch(model_name):
+    """
+    Make predictions for a list of instances in batched inference calls.
+    Each instance has the same format as the 'input' of /predict/<model_name>.
+    """
+    try:
+        payload = _read_payload("instances")
+    except UnsupportedFormatError as e:
+        return jsonify({"error": str(e)}), 415
     except Exception as e:
-        error_message = {
-            "model": model_name,
-            "status": "error",
-            "error": str(e),
-            "expected_input": active_model["model_info"]
-        }
-        
-        send_message_to_prediction_destination(error_message, model_name)
-        return jsonify(error_message), 400
+        return jsonify({"error": f"Invalid request body: {e}"}), 400
+    
+    instances = payload.get("instances")
+    
+    # A 0-d array (e.g. a scalar .npy body) has no instances. Lists are not converted:
+    # instances may carry different numbers of rows
+    if (not isinstance(instances, (list, np.ndarray))
+            or (isinstance(instances, np.ndarray) and instances.ndim == 0)
+            or len(instances) == 0):
+        return jsonify({"error": "Request body must contain a non-empty 'instances' list"}), 400
+    
+    try:
+        predictions = prediction_service.predict_batch(model_name, instances, request.args.get("wait_s", type=float))
+    except ModelNotActiveError as e:
+        return _not_active_response(e)
+    except Exception as e:
+        error_message = prediction_service.publish_error(model_name, e)
+        return Response(dumps(error_message), status=400, mimetype=JSON_MIMETYPE)
+    
+    encoded = dumps(predictions)
+    response = _prediction_response("predictions", predictions, encoded)
+    if response.status_code != 200:
+        return response
+    
+    if not prediction_service.publish_prediction(model_name, encoded, key="predictions"):
+        return jsonify({"error": "Failed to forward predictions"}), 500
+    
+    return response
 
 
 # ============================================================================
@@ -241,6 +503,17 @@ def test_endpoint():
     return 'The Model Server is ALIVE!'
 
 
+@app.route('/ready')
+def readiness_endpoint():
+    """Readiness probe: 200 once every critical preloaded model is active and warmed up, else 503."""
+    preloader = get_preloader()
+    if preloader is None:
+        return jsonify({"ready": False, "critical_not_ready": [], "models": []}), 503
+    
+    status = preloader.status()
+    return jsonify(status), 200 if status["ready"] else 503
+
+
 @app.route('/help')
 def help_endpoint():
     """Provide information about active models and their endpoints."""
@@ -298,10 +571,19 @@ def help_ui():
 # LIFECYCLE MANAGEMENT
 # ============================================================================
 
-def cleanup(signum, frame):
-    """Cleanup handler for graceful shutdown."""
+def shutdown_services(stop_containers=True):
+    """
+    Stop this process's consumers and background threads and flush outbound messages.
+    TF Serving containers are shared by all workers, so a worker exiting on its own
+    passes stop_containers=False and the WSGI master removes them on exit.
+    """
     logger.info("[SHUTDOWN] Starting cleanup...")
     
+    # Stop syncing with the other workers
+    synchronizer = get_state_synchronizer()
+    if synchronizer:
+        synchronizer.stop()
+    
     # Stop messaging consumers
     if INPUT_DATA_SOURCE == "kafka":
         try:
@@ -316,22 +598,31 @@ def cleanup(signum, frame):
         except Exception as e:
             logger.error(f"[SHUTDOWN] Failed to stop MQTT consumer: {e}")
     
-    # Stop all TF Serving containers
-    logger.info("[SHUTDOWN] Stopping TF Serving containers...")
-    for container in tf_serving_manager.list_managed_containers():
+    # Stop starting new activations
+    activation_jobs.shutdown()
+    
+    # Stop isolated model worker processes
+    stop_all_model_processes()
+    
+    # Deliver outstanding prediction messages
+    if PREDICTION_DESTINATION == "kafka":
         try:
-            container.remove(force=True)
-            logger.info(f"[SHUTDOWN] Stopped {container.name}")
+            close_kafka_producer()
         except Exception as e:
-            logger.error(f"[SHUTDOWN] Failed to stop {container.name}: {e}")
+            logger.error(f"[SHUTDOWN] Failed to flush Kafka producer: {e}")
+    
+    # Stop all TF Serving containers
+    if stop_containers:
+        logger.info("[SHUTDOWN] Stopping TF Serving containers...")
+        tf_serving_manager.stop_all_containers()
     
     logger.info("[SHUTDOWN] Cleanup complete")
-    sys.exit(0)
 
 
-# Register signal handlers
-signal.signal(signal.SIGTERM, cleanup)
-signal.signal(signal.SIGINT, cleanup)
+def cleanup(signum, frame):
+    """Signal handler for graceful shutdown of the development server."""
+    shutdown_services()
+    sys.exit(0)
 
 
 # ============================================================================
@@ -339,25 +630,11 @@ signal.signal(signal.SIGINT, cleanup)
 # ============================================================================
 
 if __name__ == '__main__':
-    logger.info(f"[STARTUP] Starting ML Model Serving Tool")
-    logger.info(f"[STARTUP] Model source: {MODEL_SOURCE}")
-    logger.info(f"[STARTUP] Models path: {MODELS_PATH}")
+    # Development server (single process). For production use gunicorn: see wsgi.py
+    signal.signal(signal.SIGTERM, cleanup)
+    signal.signal(signal.SIGINT, cleanup)
     
-    # Initialize model registry
-    initialize_models()
-    
-    # Start filesystem monitoring (if using local models)
-    if MODEL_SOURCE == "local_filesystem":
-        fs_monitor = get_filesystem_monitor(MODELS_PATH)
-        fs_monitor.start()
-    
-    # Start messaging consumers
-    if INPUT_DATA_SOURCE == "kafka":
-        start_kafka_consumer()
-        logger.info("[STARTUP] Kafka consumer started")
-    elif INPUT_DATA_SOURCE == "mqtt":
-        start_mqtt_consumer()
-        logger.info("[STARTUP] MQTT consumer started")
+    start_services()
     
     # Start Flask server
     logger.info(f"[STARTUP] Starting Flask server on {API_HOST}:{PORT}")
@@ -0,0 +1,262 @@
+"""
+Per-model cache of prediction results.
+
+Inputs are canonicalized (numeric lists and arrays by value, dicts by sorted keys) and
+hashed together with a fingerprint of the loaded model version. Entries are evicted
+least-recently-used beyond max_entries and expire after ttl_s. Concurrent identical
+requests are single-flighted: one runs inference, the others wait for its result.
+The cache is invalidated when its model is deactivated or reloaded.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "1024"))
+DEFAULT_TTL_S = float(os.getenv("RESULT_CACHE_TTL_S", "300"))
+
+
+def model_fingerprint(model_path: str, options: dict) -> str:
+    """Identify a model version: the model files' sizes and modification times plus the serving options."""
+    digest = hashlib.blake2b(digest_size=16)
+    paths = [model_path]
+    if os.path.isdir(model_path):
+        paths = sorted(os.path.join(root, name) for root, _, files in os.walk(model_path) for name in files)
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            digest.update(f"{path}:{stat.st_size}:{stat.st_mtime_ns}".encode("utf-8"))
+        except OSError:
+            digest.update(path.encode("utf-8"))
+    digest.update(json.dumps(options, sort_keys=True, default=str).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _canonical(data: Any, digest) -> None:
+    """Feed a canonical encoding of an input into digest (raises TypeError if not hashable)."""
+    if isinstance(data, dict):
+        digest.update(b"{")
+        for key in sorted(data, key=str):
+            digest.update(str(key).encode("utf-8") + b":")
+            _canonical(data[key], digest)
+        digest.update(b"}")
+        return
+
+    if isinstance(data, (list, tuple, np.ndarray, int, float, np.generic)) and not isinstance(data, bool):
+        try:
+            array = np.asarray(data)
+        except ValueError:  # ragged nested lists
+            array = None
+        # The same numbers hash alike whether sent as JSON lists or as binary arrays
+        if array is not None and array.dtype.kind in "biuf":
+            array = np.ascontiguousarray(array, dtype=np.float64 if array.dtype.kind == "f" else np.int64)
+            digest.update(f"{array.dtype.kind}{array.shape}".encode("utf-8"))
+            digest.update(array.data)
+            return
+
+    digest.update(json.dumps(data, sort_keys=True, separators=(",", ":")).encode("utf-8"))
+
+
+class ResultCache:
+    """Size-bounded LRU cache of one model's prediction results, with TTL and single-flight."""
+
+    def __init__(self, model_name: str, fingerprint: str,
+                 max_entries: int = DEFAULT_MAX_ENTRIES,
+                 ttl_s: float = DEFAULT_TTL_S):
+        if max_entries < 1:
+            raise ValueError("max_entries must be at least 1")
+        if ttl_s <= 0:
+            raise ValueError("ttl_s must be positive")
+
+        self.model_name = model_name
+        self.fingerprint = fingerprint
+        self.max_entries = int(max_entries)
+        self.ttl_s = float(ttl_s)
+
+        self._entries = OrderedDict()  # key -> (result, expires_at)
+        self._inflight = {}            # key -> Future of the request computing it
+        self._generation = 0           # bumped on invalidation: in-flight results are then not stored
+        self._lock = threading.Lock()
+
+        # Stats
+        self._hits = 0
+        self._misses = 0
+        self._coalesced = 0
+        self._evictions = 0
+        self._expirations = 0
+        self._uncacheable = 0
+        self._invalidations = 0
+
+    def key(self, data: Any) -> Optional[str]:
+        """Cache key of an input, or None if the input cannot be canonicalized."""
+        digest = hashlib.blake2b(self.fingerprint.encode("utf-8"), digest_size=16)
+        try:
+            _canonical(data, digest)
+        except (TypeError, ValueError):
+            return None
+        return digest.hexdigest()
+
+    def _lookup(self, key: str, now: float):
+        """Return (True, result) for a live entry. Call with the lock held."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return False, None
+        result, expires_at = entry
+        if expires_at <= now:
+            del self._entries[key]
+            self._expirations += 1
+            return False, None
+        self._entries.move_to_end(key)
+        return True, result
+
+    def _store(self, key: str, result: Any, generation: int) -> None:
+        """Call with the lock held."""
+        if generation != self._generation:
+            return
+        self._entries[key] = (result, time.monotonic() + self.ttl_s)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._evictions += 1
+
+    def get_or_compute(self, data: Any, compute: Callable[[Any], Any]) -> Any:
+        """Return the cached result for data, or run compute(data) once for all concurrent callers."""
+        key = self.key(data)
+        if key is None:
+            with self._lock:
+                self._uncacheable += 1
+            return compute(data)
+
+        with self._lock:
+            found, result = self._lookup(key, time.monotonic())
+            if found:
+                self._hits += 1
+                return result
+
+            future = self._inflight.get(key)
+            if future is not None:
+                self._coalesced += 1
+                owner = False
+            else:
+                future = Future()
+                self._inflight[key] = future
+                self._misses += 1
+                owner = True
+            generation = self._generation
+
+        if not owner:
+            return future.result()
+
+        try:
+            result = compute(data)
+        except Exception as e:
+            # Errors are not cached: waiting callers get the error, later ones retry
+            with self._lock:
+                self._inflight.pop(key, None)
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            self._store(key, result, generation)
+            self._inflight.pop(key, None)
+        future.set_result(result)
+        return result
+
+    def get_or_compute_batch(self, instances: List[Any],
+                             compute_batch: Callable[[List[Any]], List[Any]]) -> List[Any]:
+        """
+        Batch variant: cached instances are answered from the cache and the distinct
+        missing ones run in a single compute_batch() call.
+        """
+        keys = [self.key(data) for data in instances]
+        results = [None] * len(instances)
+        missing = {}  # key (or index for uncacheable inputs) -> indices
+
+        with self._lock:
+            now = time.monotonic()
+            for index, key in enumerate(keys):
+                if key is None:
+                    self._uncacheable += 1
+                    missing[index] = [index]
+                    continue
+                found, result = self._lookup(key, now)
+                if found:
+                    self._hits += 1
+                    results[index] = result
+                elif key in missing:
+                    self._coalesced += 1
+                    missing[key].append(index)
+                else:
+                    self._misses += 1
+                    missing[key] = [index]
+            generation = self._generation
+
+        if not missing:
+            return results
+
+        computed = compute_batch([instances[indices[0]] for indices in missing.values()])
+        if len(computed) != len(missing):
+            raise ValueError(f"Expected {len(missing)} results, got {len(computed)}")
+
+        with self._lock:
+            for (key, indices), result in zip(missing.items(), computed):
+                if isinstance(key, str):
+                    self._store(key, result, generation)
+                for index in indices:
+                    results[index] = result
+        return results
+
+    def invalidate(self) -> None:
+        """Drop every entry (the model was deactivated or reloaded)."""
+        with self._lock:
+            self._entries.clear()
+            self._generation += 1
+            self._invalidations += 1
+        logger.info(f"[CACHE] Invalidated result cache of '{self.model_name}'")
+
+    def stats(self) -> dict:
+        """Return cache configuration and counters."""
+        with self._lock:
+            lookups = self._hits + self._misses + self._coalesced
+            return {
+                "max_entries": self.max_entries,
+                "ttl_s": self.ttl_s,
+                "entries": len(self._entries),
+                "hits": self._hits,
+                "misses": self._misses,
+                "coalesced": self._coalesced,
+                "evictions": self._evictions,
+                "expirations": self._expirations,
+                "uncacheable": self._uncacheable,
+                "invalidations": self._invalidations,
+                "hit_rate": round((self._hits + self._coalesced) / lookups, 3) if lookups else 0.0,
+            }
+
+
+def create_result_cache(model_name: str, config: Any, fingerprint: str) -> Optional[ResultCache]:
+    """
+    Build a result cache from a model's 'result_cache' option.
+    Accepts True (defaults), a dict with max_entries/ttl_s, or a falsy value (disabled).
+    """
+    if not config:
+        return None
+
+    settings = config if isinstance(config, dict) else {}
+    cache = ResultCache(
+        model_name,
+        fingerprint,
+        max_entries=int(settings.get("max_entries", DEFAULT_MAX_ENTRIES)),
+        ttl_s=float(settings.get("ttl_s", DEFAULT_TTL_S)),
+    )
+    logger.info(f"[CACHE] Result cache enabled for '{model_name}' "
+                f"(max_entries={cache.max_entries}, ttl_s={cache.ttl_s})")
+    return cache
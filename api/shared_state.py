@@ -0,0 +1,335 @@
+"""
+Model state shared by the worker processes of a multi-worker deployment.
+
+Every worker has its own in-memory ModelRegistry and its own loaded models.
+Activations, deactivations, hot reloads and catalog changes are recorded in a JSON state
+file; a background thread in each worker reconciles its registry with that
+file, so a model activated through one worker becomes active in all of them.
+The thread also elects the one worker that runs the filesystem monitor and the
+messaging consumers.
+
+Disabled (single-process mode) when SHARED_STATE_FILE is empty.
+"""
+import fcntl
+import json
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+SHARED_STATE_FILE = os.getenv("SHARED_STATE_FILE", "")
+SHARED_STATE_SYNC_INTERVAL = float(os.getenv("SHARED_STATE_SYNC_INTERVAL", "1.0"))
+
+# Durable record of the active models and their options, restored at startup (empty = disabled)
+ACTIVE_MODELS_FILE = os.getenv("ACTIVE_MODELS_FILE", "/var/lib/model_server/active_models.json")
+
+
+ACTIVATION_JOB_HISTORY = int(os.getenv("ACTIVATION_JOB_HISTORY", "100"))
+
+
+def _empty_state() -> dict:
+    return {"version": 0, "catalog_version": 0, "active": {}, "jobs": {}, "reloads": {}}
+
+
+class SharedModelState:
+    """
+    The desired set of active models (model_name -> activation options), stored in
+    a JSON file guarded by an exclusive file lock. Every change increments "version".
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock_path = f"{path}.lock"
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    @contextmanager
+    def _locked(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(self._lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _load(self) -> dict:
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return _empty_state()
+
+    def _save(self, state: dict) -> None:
+        # Write-then-rename so readers never see a partial file
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.path)
+
+    def _update(self, mutate: Callable[[dict], bool]) -> None:
+        if not self.enabled:
+            return
+        with self._locked():
+            state = self._load()
+            if mutate(state):
+                state["version"] += 1
+                self._save(state)
+
+    def read(self) -> dict:
+        """Get the current shared state."""
+        if not self.enabled:
+            return _empty_state()
+        with self._locked():
+            return self._load()
+
+    def reset(self) -> None:
+        """Start from an empty state (called once, before the workers start)."""
+        if not self.enabled:
+            return
+        with self._locked():
+            self._save(_empty_state())
+        logger.info(f"[STATE] Reset shared model state '{self.path}'")
+
+    def mark_active(self, model_name: str, options: dict) -> None:
+        def mutate(state):
+            if state["active"].get(model_name) == options:
+                return False
+            state["active"][model_name] = options
+            return True
+        self._update(mutate)
+
+    def mark_inactive(self, model_name: str) -> None:
+        def mutate(state):
+            return state["active"].pop(model_name, None) is not None
+        self._update(mutate)
+
+    def record_job(self, job: dict) -> None:
+        """
+        Publish an activation job's status so any worker can report it.
+        Does not change "version": jobs are not part of the desired model state.
+        """
+        if not self.enabled:
+            return
+        with self._locked():
+            state = self._load()
+            jobs = state.setdefault("jobs", {})
+            jobs.pop(job["job_id"], None)
+            jobs[job["job_id"]] = job
+            # Oldest first (insertion order): keep the most recent ones
+            for job_id in list(jobs)[:max(0, len(jobs) - ACTIVATION_JOB_HISTORY)]:
+                del jobs[job_id]
+            self._save(state)
+
+    def get_job(self, job_id: str) -> Optional[dict]:
+        return self.read().get("jobs", {}).get(job_id)
+
+    def list_jobs(self) -> list:
+        return list(self.read().get("jobs", {}).values())
+
+    def bump_reload(self, model_name: str) -> int:
+        """Record that a model was hot-reloaded, so the other workers reload it too. Returns its revision."""
+        revision = 0
+
+        def mutate(state):
+            nonlocal revision
+            reloads = state.setdefault("reloads", {})
+            reloads[model_name] = revision = reloads.get(model_name, 0) + 1
+            return True
+
+        self._update(mutate)
+        return revision
+
+    def bump_catalog(self) -> None:
+        """Signal that the set of available models changed."""
+        def mutate(state):
+            state["catalog_version"] += 1
+            return True
+        self._update(mutate)
+
+
+def try_acquire_lock(path: str):
+    """
+    Take a non-blocking exclusive lock on path.
+    Returns the open lock file (keep it open to hold the lock), or None if another process holds it.
+    The lock is released by the OS when the holding process exits.
+    """
+    lock_file = open(path, "a")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock_file.close()
+        return None
+    return lock_file
+
+
+class StateSynchronizer:
+    """
+    Background thread reconciling this worker's registry with the shared state.
+    Models are activated/deactivated locally only: TF Serving containers and the
+    shared state itself are owned by the worker that handled the original request.
+    """
+
+    def __init__(self, shared_state: SharedModelState, registry, lifecycle,
+                 refresh_catalog: Callable[[], None],
+                 on_elected: Optional[Callable[[], None]] = None,
+                 interval: float = SHARED_STATE_SYNC_INTERVAL):
+        self.shared_state = shared_state
+        self.registry = registry
+        self.lifecycle = lifecycle
+        self.refresh_catalog = refresh_catalog
+        self.on_elected = on_elected
+        self.interval = interval
+
+        self._version = None
+        self._catalog_version = None
+        self._applied = {}
+        self._reloads = {}
+        self._sync_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._leader_lock = None
+
+    @property
+    def is_leader(self) -> bool:
+        return self._leader_lock is not None
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        # The catalog was just discovered and the models are loaded from their current files
+        state = self.shared_state.read()
+        self._catalog_version = state["catalog_version"]
+        self._reloads = dict(state.get("reloads", {}))
+        self._tick()
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._loop, name="state-sync", daemon=True)
+        self._thread.start()
+        logger.info(f"[STATE] Syncing with '{self.shared_state.path}' every {self.interval}s (pid {os.getpid()})")
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _loop(self) -> None:
+        while not self._stop_event.wait(self.interval):
+            self._tick()
+
+    def _tick(self) -> None:
+        try:
+            self._elect()
+            self.sync()
+        except Exception as e:
+            logger.error(f"[STATE] Sync failed: {e}")
+
+    def _elect(self) -> None:
+        # Retried every tick, so another worker takes over if the leader dies
+        if self.on_elected is None or self.is_leader:
+            return
+        self._leader_lock = try_acquire_lock(f"{self.shared_state.path}.leader.lock")
+        if self.is_leader:
+            logger.info(f"[STATE] Worker {os.getpid()} elected to run the watcher and messaging consumers")
+            self.on_elected()
+
+    def sync(self, force: bool = False) -> None:
+        """Apply the shared state to the local registry if it changed since the last sync."""
+        state = self.shared_state.read()
+
+        with self._sync_lock:
+            if not force and state["version"] == self._version:
+                return
+
+            desired = state["active"]
+
+            # Only undo what was applied from the shared state: a model this worker has
+            # just activated may not be recorded yet
+            for model_name, options in self._applied.items():
+                if desired.get(model_name) != options:
+                    self.lifecycle.deactivate_model(model_name, local_only=True)
+                    if model_name not in desired:
+                        self.lifecycle.model_cache.forget_eviction(model_name)
+
+            # After deactivating, so removed models can be unregistered
+            if state["catalog_version"] != self._catalog_version:
+                self.refresh_catalog()
+                self._catalog_version = state["catalog_version"]
+
+            for model_name, options in desired.items():
+                # Evicted from this worker to fit its memory budget: reloaded on demand only
+                if self.registry.is_active(model_name) or self.lifecycle.model_cache.is_evicted(model_name):
+                    continue
+                success, message, _ = self.lifecycle.activate_model(model_name, options, local_only=True)
+                if not success:
+                    logger.error(f"[STATE] Could not activate '{model_name}' in worker {os.getpid()}: {message}")
+
+            # Models hot-reloaded by another worker
+            reloads = state.get("reloads", {})
+            for model_name, revision in reloads.items():
+                if self._reloads.get(model_name) == revision or not self.registry.is_active(model_name):
+                    continue
+                success, message, _ = self.lifecycle.reload_model(model_name, local_only=True)
+                if not success:
+                    logger.error(f"[STATE] Could not reload '{model_name}' in worker {os.getpid()}: {message}")
+            self._reloads = dict(reloads)
+
+            self._applied = dict(desired)
+            self._version = state["version"]
+
+    def mark_reloaded(self, model_name: str, revision: int) -> None:
+        """Record a reload done by this worker, so it is not applied again from the shared state."""
+        self._reloads[model_name] = revision
+
+    def shared_options(self, model_name: str) -> Optional[dict]:
+        """
+        Options of a model another worker already activated, to activate it locally right
+        away instead of waiting for the next sync. None if it is not active in the shared
+        state, or was evicted from this worker.
+        """
+        if self.lifecycle.model_cache.is_evicted(model_name):
+            return None
+        return self.shared_state.read()["active"].get(model_name)
+
+
+# Global singleton instances
+_shared_state = None
+_active_model_store = None
+_synchronizer = None
+
+
+def get_shared_state() -> SharedModelState:
+    """Get the global shared model state."""
+    global _shared_state
+    if _shared_state is None:
+        _shared_state = SharedModelState(SHARED_STATE_FILE)
+    return _shared_state
+
+
+def get_active_model_store() -> SharedModelState:
+    """
+    Get the durable record of active models. Unlike the shared state, which is reset
+    when the server starts, it survives restarts so the models can be restored.
+    """
+    global _active_model_store
+    if _active_model_store is None:
+        _active_model_store = SharedModelState(ACTIVE_MODELS_FILE)
+    return _active_model_store
+
+
+def get_state_synchronizer() -> Optional[StateSynchronizer]:
+    """Get this worker's synchronizer, or None in single-process mode."""
+    return _synchronizer
+
+
+def create_state_synchronizer(registry, lifecycle, refresh_catalog, on_elected=None) -> StateSynchronizer:
+    """Create this worker's synchronizer (call start() on it)."""
+    global _synchronizer
+    if _synchronizer is None:
+        _synchronizer = StateSynchronizer(get_shared_state(), registry, lifecycle, refresh_catalog, on_elected)
+    return _synchronizer
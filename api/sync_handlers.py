@@ -4,12 +4,18 @@ These functions handle the common logic for adding, removing, and updating model
 regardless of whether the change comes from filesystem, GitHub, or API.
 """
 import logging
+import os
 from typing import Set, Dict
 from api.model_registry import get_registry
 from api.model_lifecycle import get_lifecycle_manager
+from api.activation_jobs import get_activation_job_manager
+from api.shared_state import get_shared_state
 
 logger = logging.getLogger(__name__)
 
+# Reload modified active models in the background instead of deactivating them
+HOT_RELOAD = os.getenv("HOT_RELOAD", "true").lower() == "true"
+
 
 class ModelSyncHandler:
     """Handles synchronization of models from various sources."""
@@ -17,6 +23,7 @@ class ModelSyncHandler:
     def __init__(self):
         self.registry = get_registry()
         self.lifecycle = get_lifecycle_manager()
+        self.shared_state = get_shared_state()
     
     def handle_model_added(self, model_name: str, metadata: dict) -> None:
         """
@@ -25,6 +32,7 @@ class ModelSyncHandler:
         """
         logger.info(f"[SYNC] Model added: {model_name}")
         self.registry.register_model(model_name, metadata)
+        self.shared_state.bump_catalog()
     
     def handle_model_removed(self, model_name: str) -> None:
         """
@@ -33,21 +41,30 @@ class ModelSyncHandler:
         """
         logger.info(f"[SYNC] Model removed: {model_name}")
         self.lifecycle.remove_model_completely(model_name)
+        self.shared_state.bump_catalog()
     
     def handle_model_modified(self, model_name: str, new_metadata: dict) -> None:
         """
         Handle a model update (from any source).
-        Updates metadata and deactivates if currently active (requires manual reactivation).
+        Updates metadata. An active model is hot-reloaded by a background job: it keeps
+        serving its current version until the new one is loaded and warmed up, and keeps
+        it if the new one fails to load. Without HOT_RELOAD, an active model is
+        deactivated instead (requires manual reactivation).
         """
         logger.info(f"[SYNC] Model modified: {model_name}")
         
-        # If the model is active, deactivate it (user must reactivate to get new version)
-        if self.registry.is_active(model_name):
+        if self.registry.is_active(model_name) and not HOT_RELOAD:
             logger.info(f"[SYNC] Deactivating modified model '{model_name}'")
             self.lifecycle.deactivate_model(model_name)
         
         # Update metadata
         self.registry.register_model(model_name, new_metadata)
+        self.shared_state.bump_catalog()
+        
+        if self.registry.is_active(model_name):
+            job, created = get_activation_job_manager().submit(model_name, reload=True)
+            if created:
+                logger.info(f"[SYNC] Reloading modified model '{model_name}' (job {job.job_id})")
     
     def handle_bulk_changes(self, changes: Dict[str, Set[str]]) -> None:
         """
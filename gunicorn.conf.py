@@ -0,0 +1,37 @@
+"""
+Gunicorn settings for the production server (see wsgi.py).
+
+Workers are forked before the app is imported (no preload): ML frameworks and
+loaded models are not fork-safe, so every worker loads its own copy. Worker
+registries are kept consistent through SHARED_STATE_FILE (api/shared_state.py).
+"""
+import os
+
+# Must be set before the workers import the app
+os.environ.setdefault("SHARED_STATE_FILE", "/tmp/model_server_state.json")
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8086')}"
+workers = int(os.getenv("WEB_WORKERS", "2"))
+threads = int(os.getenv("WEB_THREADS", "4"))
+worker_class = "gthread"
+timeout = int(os.getenv("WEB_TIMEOUT", "120"))    # model activation can take a while
+graceful_timeout = int(os.getenv("WEB_GRACEFUL_TIMEOUT", "30"))
+preload_app = False
+
+
+def on_starting(server):
+    # The workers restore the models active in the previous run from ACTIVE_MODELS_FILE
+    # (api/preload.py), not from the shared state
+    from api.shared_state import get_shared_state
+    get_shared_state().reset()
+
+
+def worker_exit(server, worker):
+    # Containers are shared with the other workers: removed by the master in on_exit
+    from api.rest_api import shutdown_services
+    shutdown_services(stop_containers=False)
+
+
+def on_exit(server):
+    import tf_serving_manager
+    tf_serving_manager.stop_all_containers()
@@ -3,7 +3,9 @@ import json
 import logging
 import threading
 import requests
-from confluent_kafka import Consumer
+from confluent_kafka import Consumer, TopicPartition
+from api.prediction_service import get_prediction_service
+from messaging.kafka_producer import flush_kafka_producer, get_delivery_failures
 
 
 logger = logging.getLogger(__name__)
@@ -13,9 +15,22 @@ KAFKA_SERVERS = os.getenv("KAFKA_SERVERS","195.201.122.4:9093,195.201.122.4:9096
 KAFKA_INPUT_TOPIC = os.getenv("KAFKA_INPUT_TOPIC", "INTRA_input_test")
 KAFKA_GROUP_ID = "ml-serving-tool"
 
+# Batched consumption: pull up to KAFKA_BATCH_SIZE messages or wait up to
+# KAFKA_BATCH_TIMEOUT_MS, then run one batched inference per model.
+# A batch size of 1 keeps the one-message-at-a-time loop.
+KAFKA_BATCH_SIZE = int(os.getenv("KAFKA_BATCH_SIZE", "1"))
+KAFKA_BATCH_TIMEOUT_MS = int(os.getenv("KAFKA_BATCH_TIMEOUT_MS", "100"))
+
+# Pause before consuming again a batch whose results were not all delivered
+KAFKA_REDELIVERY_BACKOFF_MS = int(os.getenv("KAFKA_REDELIVERY_BACKOFF_MS", "1000"))
+
 API_HOST = os.getenv("API_HOST", "localhost")
 PORT = int(os.getenv("PORT", "8086"))
 
+# "in_process": predict directly through the shared prediction service
+# "http": POST to the REST API (for deployments where the consumer runs separately)
+CONSUMER_DISPATCH_MODE = os.getenv("CONSUMER_DISPATCH_MODE", "in_process")
+
 # Paths to certificates
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 CERT_DIR = os.path.join(BASE_DIR, "certs")
@@ -38,7 +53,8 @@ def get_consumer():
             "bootstrap.servers": KAFKA_SERVERS,
             "group.id": KAFKA_GROUP_ID,
             "auto.offset.reset": "latest",
-            "enable.auto.commit": True,
+            # In batch mode offsets are committed once the whole batch is processed
+            "enable.auto.commit": KAFKA_BATCH_SIZE <= 1,
 
             "security.protocol": "SSL",
             "ssl.ca.location": CA_CERT,
@@ -54,6 +70,10 @@ def get_consumer():
     return _consumer
 
 def forward_to_rest(model_name, features):
+    """
+    Returns True if the message was handled: the API published its prediction (200)
+    or its error (400), or the model is not active (404, the message is dropped).
+    """
     try:
         # Assuming REST API runs in the same container
         url = f"http://{API_HOST}:{PORT}/predict/{model_name}"
@@ -62,38 +82,144 @@ def forward_to_rest(model_name, features):
             logger.info(f"Prediction sent successfully for model '{model_name}'")
         else:
             logger.error(f"REST API error for model '{model_name}': {response.text}")
+        return response.status_code in (200, 400, 404)
     except Exception as e:
         logger.exception(f"Failed to call REST API for model '{model_name}': {e}")
+        return False
+
+
+def dispatch_prediction(model_name, features):
+    if CONSUMER_DISPATCH_MODE == "http":
+        return forward_to_rest(model_name, features)
+    return get_prediction_service().process(model_name, features)
+
+
+def dispatch_prediction_batch(model_name, inputs):
+    """Returns the number of messages handled (the others should be consumed again)."""
+    if CONSUMER_DISPATCH_MODE == "http":
+        return sum(forward_to_rest(model_name, features) for features in inputs)
+    return get_prediction_service().process_batch(model_name, inputs)
+
+
+def _decode_message(msg):
+    payload = json.loads(msg.value().decode("utf-8"))
+
+    model_name = payload.get("model")
+    features = payload.get("input")
+
+    if not model_name or features is None:
+        raise ValueError("Message must contain 'model' and 'input'")
+
+    return model_name, features
+
+
+def _process_message(msg):
+    if msg.error():
+        logger.error(f"Kafka error: {msg.error()}")
+        return
+
+    try:
+        model_name, features = _decode_message(msg)
+        logger.info(f"Received Kafka message for model '{model_name}'")
+
+        dispatch_prediction(model_name, features)
+
+    except Exception as e:
+        logger.exception(f"Failed to process Kafka message: {e}")
+
+
+def _process_batch(messages):
+    """Returns True if every message was handled (invalid messages are skipped for good)."""
+    # Group decoded inputs by model, preserving arrival order within each model
+    inputs_by_model = {}
+    for msg in messages:
+        if msg.error():
+            logger.error(f"Kafka error: {msg.error()}")
+            continue
+        try:
+            model_name, features = _decode_message(msg)
+        except Exception as e:
+            logger.error(f"Skipping invalid Kafka message: {e}")
+            continue
+        inputs_by_model.setdefault(model_name, []).append(features)
+
+    logger.info(f"Received {len(messages)} Kafka messages for {len(inputs_by_model)} model(s)")
+
+    complete = True
+    for model_name, inputs in inputs_by_model.items():
+        try:
+            handled = dispatch_prediction_batch(model_name, inputs)
+        except Exception as e:
+            logger.exception(f"Failed to process Kafka batch for model '{model_name}': {e}")
+            handled = 0
+        if handled < len(inputs):
+            logger.error(f"{len(inputs) - handled} Kafka message(s) for model '{model_name}' not handled")
+            complete = False
+    return complete
+
+
+def _batch_offsets(messages):
+    """(topic, partition) -> (first, last) offset of the batch's messages."""
+    offsets = {}
+    for msg in messages:
+        if msg.error():
+            continue
+        key = (msg.topic(), msg.partition())
+        first, last = offsets.get(key, (msg.offset(), msg.offset()))
+        offsets[key] = (min(first, msg.offset()), max(last, msg.offset()))
+    return offsets
+
+
+def _commit_batch(consumer, messages):
+    # Explicit offsets: the consumer's positions may already be past a rewound batch
+    offsets = [TopicPartition(topic, partition, last + 1)
+               for (topic, partition), (_, last) in _batch_offsets(messages).items()]
+    if offsets:
+        consumer.commit(offsets=offsets, asynchronous=False)
+
+
+def _rewind_batch(consumer, messages):
+    # Consume the batch again from its first message in every partition
+    for (topic, partition), (first, _) in _batch_offsets(messages).items():
+        consumer.seek(TopicPartition(topic, partition, first))
 
 
 def _consume_loop():
     consumer = get_consumer()
-    logger.info("Kafka consumer loop started")
+    logger.info(f"Kafka consumer loop started (batch size {KAFKA_BATCH_SIZE})")
 
     try:
         while not _stop_event.is_set():
-            msg = consumer.poll(timeout=1.0)
-            if msg is None:
+            if KAFKA_BATCH_SIZE <= 1:
+                msg = consumer.poll(timeout=1.0)
+                if msg is not None:
+                    _process_message(msg)
                 continue
-            if msg.error():
-                logger.error(f"Kafka error: {msg.error()}")
-                continue
-
-            try:
-                payload = json.loads(msg.value().decode("utf-8"))
-                logger.info(f"Received Kafka message: {payload}")
 
-                model_name = payload.get("model")
-                features = payload.get("input")
-
-                if not model_name or features is None:
-                    raise ValueError("Message must contain 'model' and 'input'")
+            messages = consumer.consume(
+                num_messages=KAFKA_BATCH_SIZE,
+                timeout=KAFKA_BATCH_TIMEOUT_MS / 1000
+            )
+            if not messages:
+                continue
 
-                # Forward to REST API for prediction
-                forward_to_rest(model_name, features)
+            failures_before = get_delivery_failures()
+            complete = _process_batch(messages)
 
+            # Commit the batch's offsets once every message is handled and every result is
+            # delivered; otherwise rewind so the batch is consumed again (at-least-once)
+            try:
+                undelivered = flush_kafka_producer()
+                failed = get_delivery_failures() - failures_before
+                if not complete or undelivered or failed:
+                    logger.error(f"Kafka batch not fully handled and delivered ({undelivered} result(s) "
+                                 f"still queued, {failed} failed); consuming the batch again")
+                    _rewind_batch(consumer, messages)
+                    _stop_event.wait(KAFKA_REDELIVERY_BACKOFF_MS / 1000)
+                    continue
+                _commit_batch(consumer, messages)
             except Exception as e:
-                logger.exception(f"Failed to process Kafka message: {e}")
+                logger.error(f"Kafka offset commit failed: {e}")
 
     finally:
         logger.info("Closing Kafka consumer")
@@ -1,12 +1,28 @@
 import os
 import json
 import logging
+import threading
+import time
 from confluent_kafka import Producer
 
 logger = logging.getLogger(__name__)
 
 KAFKA_SERVERS = os.getenv("KAFKA_SERVERS","195.201.122.4:9093,195.201.122.4:9096,195.201.122.4:9098")
 
+# "sync": flush after every message (delivery confirmed before returning)
+# "async": delivery callbacks + background poll thread, no per-message flush
+KAFKA_PRODUCER_MODE = os.getenv("KAFKA_PRODUCER_MODE", "sync")
+
+# Producer batching / compression
+KAFKA_PRODUCER_LINGER_MS = int(os.getenv("KAFKA_PRODUCER_LINGER_MS", "5"))
+KAFKA_PRODUCER_BATCH_BYTES = int(os.getenv("KAFKA_PRODUCER_BATCH_BYTES", "1000000"))
+KAFKA_PRODUCER_COMPRESSION = os.getenv("KAFKA_PRODUCER_COMPRESSION", "none")
+
+# Async mode backpressure: max messages awaiting a delivery report, and how long
+# send_kafka_message may block waiting for room before giving up
+KAFKA_PRODUCER_MAX_IN_FLIGHT = int(os.getenv("KAFKA_PRODUCER_MAX_IN_FLIGHT", "10000"))
+KAFKA_PRODUCER_BLOCK_TIMEOUT_MS = int(os.getenv("KAFKA_PRODUCER_BLOCK_TIMEOUT_MS", "5000"))
+
 # Paths to certificates
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 CERT_DIR = os.path.join(BASE_DIR, "certs")
@@ -16,48 +32,177 @@ CLIENT_KEY = os.path.join(CERT_DIR, "client.key")
 
 # Singleton producer
 _producer = None
+_producer_lock = threading.Lock()
+
+# Async delivery pipeline
+_in_flight = threading.BoundedSemaphore(KAFKA_PRODUCER_MAX_IN_FLIGHT)
+_poll_stop_event = threading.Event()
+_poll_thread = None
+
+# Delivery stats
+_stats_lock = threading.Lock()
+_stats = {"sent": 0, "delivered": 0, "failed": 0, "rejected": 0}
+
+
+def _count(key, n=1):
+    with _stats_lock:
+        _stats[key] += n
 
 
 def get_producer():
     # Iinitialization of the Kafka producer
     global _producer
-    if _producer is None:
-        logger.info("Creating Kafka producer with SSL")
-        conf = {
-            "bootstrap.servers": KAFKA_SERVERS,
-            "security.protocol": "SSL",
-            "ssl.ca.location": CA_CERT,
-            "ssl.certificate.location": CLIENT_CERT,
-            "ssl.key.location": CLIENT_KEY,
-            "acks": "all",
-            # Optional tuning
-            "message.send.max.retries": 3,
-            "retry.backoff.ms": 1000,
-            "client.id": "ml-serving-tool-kafka-producer"
-        }
-        _producer = Producer(conf)
+    with _producer_lock:
+        if _producer is None:
+            logger.info(f"Creating Kafka producer with SSL ({KAFKA_PRODUCER_MODE} mode)")
+            conf = {
+                "bootstrap.servers": KAFKA_SERVERS,
+                "security.protocol": "SSL",
+                "ssl.ca.location": CA_CERT,
+                "ssl.certificate.location": CLIENT_CERT,
+                "ssl.key.location": CLIENT_KEY,
+                "acks": "all",
+                # Optional tuning
+                "message.send.max.retries": 3,
+                "retry.backoff.ms": 1000,
+                "linger.ms": KAFKA_PRODUCER_LINGER_MS,
+                "batch.size": KAFKA_PRODUCER_BATCH_BYTES,
+                "compression.type": KAFKA_PRODUCER_COMPRESSION,
+                "client.id": "ml-serving-tool-kafka-producer"
+            }
+            _producer = Producer(conf)
+
+            if KAFKA_PRODUCER_MODE == "async":
+                _start_poll_thread(_producer)
     return _producer
 
 
+def _start_poll_thread(producer):
+    global _poll_thread
+
+    def _poll_loop():
+        # Serve delivery callbacks while messages are in flight
+        while not _poll_stop_event.is_set():
+            producer.poll(0.1)
+
+    _poll_stop_event.clear()
+    _poll_thread = threading.Thread(target=_poll_loop, name="kafka-producer-poll", daemon=True)
+    _poll_thread.start()
+
+
+def _record_delivery(err, msg):
+    if err is not None:
+        _count("failed")
+        logger.error(f"Kafka delivery failed for topic '{msg.topic()}': {err}")
+    else:
+        _count("delivered")
+
+
+def _on_async_delivery(err, msg):
+    _in_flight.release()
+    _record_delivery(err, msg)
+
+
 def send_kafka_message(topic, message, key=None):
     """
-    Send a JSON-serializable message to Kafka.
+    Send a JSON-serializable message (or pre-encoded JSON bytes) to Kafka.
+
+    In async mode the message is only queued; its delivery is reported through
+    the delivery callback and counted in get_kafka_producer_stats().
 
     :param topic: Kafka topic name
-    :param message: Python dict (will be JSON-encoded)
+    :param message: Python dict (will be JSON-encoded) or already-encoded JSON bytes
     :param key: optional string key for partitioning
     """
     try:
         producer = get_producer()
+        value = message if isinstance(message, (bytes, bytearray)) else json.dumps(message)
+
+        if KAFKA_PRODUCER_MODE == "async":
+            return _produce_async(producer, topic, value, key)
+
         producer.produce(
             topic=topic,
             key=key,
-            value=json.dumps(message)
+            value=value,
+            on_delivery=_record_delivery
         )
+        _count("sent")
         # Flush ensures message is sent before returning
         producer.flush()
         logger.info(f"Message sent to kafka topic '{topic}' successfully")
         return True
     except Exception as e:
+        _count("rejected")
         logger.error(f"Kafka send failed: {e}")
-        return False
\ No newline at end of file
+        return False
+
+
+def _produce_async(producer, topic, value, key):
+    # Backpressure: wait for room in the in-flight window
+    if not _in_flight.acquire(timeout=KAFKA_PRODUCER_BLOCK_TIMEOUT_MS / 1000):
+        _count("rejected")
+        logger.error(f"Kafka send rejected: {KAFKA_PRODUCER_MAX_IN_FLIGHT} messages already in flight")
+        return False
+
+    deadline = time.monotonic() + KAFKA_PRODUCER_BLOCK_TIMEOUT_MS / 1000
+    while True:
+        try:
+            producer.produce(topic=topic, key=key, value=value, on_delivery=_on_async_delivery)
+            break
+        except BufferError:
+            # librdkafka's local queue is full: let deliveries drain, then retry until the deadline
+            if time.monotonic() >= deadline:
+                _in_flight.release()
+                _count("rejected")
+                logger.error(f"Kafka send rejected: local producer queue still full after "
+                             f"{KAFKA_PRODUCER_BLOCK_TIMEOUT_MS} ms")
+                return False
+            producer.poll(0.1)
+        except Exception:
+            _in_flight.release()
+            raise
+
+    _count("sent")
+    return True
+
+
+def get_delivery_failures():
+    """Number of messages reported as failed by the delivery callback since the start."""
+    with _stats_lock:
+        return _stats["failed"]
+
+
+def flush_kafka_producer(timeout=10):
+    """
+    Wait until all queued messages are delivered (or the timeout expires).
+    Returns the number of messages still in the queue. No-op if no producer exists.
+    """
+    if _producer is None:
+        return 0
+    return _producer.flush(timeout)
+
+
+def close_kafka_producer(timeout=10):
+    """Stop the background poll thread and flush outstanding messages."""
+    global _poll_thread
+
+    _poll_stop_event.set()
+    if _poll_thread:
+        _poll_thread.join(timeout=5)
+        _poll_thread = None
+
+    remaining = flush_kafka_producer(timeout)
+    if remaining:
+        logger.warning(f"Kafka producer closed with {remaining} undelivered message(s)")
+    else:
+        logger.info("Kafka producer flushed and closed")
+
+
+def get_kafka_producer_stats():
+    """Return delivery counters of the Kafka producer."""
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["mode"] = KAFKA_PRODUCER_MODE
+    stats["in_flight"] = len(_producer) if _producer is not None else 0
+    return stats
@@ -1,10 +1,13 @@
 import os
 import json
+import time
+import queue
 import logging
 import threading
 import requests
 import uuid
 import paho.mqtt.client as mqtt
+from api.prediction_service import get_prediction_service
 
 logger = logging.getLogger(__name__)
 
@@ -18,8 +21,24 @@ MQTT_PASSWORD = os.getenv("MQTT_PASSWORD")
 API_HOST = os.getenv("API_HOST", "localhost")
 PORT = int(os.getenv("PORT", "8086"))
 
+# "in_process" (shared prediction service) or "http" (POST to the REST API)
+CONSUMER_DISPATCH_MODE = os.getenv("CONSUMER_DISPATCH_MODE", "in_process")
+
+# Worker pool behind on_message: the paho network thread only enqueues messages
+MQTT_WORKERS = int(os.getenv("MQTT_WORKERS", "4"))
+MQTT_QUEUE_SIZE = int(os.getenv("MQTT_QUEUE_SIZE", "1000"))
+# What to do when the queue is full: "drop_oldest", "drop_newest" or "block"
+MQTT_OVERFLOW_POLICY = os.getenv("MQTT_OVERFLOW_POLICY", "drop_oldest")
+
 _client = None
 _stop_event = threading.Event()
+_queue = queue.Queue(maxsize=MQTT_QUEUE_SIZE)
+_workers = []
+
+# Stats
+_stats_lock = threading.Lock()
+_stats = {"received": 0, "processed": 0, "failed": 0, "dropped": 0,
+          "total_latency": 0.0, "total_processing": 0.0}
 
 
 def forward_to_rest(model_name, features):
@@ -39,6 +58,13 @@ def forward_to_rest(model_name, features):
         logger.exception(f"Failed to call REST API for model '{model_name}': {e}")
 
 
+def dispatch_prediction(model_name, features):
+    if CONSUMER_DISPATCH_MODE == "http":
+        forward_to_rest(model_name, features)
+    else:
+        get_prediction_service().process(model_name, features)
+
+
 def on_connect(client, userdata, flags, rc):
     if rc == 0:
         logger.info("MQTT consumer connected successfully")
@@ -48,21 +74,99 @@ def on_connect(client, userdata, flags, rc):
         logger.error(f"MQTT connection failed with rc={rc}")
 
 
-def on_message(client, userdata, msg):
-    try:
-        payload = json.loads(msg.payload.decode("utf-8"))
-        logger.info(f"Received MQTT message: {payload}")
+def _count(key, n=1):
+    with _stats_lock:
+        _stats[key] += n
 
-        model_name = payload.get("model")
-        features = payload.get("input")
 
-        if not model_name or features is None:
-            raise ValueError("Message must contain 'model' and 'input'")
+def on_message(client, userdata, msg):
+    # Runs on the paho network thread: enqueue only, never block on inference
+    _count("received")
+    item = (msg.payload, time.monotonic())
 
-        forward_to_rest(model_name, features)
+    if MQTT_OVERFLOW_POLICY == "block":
+        _queue.put(item)
+        return
 
-    except Exception as e:
-        logger.exception(f"Failed to process MQTT message: {e}")
+    while True:
+        try:
+            _queue.put_nowait(item)
+            return
+        except queue.Full:
+            if MQTT_OVERFLOW_POLICY == "drop_newest":
+                _count("dropped")
+                logger.warning("MQTT queue full, dropping newest message")
+                return
+            try:
+                _queue.get_nowait()
+                _queue.task_done()
+                _count("dropped")
+                logger.warning("MQTT queue full, dropping oldest message")
+            except queue.Empty:
+                pass
+
+
+def _process_payload(raw_payload):
+    payload = json.loads(raw_payload.decode("utf-8"))
+
+    model_name = payload.get("model")
+    features = payload.get("input")
+
+    if not model_name or features is None:
+        raise ValueError("Message must contain 'model' and 'input'")
+
+    logger.info(f"Received MQTT message for model '{model_name}'")
+    dispatch_prediction(model_name, features)
+
+
+def _worker_loop():
+    while not _stop_event.is_set():
+        try:
+            raw_payload, enqueued_at = _queue.get(timeout=0.5)
+        except queue.Empty:
+            continue
+
+        started = time.monotonic()
+        try:
+            _process_payload(raw_payload)
+            _count("processed")
+        except Exception as e:
+            _count("failed")
+            logger.exception(f"Failed to process MQTT message: {e}")
+        finally:
+            finished = time.monotonic()
+            with _stats_lock:
+                _stats["total_latency"] += finished - enqueued_at
+                _stats["total_processing"] += finished - started
+            _queue.task_done()
+
+
+def _start_workers():
+    _stop_event.clear()
+    for i in range(MQTT_WORKERS):
+        worker = threading.Thread(target=_worker_loop, name=f"mqtt-worker-{i}", daemon=True)
+        worker.start()
+        _workers.append(worker)
+    logger.info(f"Started {MQTT_WORKERS} MQTT worker(s), queue size {MQTT_QUEUE_SIZE}, "
+                f"overflow policy '{MQTT_OVERFLOW_POLICY}'")
+
+
+def get_mqtt_consumer_stats():
+    """Return queue depth, latency and drop counts of the MQTT consumer."""
+    with _stats_lock:
+        stats = dict(_stats)
+    done = stats["processed"] + stats["failed"]
+    total_latency = stats.pop("total_latency")
+    total_processing = stats.pop("total_processing")
+    stats.update({
+        "workers": len(_workers),
+        "queue_depth": _queue.qsize(),
+        "queue_size": MQTT_QUEUE_SIZE,
+        "overflow_policy": MQTT_OVERFLOW_POLICY,
+        "avg_latency_ms": round(1000 * total_latency / done, 3) if done else 0.0,
+        "avg_processing_ms": round(1000 * total_processing / done, 3) if done else 0.0,
+    })
+    return stats
 
 
 def start_mqtt_consumer():
@@ -73,6 +177,8 @@ def start_mqtt_consumer():
 
     logger.info("Starting MQTT consumer")
 
+    _start_workers()
+
     # Create client with a unique ID
     client = mqtt.Client(client_id=f"consumer-{uuid.uuid4()}")
 
@@ -96,3 +202,10 @@ def stop_mqtt_consumer():
     if _client:
         _client.loop_stop()
         _client.disconnect()
+
+    # Let the workers finish the message they are processing
+    _stop_event.set()
+    for worker in _workers:
+        worker.join(timeout=5)
+    _workers.clear()
+
@@ -40,13 +40,16 @@ def get_mqtt_client():
     return _mqtt_client
 
 
-def send_mqtt_message(message: dict):
+def send_mqtt_message(message):
     """
-    Send a JSON message to MQTT.
+    Send a JSON message (dict or already-encoded JSON bytes) to MQTT.
     """
     try:
         client = get_mqtt_client()
-        payload = json.dumps(message).encode("utf-8")
+        if isinstance(message, (bytes, bytearray)):
+            payload = message
+        else:
+            payload = json.dumps(message).encode("utf-8")
 
         result = client.publish(MQTT_OUTPUT_TOPIC, payload)
 
@@ -0,0 +1,105 @@
+"""
+Registry of model backends.
+
+Each supported model format is a ModelBackend subclass registered with
+@register_backend. The backend is resolved once, when a model is loaded, and
+bound to the loaded model as a Predictor, so predictions never have to
+inspect the filesystem to find the right handler.
+"""
+import os
+from typing import Any, List, Optional, Tuple
+
+_BACKENDS = []
+
+
+def register_backend(cls):
+    """Class decorator adding a backend to the registry (checked in registration order)."""
+    _BACKENDS.append(cls())
+    return cls
+
+
+def list_backends() -> List["ModelBackend"]:
+    """Get all registered backends."""
+    return list(_BACKENDS)
+
+
+def find_backend(path: str) -> Optional["ModelBackend"]:
+    """Get the first registered backend able to load the given path."""
+    for backend in _BACKENDS:
+        if backend.can_load(path):
+            return backend
+    return None
+
+
+class Predictor:
+    """
+    A loaded model bound to its backend.
+    Calling it runs a single prediction; predict_batch() runs a list of inputs at once.
+    Results may contain NumPy arrays or tensors; see serialization.dumps().
+    """
+
+    def __init__(self, backend: "ModelBackend", model: Any):
+        self.backend = backend
+        self.model = model
+
+    def predict(self, data: Any) -> Any:
+        return self.backend.predict(self.model, data)
+
+    def predict_batch(self, instances: List[Any]) -> List[Any]:
+        return self.backend.predict_batch(self.model, instances)
+
+    __call__ = predict
+
+
+class ModelBackend:
+    """Base class for a model format."""
+
+    name = "unknown"
+
+    def can_load(self, path: str) -> bool:
+        """Return True if this backend recognizes the model at path."""
+        raise NotImplementedError
+
+    def load(self, path: str, options: dict) -> Tuple[Optional[dict], Any]:
+        """
+        Load the model at path. Returns (info, model), or (None, None) on failure.
+        options are the per-model activation options.
+        """
+        raise NotImplementedError
+
+    def info(self, model: Any) -> dict:
+        """Describe the expected input/output of a loaded model."""
+        raise NotImplementedError
+
+    def runtime(self, model: Any) -> Optional[dict]:
+        """Report how a loaded model is executed (e.g. optimization mode, warm latency), if relevant."""
+        return None
+
+    def memory(self, model: Any) -> Optional[dict]:
+        """
+        Report memory held by a loaded model, if the backend can measure it.
+        A "footprint_mb" entry is what the model counts against the memory budget
+        when its memory is not (or not only) in this process's heap.
+        """
+        return None
+
+    def predict(self, model: Any, data: Any) -> Any:
+        """Run a prediction for one input."""
+        raise NotImplementedError
+
+    def predict_batch(self, model: Any, instances: List[Any]) -> List[Any]:
+        """Run one batched prediction. Returns one result per input."""
+        raise NotImplementedError
+
+    def bind(self, model: Any, options: dict) -> Predictor:
+        """Bind a loaded model to this backend (backends may pick an execution path from options)."""
+        return Predictor(self, model)
+
+
+class FileBackend(ModelBackend):
+    """Backend for single-file models recognized by their extension."""
+
+    extensions: Tuple[str, ...] = ()
+
+    def can_load(self, path: str) -> bool:
+        return os.path.isfile(path) and os.path.splitext(path)[1] in self.extensions
@@ -1,98 +1,61 @@
 import os
-import model_handlers.tensorflow_models as tensorflow_models
-import model_handlers.scikit_models as scikit_models
-import model_handlers.pytorch_models as pytorch_models
-import model_handlers.savedmodel as savedmodel
-from utils import make_json_serializable
-
-
-def switch_case_load(path):
-    info, model = None, None
-
-    # Case: file-based models
-    if os.path.isfile(path):
-        _, extension = os.path.splitext(path)
-
-        if extension in ['.h5', '.keras']:
-            print("Processing model from Tensorflow (.h5 or .keras)")
-            info, model = tensorflow_models.load_tensorflow(path)
-
-        elif extension in ['.pkl', '.joblib']:
-            print("Processing model from Scikit-learn")
-            info, model = scikit_models.load_joblib(path)
-
-        elif extension in ['.pt', '.pth']:
-            print("Processing PyTorch single-file model (.pt/.pth)")
-            info, model = pytorch_models.load_pytorch(path)
-
-        elif extension == '.params':
-            print("Processing model from MXNet")
-
-        else:
-            print("Unsupported file format:", path)
-
-    # Case: folder-based models
-    elif os.path.isdir(path):
-        if all(d.isdigit() and os.path.exists(os.path.join(path, d, "saved_model.pb"))
-                for d in os.listdir(path) if os.path.isdir(os.path.join(path, d))):
-            # TensorFlow SavedModel with versioning
-            version_dirs = sorted(
-                [d for d in os.listdir(path)
-                if d.isdigit() and os.path.isdir(os.path.join(path, d))]
-            )
-            if version_dirs:
-                latest_version = version_dirs[-1]  # pick highest version
-                print(f"Processing TensorFlow SavedModel (TF Serving format), version={latest_version}")
-                info, model = savedmodel.load_savedmodel(path, latest_version)
-        
-
-        elif (os.path.exists(os.path.join(path, "model.pt")) or
-              os.path.exists(os.path.join(path, "model.pth"))) and \
-              os.path.exists(os.path.join(path, "model_class.py")):
-            # PyTorch "drop-in folder" format
-            print("Processing PyTorch folder model")
-            info, model = pytorch_models.load_pytorch_folder(path)
-
-        else:
-            print("Unsupported folder format:", path)
-
-    else:
+from model_handlers.backends import find_backend
+from model_handlers.onnx_conversion import conversion_requested, load_with_conversion
+
+# Importing the handler modules registers their backends (checked in this order)
+import model_handlers.tensorflow_models
+import model_handlers.scikit_models
+import model_handlers.pytorch_models
+import model_handlers.savedmodel
+import model_handlers.onnx_models
+
+
+def load(path, options=None):
+    """
+    Detect the backend for a model path and load the model.
+    options are the per-model activation options, passed to the backend.
+    Returns (info, model, predictor), or (None, None, None) if the model is unsupported or invalid.
+    """
+    options = options or {}
+
+    if not os.path.exists(path):
         print("Path does not exist:", path)
+        return None, None, None
 
-    return info, model
-
-
-def switch_case_predict(path, model, data):
-    import os
-    prediction = None
-
-    # TF Serving case
-    if isinstance(model, str) and model.startswith("http"):
-        return savedmodel.predict_savedmodel(model, data)
+    backend = find_backend(path)
+    if backend is None:
+        print("Unsupported model format:", path)
+        return None, None, None
 
-    # File or folder
-    if os.path.isfile(path):
-        _, extension = os.path.splitext(path)
-        if extension in ['.h5', '.keras']:
-            prediction = tensorflow_models.predict_tensorflow(model, data)
-        elif extension in ['.pkl', '.joblib']:
-            print("Hit .pkl extension branch!")
-            prediction = scikit_models.predict_joblib(model, data)
-        elif extension in ['.pt', '.pth']:
-            prediction = pytorch_models.predict_pytorch(model, data)
+    # Opt-in: serve scikit-learn / PyTorch models as a converted ONNX graph
+    if conversion_requested(backend, options):
+        return load_with_conversion(path, backend, options)
 
-    elif os.path.isdir(path):
-        if os.path.exists(os.path.join(path, "model_class.py")):
-            prediction = pytorch_models.predict_pytorch(model, data)
+    info, model = backend.load(path, options)
+    if model is None:
+        return None, None, None
 
-    return prediction
+    return info, model, backend.bind(model, options)
 
 
 def detect(filename):
-    info, model = switch_case_load(filename)
+    info, model, _ = load(filename)
     return info, model
 
 
 def predict(filename, model, data):
-    prediction = switch_case_predict(filename, model, data)
-    return make_json_serializable(prediction)
\ No newline at end of file
+    backend = find_backend(filename)
+    if backend is None:
+        raise ValueError(f"Unsupported model format: {filename}")
+    return backend.bind(model, {}).predict(data)
+
+
+def predict_batch(filename, model, instances):
+    """
+    Run one batched inference call for a list of inputs.
+    Returns one result per input, each shaped like the result of predict().
+    """
+    backend = find_backend(filename)
+    if backend is None:
+        raise ValueError(f"Unsupported model format: {filename}")
+    return backend.bind(model, {}).predict_batch(instances)
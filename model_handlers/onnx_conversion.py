@@ -0,0 +1,288 @@
+"""
+Opt-in conversion of scikit-learn and PyTorch models to ONNX at activation.
+
+The native model is exported to ONNX and its outputs are compared with the native
+model's on inputs generated from model_info. The converted graph is served only if
+they match; otherwise the native model is served and the runtime report says why.
+Converted graphs are cached on disk, keyed by a hash of the source model's content,
+so reactivating an unchanged model (or restarting) skips loading the native model
+and converting it.
+"""
+import hashlib
+import io
+import json
+import os
+import tempfile
+import time
+import numpy as np
+from model_handlers.backends import ModelBackend, Predictor
+from model_handlers import onnx_models
+from utils import wait_until_stable, make_json_serializable
+
+ONNX_CONVERT = os.getenv("ONNX_CONVERT", "false").lower() == "true"
+ONNX_CONVERSION_CACHE_DIR = os.getenv("ONNX_CONVERSION_CACHE_DIR",
+                                      os.path.join(tempfile.gettempdir(), "onnx_conversion_cache"))
+ONNX_OPSET = int(os.getenv("ONNX_OPSET", "17"))
+
+# Tolerance of the parity check against the native model (float32 graphs vs float64 scikit-learn)
+ONNX_PARITY_RTOL = float(os.getenv("ONNX_PARITY_RTOL", "1e-3"))
+ONNX_PARITY_ATOL = float(os.getenv("ONNX_PARITY_ATOL", "1e-4"))
+
+# Bump when the conversion changes, so older cached graphs are not reused
+_CACHE_FORMAT = 1
+_PARITY_ROWS = 32
+
+
+def _iter_source_files(path):
+    if os.path.isfile(path):
+        yield os.path.basename(path), path
+        return
+    for root, dirs, files in os.walk(path):
+        dirs[:] = sorted(d for d in dirs if d != "__pycache__")
+        for name in sorted(files):
+            full_path = os.path.join(root, name)
+            yield os.path.relpath(full_path, path), full_path
+
+
+def source_hash(path, backend_name):
+    """SHA-256 of the model's files (names and content) and the conversion settings."""
+    digest = hashlib.sha256(f"{_CACHE_FORMAT}:{backend_name}:{ONNX_OPSET}".encode("utf-8"))
+    for rel_path, full_path in _iter_source_files(path):
+        digest.update(rel_path.encode("utf-8") + b"\0")
+        with open(full_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _cache_paths(path, digest):
+    name = os.path.splitext(os.path.basename(os.path.normpath(path)))[0]
+    base = os.path.join(ONNX_CONVERSION_CACHE_DIR, f"{name}-{digest[:16]}")
+    return f"{base}.onnx", f"{base}.json"
+
+
+# === Exporters: (onnx bytes, generated inputs, native outputs) ===
+
+def _export_scikit(model, info, options):
+    from skl2onnx import to_onnx
+    from skl2onnx.common.data_types import FloatTensorType
+    from sklearn.base import is_classifier
+
+    if not isinstance(info.get("input_shape"), list):
+        raise ValueError("number of input features unknown")
+    n_features = info["input_shape"][0]
+
+    X = np.random.default_rng(0).standard_normal((_PARITY_ROWS, n_features)).astype(np.float32)
+    samples = [X[:1], X]
+
+    # Plain probability matrix instead of a list of {class: probability} maps
+    convert_options = {"zipmap": False} if is_classifier(model) else None
+    onnx_graph = to_onnx(model, initial_types=[("input", FloatTensorType([None, n_features]))],
+                         options=convert_options, target_opset=ONNX_OPSET)
+    return onnx_graph.SerializeToString(), samples, [np.asarray(model.predict(sample)) for sample in samples]
+
+
+def _export_pytorch(model, info, options):
+    import torch
+
+    if options.get("sample_input") is not None:
+        row_shape = np.asarray(options["sample_input"]).shape
+    elif isinstance(info.get("input_shape"), tuple):
+        row_shape = info["input_shape"][1:]
+    else:
+        raise ValueError("input shape unknown: pass a sample_input option")
+
+    X = np.random.default_rng(0).standard_normal((_PARITY_ROWS, *row_shape)).astype(np.float32)
+    samples = [X[:1], X]
+
+    with torch.inference_mode():
+        outputs = [model(torch.from_numpy(sample)) for sample in samples]
+    if not all(isinstance(output, torch.Tensor) for output in outputs):
+        raise ValueError("only models returning a single tensor can be converted")
+
+    buffer = io.BytesIO()
+    torch.onnx.export(
+        model, (torch.from_numpy(samples[0]),), buffer,
+        input_names=["input"], output_names=["output"],
+        dynamic_axes={"input": {0: "batch"}, "output": {0: "batch"}},
+        opset_version=ONNX_OPSET, dynamo=False
+    )
+    return buffer.getvalue(), samples, [output.numpy() for output in outputs]
+
+
+_EXPORTERS = {
+    "scikit-learn": _export_scikit,
+    "pytorch": _export_pytorch,
+    "pytorch-folder": _export_pytorch,
+}
+
+
+def _outputs_match(actual, expected):
+    if actual.shape != expected.shape:
+        return False
+    if np.issubdtype(expected.dtype, np.floating):
+        return np.allclose(actual, expected, rtol=ONNX_PARITY_RTOL, atol=ONNX_PARITY_ATOL)
+    return np.array_equal(actual, expected)
+
+
+# === Serving ===
+
+class ConvertedOnnxBackend(ModelBackend):
+    """
+    Serves the ONNX graph converted from a native model with the native model's
+    input contract and result format (not registered; bound by load_with_conversion()).
+    """
+
+    def __init__(self, source_backend: str, model_info: dict, squeeze: bool, report: dict):
+        self.name = f"{source_backend}-onnx"
+        self.source_backend = source_backend
+        self.model_info = model_info
+        self.squeeze = squeeze
+        self.report = report
+
+    def _result(self, output):
+        if self.squeeze:
+            output = output.reshape(output.shape[:-1])
+        # Same result format as the native backend
+        return output if self.source_backend == "scikit-learn" else {"predictions": output}
+
+    def info(self, model):
+        return self.model_info
+
+    def runtime(self, model):
+        return dict(onnx_models.get_onnx_runtime(model), onnx_conversion=self.report)
+
+    def predict(self, model, data):
+        return self._result(onnx_models.predict_onnx(model, data)["predictions"])
+
+    def predict_batch(self, model, instances):
+        return [self._result(result["predictions"])
+                for result in onnx_models.predict_onnx_batch(model, instances)]
+
+
+class _NativeWithReport(ModelBackend):
+    """The native backend, with the reason conversion was not used added to its runtime report."""
+
+    def __init__(self, backend: ModelBackend, report: dict):
+        self.backend = backend
+        self.name = backend.name
+        self.report = report
+
+    def info(self, model):
+        return self.backend.info(model)
+
+    def runtime(self, model):
+        return dict(self.backend.runtime(model) or {}, onnx_conversion=self.report)
+
+    def memory(self, model):
+        return self.backend.memory(model)
+
+    def predict(self, model, data):
+        return self.backend.predict(model, data)
+
+    def predict_batch(self, model, instances):
+        return self.backend.predict_batch(model, instances)
+
+
+def conversion_requested(backend, options) -> bool:
+    return backend.name in _EXPORTERS and bool(options.get("onnx_convert", ONNX_CONVERT))
+
+
+def _serve_converted(onnx_path, sidecar, options, report):
+    model = onnx_models.create_onnx_model(onnx_path, options)
+    # The native result is the first output (scikit-learn: labels / values, not probabilities)
+    model.output_names = model.output_names[:1]
+    backend = ConvertedOnnxBackend(sidecar["source_backend"], sidecar["model_info"], sidecar["squeeze"], report)
+    return sidecar["model_info"], model, Predictor(backend, model)
+
+
+def _load_cached(onnx_path, sidecar_path, options, digest):
+    if not (os.path.exists(onnx_path) and os.path.exists(sidecar_path)):
+        return None
+    try:
+        with open(sidecar_path) as f:
+            sidecar = json.load(f)
+        report = dict(sidecar["report"], cache="hit", source_hash=digest)
+        return _serve_converted(onnx_path, sidecar, options, report)
+    except Exception as e:
+        print(f"Ignoring unusable cached ONNX graph {onnx_path}: {e}")
+        return None
+
+
+def _write_cache(onnx_path, sidecar_path, onnx_bytes, sidecar):
+    os.makedirs(ONNX_CONVERSION_CACHE_DIR, exist_ok=True)
+    # Write-then-rename: concurrent activations produce identical files
+    for target, data in ((onnx_path, onnx_bytes), (sidecar_path, json.dumps(sidecar).encode("utf-8"))):
+        tmp_path = f"{target}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, target)
+
+
+def _convert(path, backend, info, model, options, digest):
+    """Export, check parity and cache. Returns (info, model, predictor) or raises with the reason."""
+    if onnx_models.ort is None:
+        raise RuntimeError("onnxruntime is not installed")
+
+    started = time.perf_counter()
+    onnx_bytes, samples, expected = _EXPORTERS[backend.name](model, info, options)
+
+    session_model = onnx_models.create_onnx_model(onnx_bytes, {})
+    actual = [session_model.run({session_model.input_names[0]: sample})[0] for sample in samples]
+
+    # e.g. scikit-learn regressors: (rows, 1) in ONNX, (rows,) natively
+    squeeze = actual[0].ndim == expected[0].ndim + 1 and actual[0].shape[-1] == 1
+    if squeeze:
+        actual = [output.reshape(output.shape[:-1]) for output in actual]
+
+    for rows, (a, e) in zip((1, _PARITY_ROWS), zip(actual, expected)):
+        if not _outputs_match(a, e):
+            raise ValueError(f"outputs differ from the native model on {rows} generated input row(s)")
+
+    report = {
+        "requested": True,
+        "mode": "onnx",
+        "opset": ONNX_OPSET,
+        "conversion_s": round(time.perf_counter() - started, 3),
+        "parity_rows": _PARITY_ROWS + 1,
+    }
+    sidecar = {"source_backend": backend.name, "model_info": make_json_serializable(info),
+               "squeeze": squeeze, "report": report}
+
+    onnx_path, sidecar_path = _cache_paths(path, digest)
+    _write_cache(onnx_path, sidecar_path, onnx_bytes, sidecar)
+    print(f"Converted {path} to ONNX: {onnx_path}")
+    return _serve_converted(onnx_path, sidecar, options, dict(report, cache="miss", source_hash=digest))
+
+
+def load_with_conversion(path, backend, options):
+    """
+    Load a model for serving as ONNX: the cached converted graph if the source is
+    unchanged, else the native model converted now. Falls back to the native model.
+    Returns (info, model, predictor) like model_detector.load().
+    """
+    digest = None
+    if wait_until_stable(path):
+        digest = source_hash(path, backend.name)
+        cached = _load_cached(*_cache_paths(path, digest), options, digest)
+        if cached is not None:
+            print(f"Serving cached ONNX conversion of {path}")
+            return cached
+
+    info, model = backend.load(path, options)
+    if model is None:
+        return None, None, None
+
+    native = backend.bind(model, options)
+    if digest is None:
+        report = {"requested": True, "mode": "native", "fallback_reason": "model file did not stabilize"}
+        return info, model, Predictor(_NativeWithReport(native.backend, report), native.model)
+
+    try:
+        return _convert(path, backend, info, model, options, digest)
+    except Exception as e:
+        message = str(e).strip().splitlines()[0] if str(e).strip() else ""
+        reason = message if isinstance(e, ValueError) else f"{type(e).__name__}: {message}"
+        print(f"ONNX conversion of {path} not used, serving the native model: {reason}")
+        report = {"requested": True, "mode": "native", "fallback_reason": reason}
+        return info, model, Predictor(_NativeWithReport(native.backend, report), native.model)
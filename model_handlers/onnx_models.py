@@ -0,0 +1,229 @@
+import os
+import numpy as np
+from model_handlers.backends import FileBackend, register_backend
+from utils import wait_until_stable, stack_instances, split_rows
+
+try:
+    import onnxruntime as ort
+except ImportError:  # pragma: no cover - optional backend
+    ort = None
+
+# Default session options, overridden per model by the "onnx_session" activation option.
+# 0 threads lets ONNX Runtime decide (one intra-op thread per physical core)
+ONNX_INTRA_OP_THREADS = int(os.getenv("ONNX_INTRA_OP_THREADS", "0"))
+ONNX_INTER_OP_THREADS = int(os.getenv("ONNX_INTER_OP_THREADS", "0"))
+ONNX_GRAPH_OPTIMIZATION = os.getenv("ONNX_GRAPH_OPTIMIZATION", "all")
+ONNX_EXECUTION_MODE = os.getenv("ONNX_EXECUTION_MODE", "sequential")
+
+# Execution providers in order of preference (those not available in the installed build are skipped)
+ONNX_PROVIDERS = [p.strip() for p in os.getenv("ONNX_PROVIDERS", "CPUExecutionProvider").split(",") if p.strip()]
+
+GRAPH_OPTIMIZATION_LEVELS = ("disable", "basic", "extended", "all")
+EXECUTION_MODES = ("sequential", "parallel")
+
+# ONNX tensor element types -> NumPy dtypes
+_ONNX_DTYPES = {
+    "tensor(float)": np.float32,
+    "tensor(double)": np.float64,
+    "tensor(float16)": np.float16,
+    "tensor(int8)": np.int8,
+    "tensor(int16)": np.int16,
+    "tensor(int32)": np.int32,
+    "tensor(int64)": np.int64,
+    "tensor(uint8)": np.uint8,
+    "tensor(uint16)": np.uint16,
+    "tensor(uint32)": np.uint32,
+    "tensor(uint64)": np.uint64,
+    "tensor(bool)": np.bool_,
+    "tensor(string)": np.object_,
+}
+
+
+class OnnxModel:
+    """An ONNX Runtime inference session plus the input metadata needed to build its feeds."""
+
+    def __init__(self, session, session_config: dict):
+        self.session = session
+        self.session_config = session_config
+        self.inputs = session.get_inputs()
+        self.input_names = [node.name for node in self.inputs]
+        self.input_dtypes = [_ONNX_DTYPES.get(node.type, np.float32) for node in self.inputs]
+        self.input_ranks = [len(node.shape) if node.shape is not None else None for node in self.inputs]
+        self.output_names = [node.name for node in session.get_outputs()]
+
+    def run(self, feeds: dict) -> list:
+        return self.session.run(self.output_names, feeds)
+
+
+def _session_config(options):
+    config = {
+        "intra_op_threads": ONNX_INTRA_OP_THREADS,
+        "inter_op_threads": ONNX_INTER_OP_THREADS,
+        "graph_optimization_level": ONNX_GRAPH_OPTIMIZATION,
+        "execution_mode": ONNX_EXECUTION_MODE,
+    }
+    config.update(options.get("onnx_session") or {})
+
+    if config["graph_optimization_level"] not in GRAPH_OPTIMIZATION_LEVELS:
+        raise ValueError(f"Unknown graph_optimization_level: {config['graph_optimization_level']}")
+    if config["execution_mode"] not in EXECUTION_MODES:
+        raise ValueError(f"Unknown ONNX execution_mode: {config['execution_mode']}")
+    return config
+
+
+def _session_options(config):
+    sess_options = ort.SessionOptions()
+    sess_options.intra_op_num_threads = int(config["intra_op_threads"])
+    sess_options.inter_op_num_threads = int(config["inter_op_threads"])
+    sess_options.graph_optimization_level = {
+        "disable": ort.GraphOptimizationLevel.ORT_DISABLE_ALL,
+        "basic": ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+        "extended": ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+        "all": ort.GraphOptimizationLevel.ORT_ENABLE_ALL,
+    }[config["graph_optimization_level"]]
+    sess_options.execution_mode = {
+        "sequential": ort.ExecutionMode.ORT_SEQUENTIAL,
+        "parallel": ort.ExecutionMode.ORT_PARALLEL,
+    }[config["execution_mode"]]
+    return sess_options
+
+
+def load_onnx(filename, options=None):
+    if ort is None:
+        print("onnxruntime is not installed, cannot load", filename)
+        return None, None
+
+    # Wait until file is fully written before loading
+    if not wait_until_stable(filename):
+        print(f"File {filename} did not stabilize in time, skipping.")
+        return None, None
+
+    print(f"File {filename} is stable, loading model...")
+    model = create_onnx_model(filename, options or {})
+    return get_onnx_model_info(model), model
+
+
+def create_onnx_model(path_or_bytes, options):
+    """Create an inference session (with the model's session options) for an ONNX file or serialized graph."""
+    config = _session_config(options)
+    session = ort.InferenceSession(
+        path_or_bytes,
+        sess_options=_session_options(config),
+        providers=[p for p in ONNX_PROVIDERS if p in ort.get_available_providers()] or None
+    )
+    return OnnxModel(session, config)
+
+
+def _describe(nodes):
+    # Dynamic dimensions are reported by name (e.g. "batch_size") or as None
+    return [
+        {"name": node.name, "shape": list(node.shape) if node.shape is not None else None, "dtype": node.type}
+        for node in nodes
+    ]
+
+
+def get_onnx_model_info(model):
+    inputs = _describe(model.session.get_inputs())
+    outputs = _describe(model.session.get_outputs())
+
+    first = inputs[0] if inputs else {"shape": None, "dtype": "unknown"}
+    input_dtype = model.input_dtypes[0].__name__ if inputs else "unknown"
+
+    example = None
+    if first["shape"] and all(isinstance(dim, int) for dim in first["shape"][1:]):
+        example = np.zeros(first["shape"][1:], dtype=model.input_dtypes[0]).tolist()
+
+    return {
+        "type": "ONNX",
+        "input_shape": first["shape"] or "unknown",
+        "input_dtype": input_dtype,
+        "inputs": inputs,
+        "outputs": outputs,
+        "example": example
+    }
+
+
+def _to_input_array(data, dtype, rank):
+    array = np.asarray(data, dtype=dtype)
+    # A single sample without its batch axis (like the other backends accept)
+    if rank is not None and array.ndim == rank - 1:
+        array = array[None]
+    return array
+
+
+def _named(model, data):
+    """Map an input to {input_name: value}: a dict for multi-input models, the value itself otherwise."""
+    if isinstance(data, dict):
+        missing = [name for name in model.input_names if name not in data]
+        if missing:
+            raise ValueError(f"Missing model inputs: {missing}")
+        return data
+    if len(model.input_names) != 1:
+        raise ValueError(f"Model has inputs {model.input_names}; pass a dict keyed by input name")
+    return {model.input_names[0]: data}
+
+
+def _outputs(model, results):
+    if len(results) == 1:
+        return results[0]
+    return dict(zip(model.output_names, results))
+
+
+def predict_onnx(model, input_data):
+    named = _named(model, input_data)
+    feeds = {
+        name: _to_input_array(named[name], dtype, rank)
+        for name, dtype, rank in zip(model.input_names, model.input_dtypes, model.input_ranks)
+    }
+    return {"predictions": _outputs(model, model.run(feeds))}
+
+
+def predict_onnx_batch(model, instances):
+    # Stack every input over all instances and run the session once
+    row_counts = None
+    feeds = {}
+    for name, dtype, rank in zip(model.input_names, model.input_dtypes, model.input_ranks):
+        if len(model.input_names) == 1 and not isinstance(instances[0], dict):
+            values = instances
+        else:
+            values = [_named(model, instance)[name] for instance in instances]
+        feeds[name], row_counts = stack_instances(
+            values, lambda data: _to_input_array(data, dtype, rank if rank is not None else np.ndim(data) + 1)
+        )
+
+    results = [split_rows(result, row_counts) for result in model.run(feeds)]
+    if len(results) == 1:
+        return [{"predictions": rows} for rows in results[0]]
+    return [
+        {"predictions": dict(zip(model.output_names, parts))}
+        for parts in zip(*results)
+    ]
+
+
+def get_onnx_runtime(model):
+    return {
+        "providers": model.session.get_providers(),
+        "session_options": model.session_config,
+    }
+
+
+@register_backend
+class OnnxBackend(FileBackend):
+    name = "onnx"
+    extensions = ('.onnx',)
+
+    def load(self, path, options):
+        print("Processing ONNX model")
+        return load_onnx(path, options)
+
+    def info(self, model):
+        return get_onnx_model_info(model)
+
+    def runtime(self, model):
+        return get_onnx_runtime(model)
+
+    def predict(self, model, data):
+        return predict_onnx(model, data)
+
+    def predict_batch(self, model, instances):
+        return predict_onnx_batch(model, instances)
@@ -1,9 +1,28 @@
 import importlib.util
+import os
+import statistics
 import sys
+import time
+import weakref
+import numpy as np
 import torch
 from pathlib import Path
 from flask import jsonify
-from utils import wait_until_stable
+from model_handlers.backends import FileBackend, ModelBackend, register_backend
+from utils import wait_until_stable, stack_instances, split_rows
+
+# Optimized inference artifact built at activation when a model does not set "optimize":
+# "none" (eager), "script" / "trace" (TorchScript, frozen + optimize_for_inference),
+# "compile" (torch.compile) or "auto" (script, then trace)
+PYTORCH_OPTIMIZE = os.getenv("PYTORCH_OPTIMIZE", "none")
+OPTIMIZE_MODES = ("none", "script", "trace", "compile", "auto")
+
+# Tolerance of the parity check against eager outputs
+PYTORCH_PARITY_RTOL = float(os.getenv("PYTORCH_PARITY_RTOL", "1e-4"))
+PYTORCH_PARITY_ATOL = float(os.getenv("PYTORCH_PARITY_ATOL", "1e-5"))
+
+# Loaded model -> execution mode and warm latency report
+_runtime_reports = weakref.WeakKeyDictionary()
 
 
 def load_pytorch_file(model_path):
@@ -76,14 +95,180 @@ def get_pytorch_model_info(model):
 
 
 
+def _sample_inputs(info, options):
+    """Inputs for the parity check and latency measurement: one single-row and one 4-row batch."""
+    if options.get("sample_input") is not None:
+        sample = torch.from_numpy(np.asarray(options["sample_input"], dtype=np.float32)[None])
+    elif isinstance(info.get("input_shape"), tuple):
+        sample = torch.randn(*info["input_shape"])
+    else:
+        return None
+    return [sample, torch.randn(4, *sample.shape[1:])]
+
+
+def _outputs_match(actual, expected):
+    if isinstance(expected, torch.Tensor):
+        return (isinstance(actual, torch.Tensor) and actual.shape == expected.shape and
+                torch.allclose(actual, expected, rtol=PYTORCH_PARITY_RTOL, atol=PYTORCH_PARITY_ATOL))
+    if isinstance(expected, (list, tuple)):
+        return (isinstance(actual, (list, tuple)) and len(actual) == len(expected) and
+                all(_outputs_match(a, e) for a, e in zip(actual, expected)))
+    if isinstance(expected, dict):
+        return (isinstance(actual, dict) and actual.keys() == expected.keys() and
+                all(_outputs_match(actual[k], expected[k]) for k in expected))
+    return actual == expected
+
+
+def _build_optimized(model, mode, sample):
+    if mode == "compile":
+        return torch.compile(model)
+    if mode == "script":
+        module = torch.jit.script(model)
+    else:
+        module = torch.jit.trace(model, sample)
+    # Freezes the module (parameters inlined as constants) and applies inference-only graph passes
+    return torch.jit.optimize_for_inference(module)
+
+
+def _warm_latency_ms(model, sample, runs=20):
+    """Median latency of a single-row prediction after a few warm-up calls."""
+    timings = []
+    with torch.inference_mode():
+        for _ in range(3):
+            model(sample)
+        for _ in range(runs):
+            started = time.perf_counter()
+            model(sample)
+            timings.append(time.perf_counter() - started)
+    return round(statistics.median(timings) * 1000, 3)
+
+
+def optimize_pytorch_model(model, info, options):
+    """
+    Build the optimized inference artifact requested by options["optimize"].
+    The artifact is used only if its outputs match eager mode on sample inputs;
+    otherwise (or if building it fails) the eager model is kept.
+    Returns the model to serve.
+    """
+    requested = options.get("optimize", PYTORCH_OPTIMIZE)
+    if requested not in OPTIMIZE_MODES:
+        raise ValueError(f"Unknown optimize mode: {requested}")
+
+    report = {"requested": requested, "mode": "eager"}
+    samples = _sample_inputs(info, options)
+
+    if samples is None:
+        if requested != "none":
+            report["fallback_reason"] = "input shape unknown: pass a sample_input option"
+    else:
+        report["eager_warm_ms"] = _warm_latency_ms(model, samples[0])
+
+    if requested != "none" and samples is not None:
+        with torch.inference_mode():
+            expected = [model(sample) for sample in samples]
+
+        candidates = ("script", "trace") if requested == "auto" else (requested,)
+        for candidate in candidates:
+            try:
+                optimized = _build_optimized(model, candidate, samples[0])
+                with torch.inference_mode():
+                    actual = [optimized(sample) for sample in samples]
+            except Exception as e:
+                report["fallback_reason"] = f"{candidate} failed: {e}"
+                continue
+
+            if not all(_outputs_match(a, e) for a, e in zip(actual, expected)):
+                report["fallback_reason"] = f"{candidate} outputs differ from eager"
+                continue
+
+            model = optimized
+            report["mode"] = candidate
+            report.pop("fallback_reason", None)
+            break
+
+    if samples is not None:
+        optimized = report["mode"] != "eager"
+        report["warm_ms"] = _warm_latency_ms(model, samples[0]) if optimized else report["eager_warm_ms"]
+
+    print(f"PyTorch model runs in {report['mode']} mode: {report}")
+    try:
+        _runtime_reports[model] = report
+    except TypeError:
+        pass
+    return model
+
+
+def get_pytorch_runtime(model):
+    return _runtime_reports.get(model)
+
+
 def predict_pytorch(model, input_data):
-    # Convert input data to tensor
-    tensor_input = torch.tensor([input_data], dtype=torch.float32)
+    # Convert input data to tensor (float32 arrays are shared, not copied)
+    tensor_input = torch.from_numpy(np.asarray(input_data, dtype=np.float32)[None])
 
     # Perform prediction
-    with torch.no_grad():
+    with torch.inference_mode():
         output = model(tensor_input)
 
-    # Convert predictions to JSON
-    response = {"predictions": output.tolist()}
-    return response
\ No newline at end of file
+    # Tensors are encoded to JSON by the serialization layer
+    response = {"predictions": output}
+    return response
+
+
+def predict_pytorch_batch(model, instances):
+    # One float32 array of shape (total_rows, ...) for all instances
+    batch, row_counts = stack_instances(
+        instances, lambda data: np.asarray([data], dtype=np.float32)
+    )
+
+    # Perform a single forward pass for the whole batch
+    with torch.inference_mode():
+        output = model(torch.from_numpy(batch))
+
+    return [{"predictions": rows} for rows in split_rows(output, row_counts)]
+
+
+class _PyTorchPredictMixin:
+    def _optimize(self, loaded, options):
+        info, model = loaded
+        if model is None:
+            return None, None
+        return info, optimize_pytorch_model(model, info, options)
+
+    def info(self, model):
+        return get_pytorch_model_info(model)
+
+    def runtime(self, model):
+        return get_pytorch_runtime(model)
+
+    def predict(self, model, data):
+        return predict_pytorch(model, data)
+
+    def predict_batch(self, model, instances):
+        return predict_pytorch_batch(model, instances)
+
+
+@register_backend
+class PyTorchFileBackend(_PyTorchPredictMixin, FileBackend):
+    name = "pytorch"
+    extensions = ('.pt', '.pth')
+
+    def load(self, path, options):
+        print("Processing PyTorch single-file model (.pt/.pth)")
+        return self._optimize(load_pytorch_file(path), options)
+
+
+@register_backend
+class PyTorchFolderBackend(_PyTorchPredictMixin, ModelBackend):
+    """PyTorch "drop-in folder" format: model.pt (state_dict) + model_class.py"""
+    name = "pytorch-folder"
+
+    def can_load(self, path):
+        return (os.path.isdir(path)
+                and (os.path.exists(os.path.join(path, "model.pt")) or
+                     os.path.exists(os.path.join(path, "model.pth")))
+                and os.path.exists(os.path.join(path, "model_class.py")))
+
+    def load(self, path, options):
+        print("Processing PyTorch folder model")
+        return self._optimize(load_pytorch_folder(path), options)
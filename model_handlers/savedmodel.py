@@ -1,11 +1,99 @@
 import os
+import threading
+import numpy as np
 import requests
 import tensorflow as tf
-from tf_serving_manager import ensure_container
-from utils import find_latest_saved_model_folder, wait_until_stable, transform_to_friendly_inputs
+from model_handlers.backends import ModelBackend, Predictor, register_backend
+from serialization import dumps, JSON_MIMETYPE
+from tf_serving_manager import ensure_container, get_prediction_stub, get_session
+from utils import find_latest_saved_model_folder, wait_until_stable, transform_to_friendly_inputs, split_rows
 
+try:
+    import grpc
+    from tensorflow_serving.apis import predict_pb2
+except ImportError:  # gRPC client is optional, REST is used without it
+    grpc = None
 
-def load_savedmodel(model_folder, version):
+# Protocol used to call TF Serving when a model does not set "serving_protocol": "rest" or "grpc"
+TF_SERVING_PROTOCOL = os.getenv("TF_SERVING_PROTOCOL", "rest")
+TF_SERVING_TIMEOUT = 10
+
+# Where SavedModels run when a model does not set "execution_mode":
+# "container" (TF Serving), "in_process" (this process) or "auto" (in-process up to a size)
+SAVEDMODEL_EXECUTION_MODE = os.getenv("SAVEDMODEL_EXECUTION_MODE", "container")
+SAVEDMODEL_INPROCESS_MAX_MB = float(os.getenv("SAVEDMODEL_INPROCESS_MAX_MB", "200"))
+
+EXECUTION_MODES = ("container", "in_process", "auto")
+
+
+def _folder_size_mb(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, f)) for f in files)
+    return total / (1024 * 1024)
+
+
+def resolve_execution_mode(options, version_path):
+    """Pick "container" or "in_process" for a SavedModel version folder."""
+    mode = options.get("execution_mode", SAVEDMODEL_EXECUTION_MODE)
+    if mode not in EXECUTION_MODES:
+        raise ValueError(f"Unknown execution_mode: {mode}")
+    if mode != "auto":
+        return mode
+
+    max_mb = float(options.get("inprocess_max_mb", SAVEDMODEL_INPROCESS_MAX_MB))
+    size_mb = _folder_size_mb(version_path)
+    mode = "in_process" if size_mb <= max_mb else "container"
+    print(f"SavedModel is {size_mb:.1f} MB (in-process limit {max_mb:.0f} MB), using {mode} execution")
+    return mode
+
+
+class InProcessSavedModel:
+    """
+    A SavedModel signature executed in this process.
+    Keeps one traced function per input signature (input names, dtypes and
+    per-instance shapes), traced with an unknown batch dimension so every batch
+    size reuses it.
+    """
+
+    def __init__(self, loaded, signature_name="serving_default"):
+        self.loaded = loaded  # signatures reference the variables of the loaded object
+        self.signature = loaded.signatures[signature_name]
+        input_specs = self.signature.structured_input_signature[1]
+        self.input_dtypes = {k: v.dtype.name for k, v in input_specs.items()}
+        self._functions = {}
+        self._lock = threading.Lock()
+
+    def _get_function(self, tensors):
+        key = tuple(sorted((name, t.dtype.name, tuple(t.shape[1:])) for name, t in tensors.items()))
+        function = self._functions.get(key)
+        if function is None:
+            with self._lock:
+                function = self._functions.get(key)
+                if function is None:
+                    specs = {
+                        name: tf.TensorSpec([None] + list(t.shape[1:]), t.dtype, name=name)
+                        for name, t in tensors.items()
+                    }
+                    signature = self.signature
+                    function = tf.function(lambda **inputs: signature(**inputs)).get_concrete_function(**specs)
+                    self._functions[key] = function
+        return function
+
+    def __call__(self, named_inputs):
+        tensors = {}
+        for name, values in named_inputs.items():
+            dtype = tf.as_dtype(self.input_dtypes[name]).as_numpy_dtype if name in self.input_dtypes else None
+            tensors[name] = tf.convert_to_tensor(np.asarray(values, dtype=dtype))
+
+        outputs = self._get_function(tensors)(**tensors)
+        return {name: tensor.numpy() for name, tensor in outputs.items()}
+
+    def traced_signatures(self):
+        return len(self._functions)
+
+
+def load_savedmodel(model_folder, version, execution_mode="container"):
     print("model_folder:", model_folder)
     # Wait until file is fully written before loading
     if wait_until_stable(model_folder):
@@ -26,15 +114,18 @@ def load_savedmodel(model_folder, version):
     model_subdir = model_name
     print("model_subdir:", model_subdir)
 
-    info = ensure_container(model_name, model_subdir)
+    if execution_mode == "container":
+        info = ensure_container(model_name, model_subdir)
 
     try:
         loaded = tf.saved_model.load(f"{model_folder}/{version}")
         signatures = list(loaded.signatures.keys())
         signature = loaded.signatures["serving_default"]
 
-        input_info = {k: str(v) for k, v in signature.structured_input_signature[1].items()}
+        input_specs = signature.structured_input_signature[1]
+        input_info = {k: str(v) for k, v in input_specs.items()}
         output_info = {k: str(v) for k, v in signature.structured_outputs.items()}
+        input_dtypes = {k: v.dtype.name for k, v in input_specs.items()}
 
     except Exception as e:
         print("ERROR getting model_info:", str(e))
@@ -45,22 +136,65 @@ def load_savedmodel(model_folder, version):
         "model_name": model_name,
         "signatures": signatures,
         "inputs": input_info,
-        "outputs": output_info
+        "outputs": output_info,
+        "execution_mode": execution_mode
     }
 
-    return model_info, info["serving_url"]
+    if execution_mode == "in_process":
+        return model_info, InProcessSavedModel(loaded)
+
+    # Container endpoints plus what the gRPC client needs to build TensorProtos
+    serving_info = dict(info, input_dtypes=input_dtypes)
+
+    return model_info, serving_info
     
 
-def predict_savedmodel(serving_url, input_data):
+def _extract_instances(input_data):
     if isinstance(input_data, dict) and "input" in input_data:
-        instances = input_data["input"]
-    else:
-        instances = input_data
+        return input_data["input"]
+    return input_data
 
-    payload = {"instances": instances}
+
+def _named_inputs(instances, input_dtypes):
+    """Map request instances to signature inputs (a bare list/array feeds the only input)."""
+    if isinstance(instances, dict):
+        return instances
+    if len(input_dtypes) == 1:
+        return {next(iter(input_dtypes)): instances}
+    raise ValueError("Model has several inputs: pass them as a dict keyed by input name")
+
+
+def _split_predictions(predictions, row_counts):
+    if isinstance(predictions, dict):
+        parts = {name: split_rows(values, row_counts) for name, values in predictions.items()}
+        return [{"predictions": {name: parts[name][i] for name in parts}} for i in range(len(row_counts))]
+    return [{"predictions": rows} for rows in split_rows(predictions, row_counts)]
+
+
+def _merge_instances(inputs):
+    per_request = [_extract_instances(input_data) for input_data in inputs]
+    if any(isinstance(instances, dict) for instances in per_request):
+        raise ValueError("Batching is not supported for named (multi-input) requests")
+
+    row_counts = [len(instances) for instances in per_request]
+    return np.concatenate([np.asarray(instances) for instances in per_request]), row_counts
+
+
+def predict_savedmodel(serving_url, input_data, session=None):
+    # session: the container's pooled keep-alive session (see tf_serving_manager.get_session)
+    http = session or requests
+    instances = _extract_instances(input_data)
+
+    # Array inputs are encoded directly, without converting to lists first
+    payload = dumps({"instances": instances})
 
     try:
-        response = requests.post(serving_url, json=payload, timeout=10)
+        response = http.post(
+            serving_url,
+            data=payload,
+            headers={"Content-Type": JSON_MIMETYPE},
+            timeout=TF_SERVING_TIMEOUT
+        )
         response.raise_for_status()
 
         result = response.json()
@@ -76,7 +210,7 @@ def predict_savedmodel(serving_url, input_data):
         metadata_url = serving_url.replace(":predict", "") + "/metadata"
 
         try:
-            meta_resp = requests.get(metadata_url, timeout=5)
+            meta_resp = http.get(metadata_url, timeout=5)
             meta_resp.raise_for_status()
             metadata = meta_resp.json()
             friendly_inputs = transform_to_friendly_inputs(metadata)
@@ -92,4 +226,174 @@ def predict_savedmodel(serving_url, input_data):
                 "tf_serving_error": str(e)
             }
         )
-    
\ No newline at end of file
+
+
+def predict_savedmodel_batch(serving_url, inputs, session=None):
+    # Merge the instances of every request into one TF Serving call
+    per_request = [_extract_instances(input_data) for input_data in inputs]
+    row_counts = [len(instances) for instances in per_request]
+    merged = [row for instances in per_request for row in instances]
+
+    predictions = predict_savedmodel(serving_url, merged, session).get("predictions")
+    if not isinstance(predictions, list) or len(predictions) != len(merged):
+        raise RuntimeError("TF Serving returned predictions that cannot be split per request")
+
+    return [{"predictions": rows} for rows in split_rows(predictions, row_counts)]
+
+
+def predict_savedmodel_grpc(serving_info, input_data):
+    """
+    Predict through TF Serving's gRPC PredictionService.
+    Inputs are sent as TensorProtos (no JSON encoding of float tensors).
+    """
+    input_dtypes = serving_info.get("input_dtypes", {})
+    named_inputs = _named_inputs(_extract_instances(input_data), input_dtypes)
+
+    request = predict_pb2.PredictRequest()
+    request.model_spec.name = serving_info["model_name"]
+    request.model_spec.signature_name = "serving_default"
+    for name, values in named_inputs.items():
+        dtype = tf.as_dtype(input_dtypes[name]).as_numpy_dtype if name in input_dtypes else None
+        request.inputs[name].CopyFrom(tf.make_tensor_proto(np.asarray(values, dtype=dtype)))
+
+    stub = get_prediction_stub(serving_info["model_name"], serving_info["grpc_target"])
+    response = stub.Predict(request, timeout=TF_SERVING_TIMEOUT)
+
+    outputs = {name: tf.make_ndarray(tensor) for name, tensor in response.outputs.items()}
+    predictions = next(iter(outputs.values())) if len(outputs) == 1 else outputs
+
+    return {"predictions": predictions}
+
+
+def predict_savedmodel_grpc_batch(serving_info, inputs):
+    # Concatenate the instances of every request into one TensorProto
+    merged, row_counts = _merge_instances(inputs)
+    predictions = predict_savedmodel_grpc(serving_info, merged)["predictions"]
+    return _split_predictions(predictions, row_counts)
+
+
+def predict_savedmodel_inprocess(saved_model, input_data):
+    """Run the serving signature in this process (no container, no JSON round trip)."""
+    named_inputs = _named_inputs(_extract_instances(input_data), saved_model.input_dtypes)
+    outputs = saved_model(named_inputs)
+    predictions = next(iter(outputs.values())) if len(outputs) == 1 else outputs
+    return {"predictions": predictions}
+
+
+def predict_savedmodel_inprocess_batch(saved_model, inputs):
+    # Concatenate the instances of every request into one signature call
+    merged, row_counts = _merge_instances(inputs)
+    predictions = predict_savedmodel_inprocess(saved_model, merged)["predictions"]
+    return _split_predictions(predictions, row_counts)
+
+
+@register_backend
+class SavedModelBackend(ModelBackend):
+    """TensorFlow SavedModel with numeric version folders, served by a TF Serving container."""
+    name = "savedmodel"
+
+    def can_load(self, path):
+        if not os.path.isdir(path):
+            return False
+        version_dirs = [d for d in os.listdir(path) if os.path.isdir(os.path.join(path, d))]
+        return bool(version_dirs) and all(
+            d.isdigit() and os.path.exists(os.path.join(path, d, "saved_model.pb"))
+            for d in version_dirs
+        )
+
+    def load(self, path, options):
+        latest_version = max(
+            (d for d in os.listdir(path) if d.isdigit() and os.path.isdir(os.path.join(path, d))),
+            key=int
+        )
+        print(f"Processing TensorFlow SavedModel (TF Serving format), version={latest_version}")
+        execution_mode = resolve_execution_mode(options, os.path.join(path, latest_version))
+        result = load_savedmodel(path, latest_version, execution_mode)
+        if not isinstance(result, tuple):
+            return None, None
+        return result
+
+    def info(self, serving_info):
+        metadata_url = serving_info["serving_url"].replace(":predict", "") + "/metadata"
+        response = get_session(serving_info["model_name"]).get(metadata_url, timeout=5)
+        response.raise_for_status()
+        return {
+            "type": "TensorFlow SavedModel",
+            "inputs": transform_to_friendly_inputs(response.json())
+        }
+
+    def predict(self, serving_info, data):
+        return predict_savedmodel(serving_info["serving_url"], data, get_session(serving_info["model_name"]))
+
+    def predict_batch(self, serving_info, instances):
+        return predict_savedmodel_batch(
+            serving_info["serving_url"], instances, get_session(serving_info["model_name"])
+        )
+
+    def bind(self, serving_info, options):
+        if isinstance(serving_info, InProcessSavedModel):
+            return Predictor(_inprocess_backend, serving_info)
+
+        protocol = options.get("serving_protocol", TF_SERVING_PROTOCOL)
+        if protocol == "grpc":
+            if grpc is not None:
+                return Predictor(_grpc_backend, serving_info)
+            print("gRPC client not installed, using the TF Serving REST API")
+        elif protocol != "rest":
+            raise ValueError(f"Unknown serving_protocol: {protocol}")
+        return Predictor(self, serving_info)
+
+
+class SavedModelGrpcBackend(SavedModelBackend):
+    """
+    Same SavedModels, predicted over gRPC with a persistent channel per container.
+    Not registered: selected by SavedModelBackend.bind(). Falls back to REST while
+    the gRPC endpoint is unavailable.
+    """
+    name = "savedmodel-grpc"
+
+    def predict(self, serving_info, data):
+        try:
+            return predict_savedmodel_grpc(serving_info, data)
+        except grpc.RpcError as e:
+            if e.code() != grpc.StatusCode.UNAVAILABLE:
+                raise
+            print(f"gRPC endpoint unavailable ({e.details()}), falling back to REST")
+            return super().predict(serving_info, data)
+
+    def predict_batch(self, serving_info, instances):
+        try:
+            return predict_savedmodel_grpc_batch(serving_info, instances)
+        except grpc.RpcError as e:
+            if e.code() != grpc.StatusCode.UNAVAILABLE:
+                raise
+            print(f"gRPC endpoint unavailable ({e.details()}), falling back to REST")
+            return super().predict_batch(serving_info, instances)
+
+
+_grpc_backend = SavedModelGrpcBackend()
+
+
+class SavedModelInProcessBackend(SavedModelBackend):
+    """
+    Same SavedModels, executed in this process without a TF Serving container.
+    Not registered: selected by SavedModelBackend.bind() for models loaded with
+    execution_mode "in_process" (or "auto" below the size limit).
+    """
+    name = "savedmodel-inprocess"
+
+    def info(self, saved_model):
+        input_specs = saved_model.signature.structured_input_signature[1]
+        return {
+            "type": "TensorFlow SavedModel",
+            "inputs": {k: str(v) for k, v in input_specs.items()}
+        }
+
+    def predict(self, saved_model, data):
+        return predict_savedmodel_inprocess(saved_model, data)
+
+    def predict_batch(self, saved_model, instances):
+        return predict_savedmodel_inprocess_batch(saved_model, instances)
+
+
+_inprocess_backend = SavedModelInProcessBackend()
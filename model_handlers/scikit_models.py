@@ -1,17 +1,95 @@
+import hashlib
+import os
+import tempfile
+import weakref
 import joblib
 import numpy as np
-from utils import make_json_serializable, wait_until_stable
+from model_handlers.backends import FileBackend, register_backend
+from utils import wait_until_stable, stack_instances, split_rows, mapped_file_memory
 
+# Memory-mapped loading: the model is re-dumped uncompressed into a local cache
+# directory and loaded with mmap_mode="r", so its arrays live in the page cache
+# and are shared by every process (and activation) that maps the same file
+SKLEARN_MMAP = os.getenv("SKLEARN_MMAP", "false").lower() == "true"
+SKLEARN_MMAP_CACHE_DIR = os.getenv("SKLEARN_MMAP_CACHE_DIR",
+                                   os.path.join(tempfile.gettempdir(), "sklearn_mmap_cache"))
 
-def load_joblib(filename):
+# Loaded model -> memory-mapped cache file
+_mmap_files = weakref.WeakKeyDictionary()
+
+
+def _mmap_source_key(filename):
+    # Identifies the model file, whatever its version
+    return hashlib.sha1(os.path.abspath(filename).encode("utf-8")).hexdigest()[:12]
+
+
+def _mmap_cache_path(filename):
+    # Keyed by path, size and mtime: a replaced model file gets a new cache entry
+    stat = os.stat(filename)
+    version = hashlib.sha1(f"{stat.st_size}:{stat.st_mtime_ns}".encode("utf-8")).hexdigest()[:16]
+    name = os.path.splitext(os.path.basename(filename))[0]
+    return os.path.join(SKLEARN_MMAP_CACHE_DIR, f"{name}-{_mmap_source_key(filename)}-{version}.joblib")
+
+
+def _ensure_mmap_copy(filename):
+    cache_path = _mmap_cache_path(filename)
+    if os.path.exists(cache_path):
+        return cache_path
+
+    os.makedirs(SKLEARN_MMAP_CACHE_DIR, exist_ok=True)
+    print(f"Writing memory-mappable copy of {filename} to {cache_path}")
+
+    # Uncompressed dump: joblib stores the arrays in a layout numpy can map
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    joblib.dump(joblib.load(filename), tmp_path)
+    os.replace(tmp_path, cache_path)  # concurrent writers produce identical files
+
+    # Drop copies of older versions of the same model file (same source key, other version)
+    source_key = _mmap_source_key(filename)
+    for entry in os.listdir(SKLEARN_MMAP_CACHE_DIR):
+        parts = entry.rsplit("-", 2)
+        if (len(parts) == 3 and parts[1] == source_key and entry.endswith(".joblib")
+                and entry != os.path.basename(cache_path)):
+            try:
+                os.remove(os.path.join(SKLEARN_MMAP_CACHE_DIR, entry))
+            except OSError:
+                pass
+
+    return cache_path
+
+
+def load_joblib(filename, mmap=False):
     # Wait until file is fully written before loading
     if wait_until_stable(filename):
         print(f"File {filename} is stable, loading model...")
-        model = joblib.load(filename)
+        if mmap:
+            cache_path = _ensure_mmap_copy(filename)
+            model = joblib.load(cache_path, mmap_mode="r")
+            try:
+                _mmap_files[model] = cache_path
+            except TypeError:  # estimator not weak-referenceable/hashable: no memory report
+                pass
+        else:
+            model = joblib.load(filename)
         info = get_scikit_model_info(model)
         return info, model
     else:
         print(f"File {filename} did not stabilize in time, skipping.")    
+
+
+def get_scikit_model_memory(model):
+    """
+    Memory of a memory-mapped model's arrays in this process (None if not memory-mapped).
+    Its footprint is the size of the mapped file, which its pages can fill at most.
+    """
+    cache_path = _mmap_files.get(model)
+    if cache_path is None:
+        return None
+    try:
+        footprint_mb = round(os.path.getsize(cache_path) / (1024 * 1024), 1)
+    except OSError:
+        footprint_mb = None
+    return dict(mapped_file_memory(cache_path) or {}, mmap_file=cache_path, footprint_mb=footprint_mb)
     
 
 def get_scikit_model_info(model):
@@ -38,21 +116,54 @@ def get_scikit_model_info(model):
     }
 
 
-def predict_joblib(model, input_data):
-    print("Going to predict with data:", input_data)
-
-    # Convert to numpy array for easier shape handling
-    X = np.array(input_data)
+def _to_feature_matrix(input_data):
+    # Convert to numpy array for easier shape handling (arrays are used as-is)
+    X = np.asarray(input_data)
 
     # If input is 1D (single sample like [25.1, 55, 30.5]),
     # reshape it to (1, n_features)
     if X.ndim == 1:
         X = X.reshape(1, -1)
 
+    return X
+
+
+def predict_joblib(model, input_data):
+    print("Going to predict with data:", input_data)
+
+    X = _to_feature_matrix(input_data)
+
     # Perform prediction
     predictions = model.predict(X)
 
-    # Convert to pure Python types (int, float, list)
-    predictions = make_json_serializable(predictions)
+    return predictions
+
+
+def predict_joblib_batch(model, instances):
+    # Stack all instances into one feature matrix and predict in a single call
+    X, row_counts = stack_instances(instances, _to_feature_matrix)
+    predictions = model.predict(X)
+
+    return split_rows(predictions, row_counts)
+
+
+@register_backend
+class ScikitBackend(FileBackend):
+    name = "scikit-learn"
+    extensions = ('.pkl', '.joblib')
+
+    def load(self, path, options):
+        print("Processing model from Scikit-learn")
+        return load_joblib(path, mmap=bool(options.get("mmap", SKLEARN_MMAP))) or (None, None)
+
+    def info(self, model):
+        return get_scikit_model_info(model)
+
+    def memory(self, model):
+        return get_scikit_model_memory(model)
+
+    def predict(self, model, data):
+        return predict_joblib(model, data)
 
-    return predictions
\ No newline at end of file
+    def predict_batch(self, model, instances):
+        return predict_joblib_batch(model, instances)
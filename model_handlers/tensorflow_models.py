@@ -1,6 +1,14 @@
+import os
+import statistics
+import time
+import numpy as np
 import tensorflow as tf
-from flask import jsonify
-from utils import wait_until_stable
+from model_handlers.backends import FileBackend, register_backend
+from utils import wait_until_stable, stack_instances, split_rows
+
+# How Keras models are called when a model does not set "keras_predict_mode":
+# "function" (cached tf.function, training=False) or "predict" (model.predict loop)
+KERAS_PREDICT_MODE = os.getenv("KERAS_PREDICT_MODE", "function")
 
 
 def load_tensorflow(model_path):
@@ -20,6 +28,7 @@ def get_tensorflow_model_info(model):
     model.summary()
 
     # Input shape
+    input_type = "unknown"
     try:
         input_shape = model.input_shape
         input_type = str(model.inputs[0].dtype)
@@ -41,11 +50,189 @@ def get_tensorflow_model_info(model):
     }
 
 
+class KerasServingFunction:
+    """
+    A Keras model called through one cached tf.function with training=False.
+    The input signature leaves the batch dimension open, so single requests and
+    batches of any size reuse the same traced graph (no model.predict loop).
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.report = None
+
+        try:
+            self.input_dtypes = [tf.as_dtype(t.dtype).as_numpy_dtype for t in model.inputs]
+            signature = [tf.TensorSpec([None] + list(t.shape[1:]), t.dtype) for t in model.inputs]
+        except (AttributeError, TypeError):
+            # Subclassed models without symbolic inputs: trace on first call
+            self.input_dtypes = None
+            signature = None
+
+        if signature is not None and len(signature) == 1:
+            self._function = tf.function(lambda x: model(x, training=False), input_signature=signature)
+        elif signature is not None:
+            self._function = tf.function(lambda *xs: model(list(xs), training=False), input_signature=signature)
+        else:
+            self._function = tf.function(lambda x: model(x, training=False), reduce_retracing=True)
+
+    def _to_tensors(self, batch):
+        if self.input_dtypes is None:
+            return [tf.convert_to_tensor(np.asarray(batch, dtype=np.float32))]
+        if len(self.input_dtypes) == 1:
+            return [tf.convert_to_tensor(np.asarray(batch, dtype=self.input_dtypes[0]))]
+        # Multi-input models: one array per input
+        return [tf.convert_to_tensor(np.asarray(x, dtype=dtype)) for x, dtype in zip(batch, self.input_dtypes)]
+
+    def __call__(self, batch):
+        outputs = self._function(*self._to_tensors(batch))
+        return tf.nest.map_structure(lambda t: t.numpy(), outputs)
+
+    def warm_up(self, runs=20):
+        """Trace the graph once and measure the warm latency of a single-row call."""
+        shapes = [t.shape[1:] for t in self.model.inputs] if self.input_dtypes else None
+        if shapes is None or any(None in shape for shape in shapes):
+            self.report = {"mode": "tf.function", "warm_ms": None}
+            return
+
+        sample = [np.zeros([1] + list(shape), dtype=dtype) for shape, dtype in zip(shapes, self.input_dtypes)]
+        sample = sample[0] if len(sample) == 1 else sample
+
+        started = time.perf_counter()
+        self(sample)
+        trace_ms = (time.perf_counter() - started) * 1000
+
+        timings = []
+        for _ in range(runs):
+            started = time.perf_counter()
+            self(sample)
+            timings.append(time.perf_counter() - started)
+
+        self.report = {
+            "mode": "tf.function",
+            "trace_ms": round(trace_ms, 3),
+            "warm_ms": round(statistics.median(timings) * 1000, 3)
+        }
+        print(f"Keras model warmed up: {self.report}")
+
+
+def _keras_model(model):
+    return model.model if isinstance(model, KerasServingFunction) else model
+
+
+def _input_names(model):
+    """Names of the model inputs ([] for subclassed models without symbolic inputs)."""
+    try:
+        return list(getattr(model, "input_names", None) or [t.name.split(":")[0] for t in model.inputs])
+    except (AttributeError, TypeError):
+        return []
+
+
+def _input_values(input_names, data):
+    """
+    Split one request into one value per model input: multi-input models take a dict
+    keyed by input name or a list with one value per input, in the model's input order.
+    """
+    if len(input_names) <= 1:
+        return [data]
+    if isinstance(data, dict):
+        missing = [name for name in input_names if name not in data]
+        if missing:
+            raise ValueError(f"Missing model inputs: {missing}")
+        return [data[name] for name in input_names]
+    if isinstance(data, (list, tuple)) and len(data) == len(input_names):
+        return list(data)
+    raise ValueError(f"Model has inputs {input_names}; pass a dict keyed by input name "
+                     f"or a list with one value per input")
+
+
+def _run(model, inputs):
+    """Run the model on one batched array per input."""
+    if isinstance(model, KerasServingFunction):
+        return model(inputs[0] if len(inputs) == 1 else inputs)
+    if len(inputs) == 1:
+        return model.predict(tf.constant(inputs[0]), verbose=0)
+    return model.predict([tf.constant(x) for x in inputs], verbose=0)
+
+
+def _named_outputs(model, predictions):
+    """One array for single-output models, {output_name: array} for multi-output ones."""
+    if isinstance(predictions, (list, tuple)):
+        if len(predictions) == 1:
+            return predictions[0]
+        names = list(getattr(_keras_model(model), "output_names", None) or [])
+        if len(names) != len(predictions):
+            names = [f"output_{i}" for i in range(len(predictions))]
+        return dict(zip(names, predictions))
+    return predictions
+
+
 def predict_tensorflow(model, input_data):
-    # Perform prediction using the loaded model
-    predictions = model.predict(tf.constant([input_data]))
+    input_names = _input_names(_keras_model(model))
+    inputs = [np.asarray(value)[None] for value in _input_values(input_names, input_data)]
+    predictions = _named_outputs(model, _run(model, inputs))
+
+    # Arrays are encoded by the serialization layer
+    return {"predictions": predictions}
+
+
+def predict_tensorflow_batch(model, instances):
+    # Stack all instances, input by input, so the model runs once for the whole batch
+    input_names = _input_names(_keras_model(model))
+    if len(input_names) <= 1:
+        per_input = [instances]
+    else:
+        values = [_input_values(input_names, instance) for instance in instances]
+        per_input = [[instance_values[i] for instance_values in values] for i in range(len(input_names))]
+
+    inputs = []
+    row_counts = None
+    for input_instances in per_input:
+        batch, counts = stack_instances(input_instances, lambda data: np.asarray([data]))
+        if row_counts is not None and counts != row_counts:
+            raise ValueError("Every input of an instance must have the same number of rows")
+        inputs.append(batch)
+        row_counts = counts
+
+    predictions = _named_outputs(model, _run(model, inputs))
+    if isinstance(predictions, dict):
+        parts = {name: split_rows(values, row_counts) for name, values in predictions.items()}
+        return [{"predictions": {name: parts[name][i] for name in parts}} for i in range(len(row_counts))]
+    return [{"predictions": rows} for rows in split_rows(predictions, row_counts)]
+
+
+@register_backend
+class KerasBackend(FileBackend):
+    name = "keras"
+    extensions = ('.h5', '.keras')
+
+    def load(self, path, options):
+        print("Processing model from Tensorflow (.h5 or .keras)")
+        info, model = load_tensorflow(path) or (None, None)
+        if model is None:
+            return None, None
+
+        mode = options.get("keras_predict_mode", KERAS_PREDICT_MODE)
+        if mode == "function":
+            model = KerasServingFunction(model)
+            model.warm_up()
+        elif mode != "predict":
+            raise ValueError(f"Unknown keras_predict_mode: {mode}")
+
+        return info, model
+
+    def info(self, model):
+        if isinstance(model, KerasServingFunction):
+            model = model.model
+        return get_tensorflow_model_info(model)
+
+    def runtime(self, model):
+        if isinstance(model, KerasServingFunction):
+            return model.report
+        return {"mode": "model.predict"}
 
-    # Convert predictions to a JSON response
-    response = {'predictions': predictions.tolist()}
+    def predict(self, model, data):
+        return predict_tensorflow(model, data)
 
-    return jsonify(response)
\ No newline at end of file
+    def predict_batch(self, model, instances):
+        return predict_tensorflow_batch(model, instances)
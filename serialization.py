@@ -0,0 +1,221 @@
+"""
+Encoding of prediction inputs and results.
+
+JSON: NumPy arrays, NumPy scalars and PyTorch tensors are encoded straight to JSON
+bytes with orjson, without first converting them to nested Python lists. A prediction
+is encoded once and the bytes are spliced into both the HTTP response and the outbound
+Kafka/MQTT message with encode_envelope().
+Falls back to the standard json module when orjson is not installed.
+
+Binary: raw .npy, msgpack (ndarrays as an extension type carrying .npy bytes) and
+Arrow IPC streams decode into NumPy arrays without per-element Python objects.
+msgpack and pyarrow are optional; their formats are unavailable without them.
+"""
+import io
+import json
+
+import numpy as np
+import torch
+
+from utils import make_json_serializable
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - optional format
+    msgpack = None
+
+try:
+    import pyarrow as pa
+except ImportError:  # pragma: no cover - optional format
+    pa = None
+
+JSON_MIMETYPE = "application/json"
+NPY_MIMETYPE = "application/x-npy"
+MSGPACK_MIMETYPE = "application/msgpack"
+ARROW_MIMETYPE = "application/vnd.apache.arrow.stream"
+
+# msgpack extension type code for ndarrays (payload is the array in .npy format)
+MSGPACK_NDARRAY_EXT = 1
+
+
+class UnsupportedFormatError(ValueError):
+    """Raised for a content type that is unknown or whose optional dependency is missing."""
+
+
+def _default(obj):
+    """orjson fallback for types it does not encode natively."""
+    if isinstance(obj, torch.Tensor):
+        return obj.detach().cpu().numpy()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, np.ndarray):
+        # Non-contiguous arrays or dtypes orjson does not support natively
+        return obj.tolist()
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(obj) -> bytes:
+    """Encode an object (which may contain arrays/tensors) to JSON bytes."""
+    if orjson is not None:
+        return orjson.dumps(
+            obj,
+            default=_default,
+            option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+        )
+    return json.dumps(make_json_serializable(obj)).encode("utf-8")
+
+
+def encode_envelope(fields: dict, raw_fields: dict) -> bytes:
+    """
+    Encode a JSON object made of regular fields plus fields whose values are
+    already-encoded JSON bytes, without decoding or re-encoding those values.
+
+    Example:
+        encode_envelope({"status": "sent"}, {"prediction": dumps(result)})
+    """
+    body = dumps(fields)
+    extra = b",".join(dumps(key) + b":" + value for key, value in raw_fields.items())
+
+    if not extra:
+        return body
+    if body == b"{}":
+        return b"{" + extra + b"}"
+    return body[:-1] + b"," + extra + b"}"
+
+
+# === Binary formats ===
+
+def available_mimetypes() -> list:
+    """Content types that can be decoded/encoded with the installed packages (JSON first)."""
+    mimetypes = [JSON_MIMETYPE, NPY_MIMETYPE]
+    if msgpack is not None:
+        mimetypes.append(MSGPACK_MIMETYPE)
+    if pa is not None:
+        mimetypes.append(ARROW_MIMETYPE)
+    return mimetypes
+
+
+def _to_numpy(obj) -> np.ndarray:
+    if isinstance(obj, torch.Tensor):
+        return obj.detach().cpu().numpy()
+    if isinstance(obj, (list, tuple)) and obj and isinstance(obj[0], (np.ndarray, torch.Tensor)):
+        # e.g. per-instance results of a batch prediction
+        return np.stack([_to_numpy(item) for item in obj])
+    return np.asarray(obj)
+
+
+def decode_npy(buffer) -> np.ndarray:
+    """
+    Decode .npy bytes into an array that shares memory with the buffer.
+    Pass a bytearray to get a writable array (e.g. for torch.from_numpy).
+    """
+    stream = io.BytesIO(buffer)
+    version = np.lib.format.read_magic(stream)
+    if version == (1, 0):
+        shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(stream)
+    else:
+        shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(stream)
+
+    if dtype.hasobject:
+        raise ValueError("Object arrays are not accepted")
+
+    count = int(np.prod(shape, dtype=np.int64))
+    array = np.frombuffer(buffer, dtype=dtype, count=count, offset=stream.tell())
+    return array.reshape(shape, order="F" if fortran_order else "C")
+
+
+def encode_npy(obj) -> bytes:
+    """Encode an array (or tensor) as .npy bytes."""
+    stream = io.BytesIO()
+    np.save(stream, _to_numpy(obj), allow_pickle=False)
+    return stream.getvalue()
+
+
+def _msgpack_default(obj):
+    if isinstance(obj, (np.ndarray, torch.Tensor)):
+        return msgpack.ExtType(MSGPACK_NDARRAY_EXT, encode_npy(obj))
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not msgpack serializable")
+
+
+def _msgpack_ext_hook(code, data):
+    if code == MSGPACK_NDARRAY_EXT:
+        return decode_npy(bytearray(data))
+    return msgpack.ExtType(code, data)
+
+
+def _arrow_to_numpy(table) -> np.ndarray:
+    """
+    Convert an Arrow table to an array: a single fixed-size-list column becomes a 2-D
+    array, numeric columns become the columns of a (rows, columns) feature matrix.
+    """
+    if table.num_columns == 1 and pa.types.is_fixed_size_list(table.column(0).type):
+        column = table.column(0).combine_chunks()
+        return column.flatten().to_numpy().reshape(len(column), column.type.list_size)
+
+    columns = [column.to_numpy() for column in table.columns]
+    return columns[0] if len(columns) == 1 else np.column_stack(columns)
+
+
+def _numpy_to_arrow(array: np.ndarray):
+    if array.ndim <= 1:
+        return pa.table({"prediction": np.atleast_1d(array)})
+    if array.ndim == 2:
+        return pa.table({f"output_{i}": array[:, i] for i in range(array.shape[1])})
+
+    # Higher rank: one fixed-size-list row per sample, original shape in the schema metadata
+    flat = np.ascontiguousarray(array).reshape(len(array), -1)
+    column = pa.FixedSizeListArray.from_arrays(pa.array(flat.reshape(-1)), flat.shape[1])
+    table = pa.table({"prediction": column})
+    return table.replace_schema_metadata({"shape": json.dumps(list(array.shape))})
+
+
+def decode_body(mimetype: str, buffer, field: str) -> dict:
+    """
+    Decode a binary request body into a payload dict.
+    .npy and Arrow bodies carry only the tensor and are returned as {field: array};
+    msgpack bodies may be a map (like the JSON body) or a bare array.
+    """
+    if mimetype == NPY_MIMETYPE:
+        return {field: decode_npy(buffer)}
+
+    if mimetype == MSGPACK_MIMETYPE and msgpack is not None:
+        obj = msgpack.unpackb(buffer, ext_hook=_msgpack_ext_hook, raw=False)
+        return obj if isinstance(obj, dict) else {field: obj}
+
+    if mimetype == ARROW_MIMETYPE and pa is not None:
+        table = pa.ipc.open_stream(pa.py_buffer(buffer)).read_all()
+        return {field: _arrow_to_numpy(table)}
+
+    raise UnsupportedFormatError(f"Unsupported content type: {mimetype}")
+
+
+def encode_body(mimetype: str, envelope: dict, field: str) -> bytes:
+    """
+    Encode a response in a binary format.
+    msgpack keeps the whole envelope; .npy and Arrow carry only envelope[field].
+    """
+    if mimetype == NPY_MIMETYPE:
+        return encode_npy(envelope[field])
+
+    if mimetype == MSGPACK_MIMETYPE and msgpack is not None:
+        return msgpack.packb(envelope, default=_msgpack_default)
+
+    if mimetype == ARROW_MIMETYPE and pa is not None:
+        sink = pa.BufferOutputStream()
+        table = _numpy_to_arrow(_to_numpy(envelope[field]))
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue().to_pybytes()
+
+    raise UnsupportedFormatError(f"Unsupported content type: {mimetype}")
@@ -0,0 +1,60 @@
+"""
+Request validation and response encoding of the /predict endpoints.
+Inference and publishing are replaced, so no model or broker is needed.
+"""
+import os
+import sys
+from unittest import mock
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("GITHUB_REPO", "owner/repo")
+
+# The TF Serving manager connects to Docker at import
+with mock.patch("docker.from_env"):
+    import api.rest_api as rest_api
+from serialization import encode_npy
+
+
+@pytest.fixture
+def published(monkeypatch):
+    messages = []
+    monkeypatch.setattr(rest_api.prediction_service, "publish_prediction",
+                        lambda model_name, encoded, key="prediction": messages.append(encoded) or True)
+    return messages
+
+
+@pytest.fixture
+def client():
+    return rest_api.app.test_client()
+
+
+def test_batch_accepts_instances_with_different_row_counts(client, published, monkeypatch):
+    monkeypatch.setattr(rest_api.prediction_service, "predict_batch",
+                        lambda model_name, instances, wait_s=None: [len(np.atleast_2d(i)) for i in instances])
+
+    response = client.post("/predict/model/batch", json={"instances": [[1, 2, 3], [[1, 1, 1], [2, 2, 2]]]})
+
+    assert response.status_code == 200
+    assert response.get_json()["predictions"] == [1, 2]
+    assert len(published) == 1
+
+
+def test_batch_rejects_scalar_array(client, published):
+    response = client.post("/predict/model/batch", data=encode_npy(np.array(3.0)),
+                           content_type="application/x-npy")
+
+    assert response.status_code == 400
+    assert not published
+
+
+def test_unencodable_prediction_is_not_acceptable_and_not_published(client, published, monkeypatch):
+    monkeypatch.setattr(rest_api.prediction_service, "predict",
+                        lambda model_name, features, wait_s=None: {"a": np.ones(2), "b": np.zeros(1)})
+
+    response = client.post("/predict/model", json={"input": [1, 2, 3]}, headers={"Accept": "application/x-npy"})
+
+    assert response.status_code == 406
+    assert not published
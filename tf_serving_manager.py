@@ -1,12 +1,26 @@
-import time, json, requests, docker
+import os, time, json, requests, docker, threading, fcntl
+from contextlib import contextmanager
 from pathlib import Path
 import logging
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import grpc
+    from tensorflow_serving.apis import prediction_service_pb2_grpc
+except ImportError:  # gRPC client is optional, REST is used without it
+    grpc = None
 
 
 LABEL_KEY = "project"
 LABEL_VAL = "ModelServerREST"
 REGISTRY = Path(".tfserving_registry.json")
 
+# Keep-alive connection pool per container
+TF_SERVING_POOL_SIZE = int(os.getenv("TF_SERVING_POOL_SIZE", "10"))
+TF_SERVING_MAX_RETRIES = int(os.getenv("TF_SERVING_MAX_RETRIES", "3"))
+TF_SERVING_RETRY_BACKOFF = float(os.getenv("TF_SERVING_RETRY_BACKOFF", "0.2"))
+
 client = docker.from_env()
 
 # Configure logging
@@ -16,18 +30,152 @@ logging.basicConfig(
     datefmt='%Y-%m-%d %H:%M:%S'
 )
 
-def _load_registry():
+@contextmanager
+def _registry_locked():
+    # The registry is shared by every worker process: guard read-modify-writes
+    with open(f"{REGISTRY}.lock", "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def _read_registry():
     if REGISTRY.exists():
         return json.loads(REGISTRY.read_text(encoding="utf-8"))
     return {}
 
-def _save_registry(data):
-    REGISTRY.write_text(json.dumps(data, indent=2), encoding="utf-8")
+def _load_registry():
+    with _registry_locked():
+        return _read_registry()
+
+def _update_registry(mutate):
+    """Apply mutate(registry) -> bool under the lock, saving the registry if it returns True."""
+    with _registry_locked():
+        data = _read_registry()
+        if mutate(data):
+            # Write-then-rename so readers never see a partial file
+            tmp_path = REGISTRY.with_name(f"{REGISTRY.name}.tmp")
+            tmp_path.write_text(json.dumps(data, indent=2), encoding="utf-8")
+            os.replace(tmp_path, REGISTRY)
 
 def _container_name(model_name):
     return f"tf_{model_name}"
 
 
+# One long-lived gRPC channel per container: model_name -> (channel, stub)
+_grpc_channels = {}
+_grpc_lock = threading.Lock()
+
+
+def get_prediction_stub(model_name: str, grpc_target: str):
+    """
+    Get the PredictionService stub for a model's container, creating its channel on first use.
+    """
+    if grpc is None:
+        raise RuntimeError("gRPC support requires the 'grpcio' and 'tensorflow-serving-api' packages")
+
+    with _grpc_lock:
+        entry = _grpc_channels.get(model_name)
+        if entry is None:
+            channel = grpc.insecure_channel(
+                grpc_target,
+                options=[
+                    ("grpc.max_send_message_length", -1),
+                    ("grpc.max_receive_message_length", -1),
+                ]
+            )
+            entry = (channel, prediction_service_pb2_grpc.PredictionServiceStub(channel))
+            _grpc_channels[model_name] = entry
+            logging.info(f"Opened gRPC channel to {grpc_target} for model: {model_name}")
+        return entry[1]
+
+
+def _close_grpc_channel(model_name: str):
+    with _grpc_lock:
+        entry = _grpc_channels.pop(model_name, None)
+    if entry:
+        entry[0].close()
+        logging.info(f"Closed gRPC channel for model: {model_name}")
+
+
+# Pooled keep-alive HTTP sessions: model_name -> requests.Session
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def _create_session():
+    session = requests.Session()
+    retry = Retry(
+        total=TF_SERVING_MAX_RETRIES,
+        connect=TF_SERVING_MAX_RETRIES,
+        backoff_factor=TF_SERVING_RETRY_BACKOFF,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=frozenset({"GET", "POST"}),  # predictions are idempotent
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=TF_SERVING_POOL_SIZE, max_retries=retry)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_session(model_name: str) -> requests.Session:
+    """
+    Get the pooled keep-alive session for a model's container.
+    Created when the container becomes AVAILABLE, or on first use for reused containers.
+    """
+    with _sessions_lock:
+        session = _sessions.get(model_name)
+        if session is None:
+            session = _sessions[model_name] = _create_session()
+        return session
+
+
+def _close_session(model_name: str):
+    with _sessions_lock:
+        session = _sessions.pop(model_name, None)
+    if session:
+        session.close()
+        logging.info(f"Closed HTTP session for model: {model_name}")
+
+
+def _connection_pools(session):
+    """
+    The urllib3 connection pools of a session, through the pool manager's public
+    mapping interface. Best effort: [] if this urllib3 version does not expose them.
+    """
+    try:
+        pools = session.get_adapter("http://").poolmanager.pools
+        return [pools[key] for key in list(pools.keys()) if key in pools]
+    except Exception as e:
+        logging.debug(f"Connection pool stats unavailable: {e}")
+        return []
+
+
+def get_session_stats():
+    """
+    Connection reuse per container: requests sent, new TCP connections opened,
+    and the share of requests served by an already-open connection.
+    """
+    with _sessions_lock:
+        sessions = dict(_sessions)
+
+    stats = {}
+    for model_name, session in sessions.items():
+        pools = _connection_pools(session)
+        num_requests = sum(getattr(pool, "num_requests", 0) for pool in pools)
+        num_connections = sum(getattr(pool, "num_connections", 0) for pool in pools)
+        reused = max(num_requests - num_connections, 0)
+        stats[model_name] = {
+            "pool_size": TF_SERVING_POOL_SIZE,
+            "requests": num_requests,
+            "new_connections": num_connections,
+            "reused_connections": reused,
+            "hit_rate": round(reused / num_requests, 4) if num_requests else 0.0,
+        }
+    return stats
+
+
 def ensure_container(model_name: str, model_subdir: str, timeout=60):
     """
     Starts a TF Serving container for the given model if not already running.
@@ -41,6 +189,8 @@ def ensure_container(model_name: str, model_subdir: str, timeout=60):
         try:
             c = client.containers.get(info["container_name"])
             if c.status in ("running", "created"):
+                # Entries saved before gRPC support have no grpc_target
+                info.setdefault("grpc_target", f"{info['container_name']}:8500")
                 return info
         except docker.errors.NotFound:
             pass
@@ -75,47 +225,70 @@ def ensure_container(model_name: str, model_subdir: str, timeout=60):
         command=f"--model_base_path={model_base_path} --rest_api_port=8501 --port=8500"
     )
 
-    # Wait until model is available
+    # Wait until model is available; the polling session becomes the model's pool
     status_url = f"http://{container.name}:8501/v1/models/{model_name}"  # use container name
+    session = _create_session()
     deadline = time.time() + timeout
     while time.time() < deadline:
         try:
-            r = requests.get(status_url, timeout=2)
+            r = session.get(status_url, timeout=2)
             if r.ok and "model_version_status" in r.json():
                 states = r.json()["model_version_status"]
                 if any(s.get("state") == "AVAILABLE" for s in states):
                     info = {
                         "container_name": container.name,
                         "serving_url": f"http://{container.name}:8501/v1/models/{model_name}:predict",
+                        "grpc_target": f"{container.name}:8500",
                         "status_url": status_url,
                         "model_name": model_name,
                     }
-                    registry[model_name] = info
-                    _save_registry(registry)
+                    def add(data):
+                        data[model_name] = info
+                        return True
+                    _update_registry(add)
+                    _close_session(model_name)
+                    with _sessions_lock:
+                        _sessions[model_name] = session
                     return info
         except requests.RequestException:
             pass
         time.sleep(1)
 
     # Cleanup if not available in time
+    session.close()
     container.remove(force=True)
     raise RuntimeError(f"TF Serving for '{model_name}' did not become AVAILABLE in {timeout}s.")
 
 
 def stop_container(model_name: str):
     logging.info(f"Attempting to stop tf_serving container: {model_name}")
-    registry = _load_registry()
+    _close_grpc_channel(model_name)
+    _close_session(model_name)
     try:
         c = client.containers.get(_container_name(model_name))
         c.remove(force=True)
     except docker.errors.NotFound:
         pass
-    if model_name in registry:
-        del registry[model_name]
-        _save_registry(registry)
+    removed = False
+    def remove(data):
+        nonlocal removed
+        removed = data.pop(model_name, None) is not None
+        return removed
+    _update_registry(remove)
+    if removed:
         logging.info(f"[-] Removed tf_serving container: {model_name}")
 
 
+def stop_all_containers():
+    """Remove every TF Serving container started by this service."""
+    for container in list_managed_containers():
+        try:
+            container.remove(force=True)
+            logging.info(f"[-] Removed tf_serving container: {container.name}")
+        except Exception as e:
+            logging.error(f"Failed to remove {container.name}: {e}")
+
+
 def list_managed_containers():
     return client.containers.list(
         all=True,
@@ -36,6 +36,35 @@ def make_json_serializable(obj):
         return obj  # assume already serializable
 
 
+def stack_instances(instances, to_array):
+    """
+    Convert each instance to an array with a leading batch axis and concatenate them.
+    Returns the stacked array and the number of rows each instance contributed,
+    so a batched output can be split back per instance with split_rows().
+    """
+    if isinstance(instances, np.ndarray) and instances.ndim >= 1 and len(instances):
+        # Already one array with one instance per row (e.g. a decoded .npy body)
+        first = to_array(instances[0])
+        if first.shape == (1,) + instances.shape[1:]:
+            return np.asarray(instances, dtype=first.dtype), [1] * len(instances)
+
+    arrays = [to_array(instance) for instance in instances]
+    row_counts = [len(array) for array in arrays]
+    return np.concatenate(arrays, axis=0), row_counts
+
+
+def split_rows(batch_output, row_counts):
+    """
+    Split a batched output (array, tensor or list) back into one slice per instance.
+    """
+    parts = []
+    offset = 0
+    for count in row_counts:
+        parts.append(batch_output[offset:offset + count])
+        offset += count
+    return parts
+
+
 
 def wait_until_stable(path, timeout=10, interval=0.5):
     """
@@ -71,6 +100,48 @@ def wait_until_stable(path, timeout=10, interval=0.5):
 
 
 
+def process_memory(pid=None):
+    """
+    Resident and shared memory of this process (or of process pid) in MB (Linux /proc).
+    Shared memory includes file-backed pages, such as memory-mapped models.
+    """
+    try:
+        with open(f"/proc/{pid or 'self'}/statm") as f:
+            _, resident, shared = (int(v) for v in f.read().split()[:3])
+    except OSError:
+        return None
+    page_mb = os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    return {"rss_mb": round(resident * page_mb, 1), "shared_mb": round(shared * page_mb, 1)}
+
+
+def mapped_file_memory(path):
+    """
+    Memory of this process's mappings of one file in MB (Linux /proc/self/smaps):
+    resident pages (page cache, reclaimable), the part also mapped by other processes,
+    and dirty pages (modified copies private to this process).
+    """
+    totals = {"Rss": 0, "Shared_Clean": 0, "Shared_Dirty": 0, "Private_Dirty": 0}
+    path = os.path.realpath(path)
+    in_mapping = False
+    try:
+        with open("/proc/self/smaps") as f:
+            for line in f:
+                fields = line.split()
+                if "-" in fields[0] and ":" not in fields[0]:
+                    # Mapping header: address range, perms, offset, device, inode, [path]
+                    in_mapping = len(fields) >= 6 and fields[5] == path
+                elif in_mapping and fields[0].rstrip(":") in totals:
+                    totals[fields[0].rstrip(":")] += int(fields[1])
+    except OSError:
+        return None
+
+    return {
+        "resident_mb": round(totals["Rss"] / 1024, 1),
+        "shared_mb": round((totals["Shared_Clean"] + totals["Shared_Dirty"]) / 1024, 1),
+        "dirty_mb": round((totals["Shared_Dirty"] + totals["Private_Dirty"]) / 1024, 1)
+    }
+
+
 def find_latest_saved_model_folder(model_root_folder):
     """
     Automatically finds the latest version folder containing a saved_model.pb file.
@@ -0,0 +1,11 @@
+"""
+WSGI entry point for production serving with several worker processes.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Each worker imports this module after forking and initializes itself
+(model discovery, filesystem monitor, shared state sync); see gunicorn.conf.py.
+"""
+from api.rest_api import create_app
+
+app = create_app()